@@ -0,0 +1,162 @@
+"""
+event/api codecs, the old per call helpers vs the cached ones in modules.utils.
+
+    python -m benchmarks.codecs [rounds]
+
+no database needed.
+"""
+
+import json
+import sys
+import time
+import types
+from dataclasses import asdict, fields, is_dataclass
+from datetime import UTC, datetime
+from enum import Enum
+from typing import List, Union, get_args, get_origin
+
+from chat_types.events import AuthorUpdated, MessageCreated
+from chat_types.models import Author as ApiAuthor
+from chat_types.models import Message as ApiMessage
+from chat_types.models import MessageType, Status
+from modules import utils
+from modules.db import Embed, Message, User, UserFlags
+
+
+# the helpers as they were before, kept as the baseline
+def _old_dtoa(cls, data):
+    field_names = {f.name for f in fields(cls)}
+    if "model_dump" in dir(data):
+        data = data.model_dump()
+    for k, v in data.items():
+        if hasattr(cls, k) and isinstance(getattr(cls, k), property):
+            data[k] = getattr(cls, k).fget(data)
+    data = {k: v for k, v in data.items() if k in field_names}
+    return utils.convert_enums_to_strings(utils.convert_dates_to_iso(data))
+
+
+def _old_dataclass_from_dict(klass, data):
+    if data is None:
+        return None
+    origin, args = get_origin(klass), get_args(klass)
+    if origin == list or origin == List:
+        return [_old_dataclass_from_dict(args[0], item) for item in data]
+    if origin == Union or isinstance(klass, types.UnionType):
+        for typ in [arg for arg in args if arg is not type(None)]:
+            try:
+                return _old_dataclass_from_dict(typ, data)
+            except Exception:
+                continue
+        return data
+    if hasattr(klass, "__dataclass_fields__") and isinstance(data, dict):
+        fld_types = {f.name: f.type for f in fields(klass)}
+        return klass(
+            **{
+                k: _old_dataclass_from_dict(fld_types[k], v) if k in fld_types else v
+                for k, v in data.items()
+            }
+        )
+    if isinstance(klass, type) and issubclass(klass, Enum):
+        return data if isinstance(data, klass) else klass(data)
+    return data
+
+
+def _bench(name: str, old, new, rounds: int):
+    assert old() == new(), f"{name}: output differs from the old path"
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        old()
+    old_s = (time.perf_counter() - start) / rounds
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        new()
+    new_s = (time.perf_counter() - start) / rounds
+
+    print(
+        f"  {name:<18} old {old_s * 1e6:8.1f} us   new {new_s * 1e6:8.1f} us"
+        f"   {old_s / new_s:5.1f}x"
+    )
+
+
+def main(rounds: int):
+    now = datetime.now(UTC)
+    user = User.model_construct(
+        id="u1",
+        username="someone",
+        password="x",
+        token="t",
+        email="a@b.c",
+        default_status=Status.ONLINE,
+        status=Status.ONLINE,
+        color="#ffffff",
+        background_color=None,
+        avatar_url=None,
+        bio="hello",
+        created_at=now,
+        updated_at=now,
+        flags=UserFlags(admin=False, webhook=False),
+        verified=True,
+        verification_code=None,
+        bytes=1234,
+    )
+    message = Message.model_construct(
+        id=utils.generate_snowflake(),
+        type=MessageType.DEFAULT,
+        author_id="u1",
+        channel_id="c1",
+        file_ids=[],
+        created_at=now,
+        seq=1,
+        content="hello there",
+        nonce="n",
+        updated_at=None,
+        deleted_at=None,
+        user_embeds=[],
+        system_embeds=[Embed(title="link", url="https://kaj.gg")],
+        mentions=[],
+        author=None,
+    )
+
+    author = utils.dtoa(ApiAuthor, user)
+    event = MessageCreated(message=utils.dtoa(ApiMessage, message), author=author)
+    wire = json.loads(json.dumps(utils.jsonable(event)))
+
+    print(f"{rounds} rounds")
+    _bench(
+        "dtoa(author)",
+        lambda: _old_dtoa(ApiAuthor, user),
+        lambda: utils.dtoa(ApiAuthor, user),
+        rounds,
+    )
+    _bench(
+        "dtoa(message)",
+        lambda: _old_dtoa(ApiMessage, message),
+        lambda: utils.dtoa(ApiMessage, message),
+        rounds,
+    )
+    _bench(
+        "encode event",
+        lambda: utils.convert_enums_to_strings(
+            utils.convert_dates_to_iso(asdict(event))
+        ),
+        lambda: utils.jsonable(event),
+        rounds,
+    )
+    _bench(
+        "decode event",
+        lambda: _old_dataclass_from_dict(MessageCreated, wire),
+        lambda: utils.dataclass_from_dict(MessageCreated, wire),
+        rounds,
+    )
+    _bench(
+        "decode author",
+        lambda: _old_dataclass_from_dict(AuthorUpdated, {"author": author}),
+        lambda: utils.dataclass_from_dict(AuthorUpdated, {"author": author}),
+        rounds,
+    )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
@@ -0,0 +1,106 @@
+"""
+bytes saved vs cpu spent by modules.compression on typical pages.
+
+    python -m benchmarks.compression [rounds]
+
+no database needed. brotli rows only show up with the brotli package installed.
+"""
+
+import asyncio
+import sys
+import time
+from datetime import UTC, datetime
+
+from benchmarks.serializers import _page
+from chat_types.models import Author as ApiAuthor
+from chat_types.models import Channel as ApiChannel
+from chat_types.models import Status
+from modules import compression, jsoncodec, utils
+from modules.serializers import messages_to_json
+
+
+def _channels(count: int) -> bytes:
+    now = datetime.now(UTC)
+    return jsoncodec.dumpb(
+        [
+            utils.dtoa(
+                ApiChannel,
+                {
+                    "id": utils.generate_id(),
+                    "name": f"channel-{i}",
+                    "topic": "where we talk about the thing" if i % 3 else "",
+                    "created_at": now,
+                    "updated_at": now,
+                    "last_message_at": now,
+                    "last_seq": i * 37,
+                    "author_id": "u1",
+                    "private": i % 4 == 0,
+                },
+            )
+            for i in range(count)
+        ]
+    )
+
+
+def _members(count: int) -> bytes:
+    now = datetime.now(UTC)
+    return jsoncodec.dumpb(
+        [
+            utils.dtoa(
+                ApiAuthor,
+                {
+                    "id": utils.generate_id(),
+                    "username": f"member_{i}",
+                    "avatar_url": (
+                        f"https://media.kaj.gg/avatars/{i}" if i % 2 else None
+                    ),
+                    "bio": "hi, i like chatting" if i % 3 == 0 else None,
+                    "created_at": now,
+                    "updated_at": now,
+                    "status": Status.ONLINE if i % 5 else Status.AWAY,
+                    "color": "#bf739e",
+                    "background_color": None,
+                    "bytes": i * 1234,
+                    "flags": {"admin": False, "webhook": False},
+                },
+            )
+            for i in range(count)
+        ]
+    )
+
+
+def _measure(encode, body: bytes, rounds: int) -> tuple[int, float]:
+    compressed = encode(body)
+    start = time.perf_counter()
+    for _ in range(rounds):
+        encode(body)
+    return len(compressed), (time.perf_counter() - start) / rounds
+
+
+async def main(rounds: int):
+    messages, files = _page(100)
+    pages = {
+        "history (100)": await messages_to_json(messages, files_by_id=files),
+        "channels (50)": _channels(50),
+        "members (200)": _members(200),
+    }
+
+    encoders = {f"gzip -{compression.GZIP_LEVEL}": compression.gzip_compress}
+    if compression.brotli is not None:
+        encoders[f"br q{compression.BROTLI_QUALITY}"] = compression.brotli_compress
+
+    print(f"{rounds} rounds, time is per response")
+    for name, body in pages.items():
+        print(f"  {name:<14} {len(body) / 1024:7.1f} KiB raw")
+        for encoding, encode in encoders.items():
+            size, seconds = _measure(encode, body, rounds)
+            print(
+                f"    {encoding:<8} {size / 1024:7.1f} KiB"
+                f"  {100 - size * 100 / len(body):5.1f}% saved"
+                f"  {seconds * 1000:6.3f} ms"
+                f"  {(len(body) - size) / 1024 / (seconds * 1000):7.1f} KiB saved/ms"
+            )
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 200))
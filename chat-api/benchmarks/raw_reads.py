@@ -0,0 +1,125 @@
+"""
+listing reads, beanie documents vs raw projected records (db.find_raw), find plus
+serialize like the endpoints do.
+
+    MONGO_URL=mongodb://localhost:27017 python -m benchmarks.raw_reads [page size] [rounds]
+
+seeds a throwaway database and drops it again after.
+"""
+
+import asyncio
+import sys
+import time
+import tracemalloc
+from datetime import UTC, datetime, timedelta
+from os import getenv
+
+from beanie import init_beanie
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from chat_types.models import Channel as ApiChannel
+from chat_types.models import MessageType
+from modules import db, utils
+from modules.db import Channel, Embed, Message, api_fields, find_raw
+from modules.serializers import MESSAGE_FIELDS, messages_to_api
+
+DATABASE = "raw-reads-benchmark"
+
+
+async def _seed(size: int):
+    now = datetime.now(UTC)
+    await Message.insert_many(
+        [
+            Message(
+                author_id="u1",
+                channel_id="c1",
+                type=MessageType.DEFAULT,
+                seq=i + 1,
+                content=f"message number {i} with a bit of text in it",
+                created_at=now - timedelta(seconds=size - i),
+                mentions=["u2"] if i % 7 == 0 else [],
+                system_embeds=(
+                    [Embed(title="link", url="https://kaj.gg")] if i % 4 == 0 else []
+                ),
+            )
+            for i in range(size)
+        ]
+    )
+    await Channel.insert_many(
+        [Channel(name=f"channel-{i}", topic="t", author_id="u1") for i in range(size)]
+    )
+
+
+async def _measure(fn, rounds: int) -> tuple[float, int]:
+    start = time.perf_counter()
+    for _ in range(rounds):
+        await fn()
+    elapsed = (time.perf_counter() - start) / rounds
+
+    tracemalloc.start()
+    await fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+async def _bench(name: str, old, new, rounds: int):
+    assert await old() == await new(), f"{name}: output differs from the old path"
+
+    old_s, old_peak = await _measure(old, rounds)
+    new_s, new_peak = await _measure(new, rounds)
+    print(
+        f"  {name:<10} old {old_s * 1000:7.2f} ms {old_peak / 1024:7.0f} KiB"
+        f"   new {new_s * 1000:7.2f} ms {new_peak / 1024:7.0f} KiB"
+        f"   {old_s / new_s:4.1f}x"
+    )
+
+
+async def main(size: int, rounds: int):
+    client = AsyncIOMotorClient(getenv("MONGO_URL"))
+    await init_beanie(
+        database=client[DATABASE], document_models=db.DOCUMENT_MODELS, skip_indexes=True
+    )
+    try:
+        await _seed(size)
+        query = {"channel_id": "c1", "deleted_at": None}
+        channel_fields = api_fields(ApiChannel, Channel)
+
+        async def history_documents():
+            return await messages_to_api(
+                await Message.get_history(query, limit=size), files_by_id={}
+            )
+
+        async def history_raw():
+            return await messages_to_api(
+                await Message.get_history(query, limit=size, project=MESSAGE_FIELDS),
+                files_by_id={},
+            )
+
+        async def channels_documents():
+            channels = await Channel.find_all().to_list()
+            return [utils.dtoa(ApiChannel, channel) for channel in channels]
+
+        async def channels_raw():
+            channels = await find_raw(Channel.find_all(), channel_fields)
+            return [utils.dtoa(ApiChannel, channel) for channel in channels]
+
+        print(
+            f"{size} per page, {rounds} rounds (time per request, peak traced memory)"
+        )
+        await _bench("history", history_documents, history_raw, rounds)
+        await _bench("channels", channels_documents, channels_raw, rounds)
+    finally:
+        await client.drop_database(DATABASE)
+        client.close()
+
+
+if __name__ == "__main__":
+    if not getenv("MONGO_URL"):
+        sys.exit("needs a real mongo, set MONGO_URL")
+    asyncio.run(
+        main(
+            int(sys.argv[1]) if len(sys.argv) > 1 else 100,
+            int(sys.argv[2]) if len(sys.argv) > 2 else 50,
+        )
+    )
@@ -0,0 +1,114 @@
+"""
+history page serialization, old per message path vs the batch serializer.
+
+    python -m benchmarks.serializers [page size] [rounds]
+
+no database needed, documents are built with model_construct.
+"""
+
+import asyncio
+import sys
+import time
+from datetime import UTC, datetime, timedelta
+
+from chat_types.models import File as ApiFile
+from chat_types.models import Message as ApiMessage
+from chat_types.models import MessageType, Status
+from modules import utils
+from modules.db import Author, Embed, Message, StoredFile, UserFlags
+from modules.serializers import messages_to_api
+
+
+def _old_message_to_api(message: Message, files_by_id: dict) -> dict:
+    # what message_to_api did before the batch serializer, kept as the baseline
+    d = message.model_dump(exclude={"deleted_at"})
+    d = utils.convert_dates_to_iso(d)
+    embeds = (d.get("user_embeds") or []) + (d.get("system_embeds") or [])
+    files = [
+        utils.dtoa(
+            ApiFile,
+            {
+                "id": files_by_id[fid].id,
+                "name": files_by_id[fid].name,
+                "mime_type": files_by_id[fid].mime_type,
+                "size": files_by_id[fid].size,
+                "url": files_by_id[fid].url,
+            },
+        )
+        for fid in d.get("file_ids") or []
+        if fid in files_by_id
+    ]
+    return utils.dtoa(ApiMessage, {**d, "embeds": embeds, "files": files})
+
+
+def _page(size: int) -> tuple[list[Message], dict[str, StoredFile]]:
+    now = datetime.now(UTC)
+    files = {
+        f"f{i}": StoredFile.model_construct(
+            id=f"f{i}", owner_id="u1", name=f"{i}.png", key=f"k{i}", size=1234
+        )
+        for i in range(size // 10 + 1)
+    }
+    webhook = Author(
+        id="w1",
+        username="hook",
+        created_at=now,
+        updated_at=now,
+        status=Status.ONLINE,
+        flags=UserFlags(webhook=True),
+    )
+
+    messages = []
+    for i in range(size):
+        messages.append(
+            Message.model_construct(
+                id=utils.generate_snowflake(),
+                type=MessageType.DEFAULT,
+                author_id="u1",
+                channel_id="c1",
+                seq=i + 1,
+                content=f"message number {i} with a bit of text in it",
+                created_at=now - timedelta(seconds=size - i),
+                updated_at=now if i % 5 == 0 else None,
+                file_ids=[f"f{i // 10}"] if i % 10 == 0 else [],
+                mentions=["u2"] if i % 7 == 0 else [],
+                user_embeds=[],
+                system_embeds=(
+                    [Embed(title="link", url="https://kaj.gg")] if i % 4 == 0 else []
+                ),
+                author=webhook if i % 20 == 0 else None,
+            )
+        )
+    return messages, files
+
+
+async def main(size: int, rounds: int):
+    messages, files = _page(size)
+
+    old = [_old_message_to_api(m, files) for m in messages]
+    new = await messages_to_api(messages, files_by_id=files)
+    assert old == new, "batch serializer output differs from the old path"
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        [_old_message_to_api(m, files) for m in messages]
+    old_s = (time.perf_counter() - start) / rounds
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        await messages_to_api(messages, files_by_id=files)
+    new_s = (time.perf_counter() - start) / rounds
+
+    print(f"{size} messages, {rounds} rounds")
+    print(f"  old per message: {old_s * 1000:8.3f} ms/page")
+    print(f"  batch:           {new_s * 1000:8.3f} ms/page")
+    print(f"  speedup:         {old_s / new_s:8.1f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(
+        main(
+            int(sys.argv[1]) if len(sys.argv) > 1 else 100,
+            int(sys.argv[2]) if len(sys.argv) > 2 else 200,
+        )
+    )
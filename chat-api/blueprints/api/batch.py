@@ -0,0 +1,23 @@
+from sanic import Blueprint, Request, exceptions, raw
+from modules import batch
+from modules.auth import authorized
+
+bp = Blueprint("batch")
+
+
+@bp.route(batch.BATCH_PATH, methods=["POST"])
+@authorized()
+async def run_batch(request: Request):
+    data = request.json or {}
+    calls = data.get("requests") if isinstance(data, dict) else None
+    if not isinstance(calls, list) or not calls:
+        raise exceptions.BadRequest("requests must be a non-empty list")
+    if len(calls) > batch.BATCH_MAX_REQUESTS:
+        raise exceptions.BadRequest(
+            f"At most {batch.BATCH_MAX_REQUESTS} requests per batch"
+        )
+
+    return raw(
+        await batch.run(request, calls, request.ctx.stored_user),
+        content_type="application/json",
+    )
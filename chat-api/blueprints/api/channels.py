@@ -1,14 +1,17 @@
+from datetime import UTC, datetime
 from chat_types.models import (
     Channel as ApiChannel,
-    Message as ApiMessage,
     MessageType,
     User as ApiUser,
 )
 from sanic import Blueprint, Request, json, exceptions
 from modules.db import Channel, ChannelMember, Message, ChannelInvite
-from modules import utils
+from modules.db import api_fields, find_raw
+from modules import acl, utils
 from modules.auth import authorized
+from modules.etag import CHANNEL_VERSION, conditional_json
 from modules.events import publish_event
+from modules.serializers import message_to_api
 from chat_types.events import (
     ChannelCreated,
     ChannelUpdated,
@@ -22,8 +25,20 @@ bp = Blueprint("channels")
 @bp.route("/v1/channels", methods=["GET"])
 @authorized()
 async def get_channels(request: Request):
-    channels = await Channel.get_user_channels(request.ctx.user.id)
-    return json([utils.dtoa(ApiChannel, channel) for channel in channels])
+    user_id = request.ctx.user.id
+
+    async def load() -> list[dict]:
+        return await acl.get_user_channels(
+            user_id, project=api_fields(ApiChannel, Channel)
+        )
+
+    return await conditional_json(
+        request,
+        ("channels", user_id),
+        load,
+        CHANNEL_VERSION,
+        lambda channels: [utils.dtoa(ApiChannel, channel) for channel in channels],
+    )
 
 
 @bp.route("/v1/channels", methods=["POST"])
@@ -49,6 +64,7 @@ async def create_channel(request: Request):
         user_id=request.ctx.user.id,
     )
     await member.save()
+    await acl.channel_changed(channel.id, request.ctx.user.id)
 
     publish_event(ChannelCreated(channel=utils.dtoa(ApiChannel, channel)))
 
@@ -78,7 +94,9 @@ async def update_channel(request: Request, channel_id: str):
         if key in EDITABLE_FIELDS:
             setattr(channel, key, value)
 
+    channel.updated_at = datetime.now(UTC)
     await channel.save_changes()
+    await acl.channel_changed(channel_id)
 
     publish_event(ChannelUpdated(channel=utils.dtoa(ApiChannel, channel)))
 
@@ -94,7 +112,11 @@ async def delete_channel(request: Request, channel_id: str):
     if not channel:
         raise exceptions.NotFound("Channel not found")
 
+    members = await find_raw(
+        ChannelMember.find(ChannelMember.channel_id == channel_id), ("user_id",)
+    )
     await channel.delete()
+    await acl.channel_changed(channel_id, *{m["user_id"] for m in members})
 
     publish_event(ChannelDeleted(channel_id=channel_id))
 
@@ -114,22 +136,24 @@ async def leave_channel(request: Request, channel_id: str):
     if not member:
         raise exceptions.Forbidden("You are not a member of this channel")
 
-    channel = await Channel.find_one(Channel.id == channel_id)
-    if channel.author_id == request.ctx.user.id:
+    channel = await acl.get_channel(channel_id)
+    if channel and channel.author_id == request.ctx.user.id:
         raise exceptions.Forbidden("You cannot leave your own channel")
 
     await member.delete()
+    await acl.memberships_changed(request.ctx.user.id)
 
     leave_msg = Message(
         type=MessageType.LEAVE,
         author_id=request.ctx.user.id,
         channel_id=channel_id,
+        seq=await Channel.next_seq(channel_id),
     )
     await leave_msg.save()
     await request.ctx.user.fetch_status()
     publish_event(
         MessageCreated(
-            message=utils.dtoa(ApiMessage, leave_msg),
+            message=await message_to_api(leave_msg, files_by_id={}),
             author=utils.dtoa(ApiUser, request.ctx.user),
         )
     )
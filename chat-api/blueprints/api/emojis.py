@@ -2,9 +2,10 @@ import base64
 import binascii
 from sanic import Blueprint, Request, json, exceptions
 from sanic_ext import openapi
-from modules.db import User, Emoji
+from modules.db import User, Emoji, api_fields, find_raw
 from modules import utils
 from modules.auth import authorized
+from modules.etag import EMOJI_VERSION, conditional_json
 from chat_types.models.emoji import Emoji as ApiEmoji
 from modules import r2
 
@@ -93,8 +94,20 @@ async def get_user_emojis(request: Request, user_id: str):
     if not user:
         raise exceptions.NotFound("User not found")
 
-    emojis = await Emoji.find(Emoji.owner_id == user.id).to_list()
-    return json([utils.dtoa(ApiEmoji, emoji) for emoji in emojis])
+    owner_id = user.id
+
+    async def load() -> list[dict]:
+        return await find_raw(
+            Emoji.find(Emoji.owner_id == owner_id), api_fields(ApiEmoji, Emoji)
+        )
+
+    return await conditional_json(
+        request,
+        ("emojis", owner_id),
+        load,
+        EMOJI_VERSION,
+        lambda emojis: [utils.dtoa(ApiEmoji, emoji) for emoji in emojis],
+    )
 
 
 @bp.route("/v1/users/<user_id>/emojis", methods=["POST"])
@@ -111,7 +124,7 @@ async def create_emoji(request: Request, user_id: str):
         data["name"] = data["name"].lower()
 
     if await Emoji.find_one(
-        Emoji.owner_id == request.ctx.user.id and Emoji.name == data.get("name")
+        Emoji.owner_id == request.ctx.user.id, Emoji.name == data.get("name")
     ):
         raise exceptions.BadRequest("Emoji name must be unique")
 
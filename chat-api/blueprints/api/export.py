@@ -0,0 +1,77 @@
+import logging
+import zlib
+from datetime import UTC, datetime
+from os import getenv
+from sanic import Blueprint, Request, exceptions
+from modules.db import Message
+from modules import acl, compression, jsoncodec, utils
+from modules.serializers import MESSAGE_FIELDS, messages_to_api
+from modules.auth import authorized
+
+bp = Blueprint("export")
+
+# messages per cursor batch, and so per files query and per chunk written
+EXPORT_BATCH_SIZE = int(getenv("EXPORT_BATCH_SIZE", "1000"))
+
+
+def _bound(value: str | None, name: str) -> datetime | None:
+    if value is None:
+        return None
+    if utils.is_snowflake(value):
+        return utils.snowflake_time(value)
+    try:
+        bound = datetime.fromisoformat(value)
+    except ValueError:
+        raise exceptions.BadRequest(f"{name} must be an iso date or a message id")
+    return bound if bound.tzinfo else bound.replace(tzinfo=UTC)
+
+
+@bp.route("/v1/channels/<channel_id>/export", methods=["GET"], ctx_streams=True)
+@authorized()
+async def export_channel(request: Request, channel_id: str):
+    """
+    the whole channel (or `since` up to `until`) as ndjson, oldest first, one message
+    per line. `gzip=true` sends a .ndjson.gz instead. it's streamed as it's read, so
+    memory use doesn't grow with the channel
+    """
+    await acl.require_read(channel_id, request.ctx.user.id)
+    since = _bound(request.args.get("since"), "since")
+    until = _bound(request.args.get("until"), "until")
+    gzipped = request.args.get("gzip", "").lower() in ("1", "true")
+
+    filename = f"{channel_id}.ndjson" + (".gz" if gzipped else "")
+    response = await request.respond(
+        content_type="application/gzip" if gzipped else "application/x-ndjson",
+        headers={"content-disposition": f'attachment; filename="{filename}"'},
+    )
+    # wbits 31 is a gzip container, written a batch at a time
+    gzipper = (
+        zlib.compressobj(compression.GZIP_LEVEL, zlib.DEFLATED, 31) if gzipped else None
+    )
+
+    exported = 0
+    try:
+        async for batch in Message.export(
+            channel_id,
+            since=since,
+            until=until,
+            batch_size=EXPORT_BATCH_SIZE,
+            project=MESSAGE_FIELDS,
+        ):
+            # files for the whole batch come back in one query
+            lines = b"".join(
+                jsoncodec.dumpb(message) + b"\n"
+                for message in await messages_to_api(batch)
+            )
+            exported += len(batch)
+            if chunk := gzipper.compress(lines) if gzipper else lines:
+                await response.send(chunk)
+
+        if gzipper:
+            await response.send(gzipper.flush())
+    except Exception as e:
+        # the status is long gone, all we can do is cut the stream short
+        logging.error(f"export of {channel_id} failed after {exported} messages: {e}")
+        raise
+
+    await response.eof()
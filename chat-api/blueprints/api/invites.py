@@ -1,6 +1,5 @@
 from datetime import datetime
 from chat_types.models import (
-    Message as ApiMessage,
     MessageType,
     User as ApiUser,
     ChannelInvite as ApiChannelInvite,
@@ -8,9 +7,13 @@ from chat_types.models import (
 )
 from sanic import Blueprint, Request, json, exceptions
 from modules.db import Channel, ChannelMember, ChannelInvite, Message, User
-from modules import utils
+from modules.db import api_fields, find_raw
+from modules import acl, utils
 from modules.auth import authorized
+from modules.etag import INVITE_VERSION, conditional_json
 from modules.events import publish_event
+from modules.serializers import message_to_api
+from modules.singleflight import shared_json
 from chat_types.events import MessageCreated
 
 bp = Blueprint("invites")
@@ -23,44 +26,57 @@ ERR_AUTHOR_NOT_FOUND = "Author not found"
 @bp.route("/v1/channels/<channel_id>/invites", methods=["GET"])
 @authorized()
 async def get_invites(request: Request, channel_id: str):
-    channel = await Channel.find_one(Channel.id == channel_id)
+    channel = await acl.get_channel(channel_id)
     if not channel:
         raise exceptions.NotFound(ERR_CHANNEL_NOT_FOUND)
 
     if channel.author_id != request.ctx.user.id and not request.ctx.user.flags.admin:
         raise exceptions.Forbidden("You are not the author of this channel")
 
-    invites = await ChannelInvite.find(ChannelInvite.channel_id == channel_id).to_list()
-    return json([utils.dtoa(ApiChannelInvite, invite) for invite in invites])
+    async def load() -> list[dict]:
+        return await find_raw(
+            ChannelInvite.find(ChannelInvite.channel_id == channel_id),
+            api_fields(ApiChannelInvite, ChannelInvite),
+        )
+
+    return await conditional_json(
+        request,
+        ("invites", channel_id),
+        load,
+        INVITE_VERSION,
+        lambda invites: [utils.dtoa(ApiChannelInvite, invite) for invite in invites],
+    )
 
 
 @bp.route("/v1/invites/<code>", methods=["GET"])
 async def get_invite(request: Request, code: str):
-    invite = await ChannelInvite.find_one(ChannelInvite.code == code)
-    if not invite:
-        raise exceptions.NotFound(ERR_INVITE_NOT_FOUND)
+    async def load() -> dict:
+        invite = await ChannelInvite.find_one(ChannelInvite.code == code)
+        if not invite:
+            raise exceptions.NotFound(ERR_INVITE_NOT_FOUND)
 
-    channel = await Channel.find_one(Channel.id == invite.channel_id)
-    if not channel:
-        raise exceptions.NotFound(ERR_CHANNEL_NOT_FOUND)
+        channel = await Channel.find_one(Channel.id == invite.channel_id)
+        if not channel:
+            raise exceptions.NotFound(ERR_CHANNEL_NOT_FOUND)
 
-    author = await User.find_one(User.id == invite.author_id)
-    if not author:
-        raise exceptions.NotFound(ERR_AUTHOR_NOT_FOUND)
+        author = await User.find_one(User.id == invite.author_id)
+        if not author:
+            raise exceptions.NotFound(ERR_AUTHOR_NOT_FOUND)
 
-    return json(
-        {
+        return {
             "invite": utils.dtoa(ApiChannelInvite, invite),
             "channel": utils.dtoa(ApiChannel, channel),
             "author": utils.dtoa(ApiUser, author),
         }
-    )
+
+    # a link posted in a big channel gets previewed by everyone at once
+    return await shared_json(("invite", code), load)
 
 
 @bp.route("/v1/channels/<channel_id>/invites", methods=["POST"])
 @authorized()
 async def create_invite(request: Request, channel_id: str):
-    channel = await Channel.find_one(Channel.id == channel_id)
+    channel = await acl.get_channel(channel_id)
     if not channel:
         raise exceptions.NotFound(ERR_CHANNEL_NOT_FOUND)
 
@@ -117,17 +133,19 @@ async def create_channel_member(request: Request, code: str):
         invite_id=invite.id,
     )
     await member.save()
+    await acl.memberships_changed(request.ctx.user.id)
 
     join_msg = Message(
         type=MessageType.JOIN,
         author_id=request.ctx.user.id,
         channel_id=invite.channel_id,
+        seq=await Channel.next_seq(invite.channel_id),
     )
     await join_msg.save()
     await request.ctx.user.fetch_status()
     publish_event(
         MessageCreated(
-            message=utils.dtoa(ApiMessage, join_msg),
+            message=await message_to_api(join_msg, files_by_id={}),
             author=utils.dtoa(ApiUser, request.ctx.user),
         )
     )
@@ -144,7 +162,7 @@ async def delete_invite(request: Request, channel_id: str, invite_id: str):
     if not invite:
         raise exceptions.NotFound(ERR_INVITE_NOT_FOUND)
 
-    channel = await Channel.find_one(Channel.id == invite.channel_id)
+    channel = await acl.get_channel(invite.channel_id)
     if not channel:
         raise exceptions.NotFound(ERR_CHANNEL_NOT_FOUND)
 
@@ -5,9 +5,10 @@ from chat_types.models import (
     User as ApiUser,
 )
 from sanic import Blueprint, Request, json, exceptions
-from modules.db import Channel, ChannelMember, User, Message
-from modules import utils
+from modules.db import Channel, ChannelMember, User, Message, api_fields, find_raw
+from modules import acl, utils
 from modules.auth import authorized
+from modules.etag import AUTHOR_VERSION, conditional_json
 from beanie.operators import In
 
 bp = Blueprint("members")
@@ -16,18 +17,30 @@ bp = Blueprint("members")
 @bp.route("/v1/channels/<channel_id>/members", methods=["GET"])
 @authorized()
 async def get_channel_members(request: Request, channel_id: str):
-    channel = await Channel.find_one(Channel.id == channel_id)
+    channel = await acl.get_channel(channel_id)
     if not channel:
         raise exceptions.NotFound("Channel not found")
 
     if not channel.private:
         raise exceptions.Forbidden("This channel is not private")
 
-    member_ids = [
-        member.user_id
-        for member in await ChannelMember.find(
-            ChannelMember.channel_id == channel_id
-        ).to_list()
-    ]
-    members = await User.find(In(User.id, member_ids)).to_list()
-    return json([utils.dtoa(ApiAuthor, member) for member in members])
+    async def load() -> list[dict]:
+        member_ids = [
+            member["user_id"]
+            for member in await find_raw(
+                ChannelMember.find(ChannelMember.channel_id == channel_id),
+                ("user_id",),
+            )
+        ]
+        return await find_raw(
+            User.find(In(User.id, member_ids)), api_fields(ApiAuthor, User)
+        )
+
+    # everyone in a busy channel refreshes this at once
+    return await conditional_json(
+        request,
+        ("members", channel_id),
+        load,
+        AUTHOR_VERSION,
+        lambda members: [utils.dtoa(ApiAuthor, member) for member in members],
+    )
@@ -1,4 +1,3 @@
-import asyncio
 from datetime import UTC, datetime
 from chat_types.models import (
     Message as ApiMessage,
@@ -6,15 +5,18 @@ from chat_types.models import (
     Author as ApiAuthor,
     File as ApiFile,
 )
-from sanic import Blueprint, Request, json, exceptions
-from modules.db import Channel, ChannelMember, Message, StoredFile
-from modules import utils
-from modules.serializers import message_to_api, messages_to_api
+from sanic import Blueprint, Request, json, raw, exceptions
+from modules.db import Channel, HistoryCursor, Message, StoredFile
+from modules.db import find_raw
+from modules import acl, history, jobs, jsoncodec, utils
+from modules.serializers import MESSAGE_FIELDS, message_to_api, messages_to_api
+from modules.serializers import messages_to_json
+from modules.singleflight import flights, shared_json
 from modules.auth import authorized
 from modules.events import publish_event
 from chat_types.events import MessageCreated, MessageUpdated, MessageDeleted
 from beanie.operators import In
-from modules.urls import embed_message_content
+from modules.jobs import EmbedMessage
 from modules.mentions import extract_mention_usernames, resolve_mentions_for_channel
 
 bp = Blueprint("messages")
@@ -24,47 +26,64 @@ async def _messages_to_api(messages: list[Message]) -> list[dict]:
     return await messages_to_api(messages)
 
 
-def try_int(value: str) -> int:
+async def _seq_page(messages: list[dict]) -> list[dict]:
+    # deleted messages go out as tombstones, enough for a client to drop its copy
+    for message in messages:
+        if message["deleted_at"] is not None:
+            message.update(
+                content=None, file_ids=[], user_embeds=[], system_embeds=[], mentions=[]
+            )
+    return await _messages_to_api(messages)
+
+
+def try_int(value: str, default: int | None = 50) -> int | None:
     if value is None:
-        return 50
+        return default
     try:
         return int(value)
     except ValueError:
         raise exceptions.BadRequest("Value is not an integer")
 
 
-def try_datetime(value: str) -> datetime:
+async def try_cursor(value: str, channel_id: str) -> HistoryCursor | None:
+    """
+    `before`/`after`/`around` take a message id. iso dates still work so older
+    clients that page by created_at don't break.
+    """
     if value is None:
         return None
+
+    if utils.is_snowflake(value):
+        return HistoryCursor(created_at=utils.snowflake_time(value), id=value)
+
     try:
-        return datetime.fromisoformat(value)
+        created_at = datetime.fromisoformat(value)
     except ValueError:
-        raise exceptions.BadRequest("Value is not a valid ISO date")
+        pass
+    else:
+        if created_at.tzinfo is None:
+            created_at = created_at.replace(tzinfo=UTC)
+        return HistoryCursor(created_at=created_at)
+
+    # legacy cuid, we need its created_at to page past it
+    message = await Message.find_one(
+        Message.id == value, Message.channel_id == channel_id
+    )
+    if not message:
+        raise exceptions.BadRequest("Cursor is not a message id or ISO date")
+    return HistoryCursor(created_at=message.created_at, id=message.id)
 
 
 @bp.route("/v1/channels/<channel_id>/messages", methods=["GET"])
 @authorized()
 async def get_messages(request: Request, channel_id: str):
-    channel: Channel = await Channel.find_one(Channel.id == channel_id)
-    if not channel:
-        raise exceptions.NotFound("Channel not found")
-
-    if (
-        channel.author_id != request.ctx.user.id
-        and channel.private
-        and (
-            await ChannelMember.find_one(
-                ChannelMember.channel_id == channel_id,
-                ChannelMember.user_id == request.ctx.user.id,
-            )
-        )
-        is None
-    ):
-        raise exceptions.Forbidden("You are not a member of this channel")
+    await acl.require_read(channel_id, request.ctx.user.id)
 
     args = request.args
-    after = try_datetime(args.get("after", None))
-    before = try_datetime(args.get("before", None))
+    after = await try_cursor(args.get("after", None), channel_id)
+    before = await try_cursor(args.get("before", None), channel_id)
+    around = await try_cursor(args.get("around", None), channel_id)
+    since_seq = try_int(args.get("since_seq", None), None)
     limit = try_int(args.get("limit", "50"))
     author_id = args.get("author_id", None)
     contains = args.get("contains", None)
@@ -77,24 +96,98 @@ async def get_messages(request: Request, channel_id: str):
         "channel_id": channel_id,
     }
 
-    if after:
-        query["created_at"] = {"$gt": after}
-    if before:
-        query["created_at"] = {"$lt": before}
     if author_id:
         query["author_id"] = author_id
     if contains:
-        query["content"] = {"$regex": contains}
+        # phrase search on the text index, a $regex here scanned the whole channel.
+        # the channel_id equality above is what narrows the index to this channel
+        query["$text"] = {"$search": '"' + contains.replace('"', " ") + '"'}
+
+    # identical concurrent reads share one query and one encode (modules.singleflight)
+    key = (
+        channel_id,
+        limit,
+        *(args.get(name) for name in ("after", "before", "around", "since_seq")),
+        author_id,
+        contains,
+    )
+
+    if since_seq is not None:
+        if before or after or around or author_id or contains:
+            raise exceptions.BadRequest(
+                "since_seq can't be combined with before/after/around/author_id/contains"
+            )
 
-    # paging be like: `before` wants closest older so newest-first is fine,
-    # but `after` wants closest newer so we gotta go oldest-first or it skips a ton.
-    sort_field = -Message.created_at
-    if after and not before:
-        sort_field = Message.created_at
+        # everything after what the client last saw, oldest first, deletions included.
+        # resume from x-seq-watermark, not from the last seq in the page: a seq can be
+        # saved after a later one, the watermark stops short of holes that may fill in
+        async def since() -> tuple[bytes, int]:
+            messages, watermark = await Message.since_seq(
+                channel_id, since_seq, limit=limit, project=MESSAGE_FIELDS
+            )
+            return jsoncodec.dumpb(await _seq_page(messages)), watermark
 
-    messages = await Message.find(query).sort(sort_field).limit(limit).to_list()
+        body, watermark = await flights.do(("since_seq", *key), since)
+        return raw(
+            body,
+            content_type="application/json",
+            headers={"x-seq-watermark": str(watermark)},
+        )
 
-    return json(await _messages_to_api(messages))
+    if not (before or after or around or author_id or contains):
+        # opening a channel, by far the most common read. the newest messages of
+        # channels people are reading are kept serialized in redis (modules.history)
+        if limit <= history.HISTORY_CACHE_SIZE:
+            if (body := await history.get_page(channel_id, limit)) is not None:
+                return raw(body, content_type="application/json")
+
+            async def load(n: int) -> list[dict]:
+                return await _messages_to_api(
+                    await Message.get_history(query, limit=n, project=MESSAGE_FIELDS)
+                )
+
+            async def fill() -> list[dict]:
+                return (await history.fill(channel_id, load))[:limit]
+
+            return await shared_json(("history", *key), fill)
+
+    async def page() -> bytes:
+        if around:
+            if before or after:
+                raise exceptions.BadRequest(
+                    "around can't be combined with before/after"
+                )
+
+            # half the page on each side of the cursor, newest first like a normal page
+            target = []
+            if around.id:
+                target = await find_raw(
+                    Message.find({**query, "_id": around.id}), MESSAGE_FIELDS
+                )
+            older = await Message.get_history(
+                query, before=around, limit=limit // 2, project=MESSAGE_FIELDS
+            )
+            newer = await Message.get_history(
+                query,
+                after=around,
+                limit=limit - len(older) - len(target),
+                project=MESSAGE_FIELDS,
+            )
+            messages = newer[::-1] + target + older
+        else:
+            # paging be like: `before` wants closest older so newest-first is fine,
+            # but `after` wants closest newer so it comes back oldest-first or it skips a ton.
+            # read only, so raw records instead of documents (see db.find_raw)
+            messages = await Message.get_history(
+                query, before=before, after=after, limit=limit, project=MESSAGE_FIELDS
+            )
+
+        # cached fragments joined straight into the body, see serializers.fragments
+        return await messages_to_json(messages)
+
+    return raw(
+        await flights.do(("messages", *key), page), content_type="application/json"
+    )
 
 
 EDITABLE_FIELDS = ["content"]
@@ -103,22 +196,7 @@ EDITABLE_FIELDS = ["content"]
 @bp.route("/v1/channels/<channel_id>/messages", methods=["POST"])
 @authorized()
 async def create_message(request: Request, channel_id: str):
-    channel: Channel = await Channel.find_one(Channel.id == channel_id)
-    if not channel:
-        raise exceptions.NotFound("Channel not found")
-
-    if (
-        channel.author_id != request.ctx.user.id
-        and channel.private
-        and (
-            await ChannelMember.find_one(
-                ChannelMember.channel_id == channel_id,
-                ChannelMember.user_id == request.ctx.user.id,
-            )
-        )
-        is None
-    ):
-        raise exceptions.Forbidden("You are not a member of this channel")
+    channel = await acl.require_read(channel_id, request.ctx.user.id)
 
     data = request.json
     if not data:
@@ -153,6 +231,7 @@ async def create_message(request: Request, channel_id: str):
     message = Message(
         author_id=request.ctx.user.id,
         channel_id=channel_id,
+        seq=await Channel.next_seq(channel_id),
         content=content,
         file_ids=file_ids,
         nonce=nonce,
@@ -162,7 +241,7 @@ async def create_message(request: Request, channel_id: str):
     await message.save()
 
     if not data.get("embeds"):
-        asyncio.create_task(embed_message_content(message))
+        await jobs.enqueue(EmbedMessage(message_id=message.id))
 
     total_bytes = len(content) if content else 0
     for file in files:
@@ -209,7 +288,7 @@ async def update_message(request: Request, channel_id: str, message_id: str):
     if data.get("content"):
         data["content"] = data["content"].strip()  # this is already validated
 
-        channel = await Channel.find_one(Channel.id == channel_id)
+        channel = await acl.get_channel(channel_id)
         if channel:
             usernames = extract_mention_usernames(data["content"])
             message.mentions = (
@@ -230,10 +309,11 @@ async def update_message(request: Request, channel_id: str, message_id: str):
         message.user_embeds = data["embeds"]
 
     message.updated_at = datetime.now(UTC)
+    message.version = utils.generate_id()
     await message.save_changes()
 
     if not data.get("embeds"):
-        asyncio.create_task(embed_message_content(message))
+        await jobs.enqueue(EmbedMessage(message_id=message.id))
 
     await request.ctx.user.fetch_status()
 
@@ -255,6 +335,7 @@ async def delete_message(request: Request, channel_id: str, message_id: str):
         raise exceptions.NotFound("Message not found")
 
     message.deleted_at = datetime.now(UTC)
+    message.version = utils.generate_id()
     await message.save_changes()
 
     if message.content:
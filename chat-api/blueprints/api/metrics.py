@@ -0,0 +1,26 @@
+from sanic import Blueprint, Request, json, exceptions
+from sanic_ext import openapi
+from modules import history, kv
+from modules.coalesce import writes
+from modules.serializers import fragments
+from modules.singleflight import flights
+from modules.utils import internal_auth
+
+bp = Blueprint("metrics")
+
+
+@bp.route("/v1/metrics", methods=["GET"])
+@openapi.exclude()
+async def get_metrics(request: Request):
+    if not internal_auth(request):
+        raise exceptions.Unauthorized("Unauthorized")
+
+    return json(
+        {
+            "publisher": kv.publisher.stats(),
+            "writes": writes.stats(),
+            "history": history.stats(),
+            "fragments": fragments.stats(),
+            "singleflight": flights.stats(),
+        }
+    )
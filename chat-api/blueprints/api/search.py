@@ -0,0 +1,80 @@
+from datetime import UTC, datetime
+from os import getenv
+
+from sanic import Blueprint, Request, json, exceptions
+
+from modules.auth import authorized
+from modules import acl
+from modules.db import Message
+from modules.serializers import MESSAGE_FIELDS, messages_to_api
+
+bp = Blueprint("search")
+
+SEARCH_PAGE_SIZE = int(getenv("SEARCH_PAGE_SIZE", "25"))
+SEARCH_MAX_PAGE_SIZE = 100
+# past this people should narrow the query, deep skips on a text index get slow
+SEARCH_MAX_OFFSET = int(getenv("SEARCH_MAX_OFFSET", "1000"))
+
+
+def _int_arg(value: str | None, name: str, default: int) -> int:
+    if value is None:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise exceptions.BadRequest(f"{name} must be an integer")
+
+
+def _date_arg(value: str | None, name: str) -> datetime | None:
+    if value is None:
+        return None
+    try:
+        date = datetime.fromisoformat(value)
+    except ValueError:
+        raise exceptions.BadRequest(f"{name} must be an ISO date")
+    return date if date.tzinfo else date.replace(tzinfo=UTC)
+
+
+@bp.route("/v1/search", methods=["GET"])
+@authorized()
+async def search_messages(request: Request):
+    """
+    search message content in `channel_id`, one channel at a time so the text index
+    only has to look at that channel. results are ranked best match first. pass back `cursor` for the next page, it's
+    null when there's nothing left.
+    """
+    args = request.args
+    text = (args.get("q") or "").strip()
+    if not text:
+        raise exceptions.BadRequest("q is required")
+    if len(text) > 256:
+        raise exceptions.BadRequest("q must be less than 256 characters")
+
+    limit = _int_arg(args.get("limit"), "limit", SEARCH_PAGE_SIZE)
+    limit = max(1, min(limit, SEARCH_MAX_PAGE_SIZE))
+    offset = max(0, _int_arg(args.get("cursor"), "cursor", 0))
+    if offset > SEARCH_MAX_OFFSET:
+        raise exceptions.BadRequest("Too many results, try a narrower search")
+
+    if not (channel_id := args.get("channel_id")):
+        raise exceptions.BadRequest("channel_id is required")
+    await acl.require_read(channel_id, request.ctx.user.id)
+
+    # one extra so we know if there's another page without counting
+    messages = await Message.search(
+        text,
+        channel_id,
+        author_id=args.get("author_id"),
+        after=_date_arg(args.get("after"), "after"),
+        before=_date_arg(args.get("before"), "before"),
+        offset=offset,
+        limit=limit + 1,
+        project=MESSAGE_FIELDS,
+    )
+
+    return json(
+        {
+            "messages": await messages_to_api(messages[:limit]),
+            "cursor": str(offset + limit) if len(messages) > limit else None,
+        }
+    )
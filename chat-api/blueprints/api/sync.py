@@ -0,0 +1,203 @@
+import asyncio
+from collections import defaultdict
+from datetime import UTC, datetime, timedelta
+from os import getenv
+
+from beanie.operators import In
+from pymongo import ASCENDING, DESCENDING
+from sanic import Blueprint, Request, json, exceptions
+
+from chat_types.models import Author as ApiAuthor, Channel as ApiChannel
+from modules import acl, utils
+from modules.auth import authorized
+from modules.db import Channel, ChannelMember, Message, User, fetch_statuses
+from modules.serializers import messages_to_api
+
+bp = Blueprint("sync")
+
+SYNC_PAGE_SIZE = int(getenv("SYNC_PAGE_SIZE", "200"))
+SYNC_MAX_PAGE_SIZE = 1000
+
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=UTC)
+_MS = timedelta(milliseconds=1)
+
+
+def _ms(dt: datetime) -> int:
+    # mongo hands back naive utc datetimes. integer math, floats drop a ms now and then
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=UTC)
+    return (dt - _EPOCH) // _MS
+
+
+def _int_arg(value: str | None, name: str, default: int | None = None) -> int:
+    if value is None and default is not None:
+        return default
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise exceptions.BadRequest(f"{name} must be an integer")
+
+
+def _cursor_arg(value: str | None) -> tuple[int, str | None]:
+    # a plain ms timestamp (what the gateway calls last_event_ts), or ms:id from a
+    # previous page that stopped partway through a millisecond
+    ms, _, last_id = (value or "").partition(":")
+    return _int_arg(ms, "cursor"), last_id or None
+
+
+def _after(field: str, ms: int, last_id: str | None) -> dict:
+    """
+    filter for changes past the cursor, in (field, -_id) order. ids go down within a
+    ms so the indexes can keep their _id the way history reads want it
+    """
+    at = _EPOCH + ms * _MS
+    if last_id is None:
+        return {field: {"$gt": at}}
+    return {field: {"$gte": at}, "$nor": [{field: at, "_id": {"$gte": last_id}}]}
+
+
+async def _changes(model, query: dict, field: str, cursor, limit: int) -> list:
+    return (
+        await model.find({**query, **_after(field, *cursor)})
+        .sort([(field, ASCENDING), ("_id", DESCENDING)])
+        .limit(limit)
+        .to_list()
+    )
+
+
+@bp.route("/v1/sync", methods=["GET"])
+@authorized()
+async def sync(request: Request):
+    """
+    everything that changed for you since `cursor` (a ms timestamp, same thing the
+    gateway takes as last_event_ts). for clients that slept past the event stream.
+
+    message, member and author changes come back in pages of `limit`, oldest first.
+    keep calling with the returned cursor while has_more is true, then resume the
+    gateway from the last cursor. a message can show up again if it changed again
+    later on, so the newest copy of a message id wins.
+
+    channels and memberships are hard deleted, so `channel_ids` is the full list of
+    channels you can see right now, anything you have that's not in there is gone.
+    people leaving show up as LEAVE messages. authors are the people in channels you
+    joined or made (public channels can be huge), plus whoever wrote the messages on
+    the page.
+    """
+    args = request.args
+    cursor = _cursor_arg(args.get("cursor"))
+    since_ms = cursor[0]
+    limit = _int_arg(args.get("limit"), "limit", SYNC_PAGE_SIZE)
+    limit = max(1, min(limit, SYNC_MAX_PAGE_SIZE))
+
+    # anything that lands after this gets replayed by the gateway when you resume
+    now_ms = _ms(datetime.now(UTC))
+    since = _EPOCH + since_ms * _MS
+    user_id = request.ctx.user.id
+
+    channels, joined, mine = await asyncio.gather(
+        acl.get_user_channels(user_id),
+        ChannelMember.find(
+            ChannelMember.user_id == user_id, ChannelMember.created_at > since
+        ).to_list(),
+        acl.user_channel_ids(user_id),
+    )
+    channel_ids = [channel.id for channel in channels]
+    joined_ids = {member.channel_id for member in joined}
+    in_channels = {"channel_id": {"$in": channel_ids}}
+    people = await ChannelMember.distinct(
+        "user_id", {"channel_id": {"$in": list(mine)}}
+    )
+
+    # every source is read in the same (time, -id) order from the same cursor
+    sources = await asyncio.gather(
+        _changes(
+            Message, {**in_channels, "deleted_at": None}, "created_at", cursor, limit
+        ),
+        _changes(
+            Message, {**in_channels, "deleted_at": None}, "updated_at", cursor, limit
+        ),
+        _changes(Message, in_channels, "deleted_at", cursor, limit),
+        _changes(ChannelMember, in_channels, "created_at", cursor, limit),
+        _changes(User, {"_id": {"$in": people}}, "updated_at", cursor, limit),
+    )
+    kinds = (
+        ("message", "created_at"),
+        ("message", "updated_at"),
+        ("message", "deleted_at"),
+        ("member", "created_at"),
+        ("author", "updated_at"),
+    )
+
+    changes = [
+        (_ms(getattr(doc, field)), doc.id, kind, doc)
+        for (kind, field), docs in zip(kinds, sources)
+        for doc in docs
+    ]
+    changes.sort(key=lambda change: change[1], reverse=True)
+    changes.sort(key=lambda change: change[0])
+
+    # a full source could have more past its last item, and anything after the
+    # limit'th change might sort before those, so the page ends there. everything
+    # sharing the last (ms, id) goes in too, the cursor steps past all of it
+    has_more = any(len(docs) == limit for docs in sources)
+    next_cursor = str(now_ms)
+    if has_more:
+        end = limit
+        while end < len(changes) and changes[end][:2] == changes[limit - 1][:2]:
+            end += 1
+        changes = changes[:end]
+        next_cursor = f"{changes[-1][0]}:{changes[-1][1]}"
+
+    live: dict[str, Message] = {}
+    deleted_by_channel: dict[str, list[str]] = defaultdict(list)
+    members_by_channel: dict[str, list[str]] = defaultdict(list)
+    authors: list[User] = []
+    for _, _, kind, doc in changes:
+        if kind == "member":
+            members_by_channel[doc.channel_id].append(doc.user_id)
+        elif kind == "author":
+            authors.append(doc)
+        elif doc.deleted_at:
+            live.pop(doc.id, None)
+            deleted_by_channel[doc.channel_id].append(doc.id)
+        else:
+            live[doc.id] = doc
+
+    messages_by_channel: dict[str, list[dict]] = defaultdict(list)
+    for message in await messages_to_api(live.values()):
+        messages_by_channel[message["channel_id"]].append(message)
+
+    # people who posted in a public channel without joining it aren't in `people`
+    known = {author.id for author in authors}
+    posters = {m.author_id for m in live.values()} - known
+    if posters:
+        authors += await User.find(In(User.id, list(posters))).to_list()
+
+    await fetch_statuses(authors)
+
+    return json(
+        {
+            "cursor": next_cursor,
+            "has_more": has_more,
+            "channel_ids": channel_ids,
+            "channels": [
+                utils.dtoa(ApiChannel, channel)
+                for channel in channels
+                if channel.id in joined_ids
+                or any(
+                    _ms(t) > since_ms
+                    for t in (
+                        channel.created_at,
+                        channel.updated_at,
+                        channel.last_message_at,
+                    )
+                    if t
+                )
+            ],
+            "members": members_by_channel,
+            "messages": messages_by_channel,
+            "deleted_messages": deleted_by_channel,
+            "authors": [utils.dtoa(ApiAuthor, author) for author in authors],
+        }
+    )
@@ -1,32 +1,25 @@
-from sanic import Blueprint, Request, json, exceptions
-from modules.db import Channel, ChannelMember
+from os import getenv
+from sanic import Blueprint, Request, json
 from modules.auth import authorized
 from modules.events import publish_event
+from modules import acl, kv
 from chat_types.events import TypingStarted
 
 bp = Blueprint("typing")
 
+# clients show the indicator for 10s, so one event per 5s keeps it alive
+TYPING_DEBOUNCE_MS = int(getenv("TYPING_DEBOUNCE_MS", "5000"))
+
 
 @bp.route("/v1/channels/<channel_id>/typing", methods=["POST"])
 @authorized()
 async def start_typing(request: Request, channel_id: str):
-    channel: Channel = await Channel.find_one(Channel.id == channel_id)
-    if not channel:
-        raise exceptions.NotFound("Channel not found")
+    await acl.require_read(channel_id, request.ctx.user.id)
 
-    if (
-        channel.author_id != request.ctx.user.id
-        and channel.private
-        and (
-            await ChannelMember.find_one(
-                ChannelMember.channel_id == channel_id,
-                ChannelMember.user_id == request.ctx.user.id,
-            )
-        )
-        is None
+    if await kv.debounce(
+        f"{getenv('ENV')}-typing:{channel_id}:{request.ctx.user.id}",
+        TYPING_DEBOUNCE_MS,
     ):
-        raise exceptions.Forbidden("You are not a member of this channel")
-
-    publish_event(TypingStarted(channel_id=channel_id, user_id=request.ctx.user.id))
+        publish_event(TypingStarted(channel_id=channel_id, user_id=request.ctx.user.id))
 
     return json({"success": True})
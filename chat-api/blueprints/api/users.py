@@ -1,22 +1,28 @@
 import re
 import base64
 import binascii
+from datetime import UTC, datetime
+from os import getenv
 from sanic import Blueprint, Request, json, exceptions
 from sanic_ext import openapi
-from modules.db import User
+from modules.db import User, fetch_statuses, find_raw
 from modules import utils
-from beanie.operators import Or
+from beanie.operators import In, Or
 import bcrypt
 from chat_types.models.user import User as ApiUser
 from chat_types.models.author import Author as ApiAuthor
 from chat_types.models.status import Status
-from modules.auth import authorized
+from modules.auth import authorized, forget
+from modules.etag import AUTHOR_VERSION, USER_VERSION, conditional_json
 from modules.events import publish_event
+from modules.serializers import AUTHOR_FIELDS, authors_to_json
 from chat_types.events.author_updated import AuthorUpdated
 from modules import r2
 
 bp = Blueprint("users")
 
+USERS_MAX_IDS = int(getenv("USERS_MAX_IDS", "200"))
+
 
 def _split_data_url(base64_data: str) -> tuple[str, str]:
     if not isinstance(base64_data, str):
@@ -55,24 +61,79 @@ async def _put_avatar_image(user: User, base64_data: str) -> None:
     user.avatar_url = f"https://cdn.kaj.gg/avatars/{user.id}"
 
 
-@bp.route("/v1/users/<user_id>", methods=["GET"])
-@authorized()
-async def get_user(request: Request, user_id: str):
-    user = (
-        request.ctx.user
-        if user_id == "@me"
-        else await User.find_one(User.id == user_id)
-    )
+def _user_ids(ids) -> list[str]:
+    if isinstance(ids, str):
+        ids = ids.split(",")
+    if not isinstance(ids, list):
+        raise exceptions.BadRequest("ids must be a list")
 
-    if not user:
-        raise exceptions.NotFound("User not found")
+    # deduped, in the order they were asked for
+    ids = list(dict.fromkeys(str(i).strip() for i in ids if str(i).strip()))
+    if not ids:
+        raise exceptions.BadRequest("ids is required")
+    if len(ids) > USERS_MAX_IDS:
+        raise exceptions.BadRequest(f"At most {USERS_MAX_IDS} ids at once")
+    return ids
 
-    await user.fetch_status()
 
-    if user.id == request.ctx.user.id:
-        return json(utils.dtoa(ApiUser, user))
+@bp.route("/v1/users", methods=["GET", "POST"])
+@authorized()
+async def get_users(request: Request):
+    """
+    many authors at once: GET ?ids=a,b,c or POST {"ids": [...]} for long lists.
+    ids that don't exist are left out
+    """
+    if request.method == "GET":
+        ids = _user_ids(",".join(request.args.getlist("ids", [])))
+    else:
+        data = request.json
+        ids = _user_ids(data.get("ids") if isinstance(data, dict) else None)
+
+    async def load() -> list[dict]:
+        authors = await find_raw(User.find(In(User.id, ids)), AUTHOR_FIELDS)
+        await fetch_statuses(authors)
+        by_id = {author["id"]: author for author in authors}
+        return [by_id[i] for i in ids if i in by_id]
+
+    return await conditional_json(
+        request, ("users", tuple(ids)), load, AUTHOR_VERSION, authors_to_json
+    )
+
 
-    return json(utils.dtoa(ApiAuthor, user))
+@bp.route("/v1/users/<user_id>", methods=["GET"])
+@authorized()
+async def get_user(request: Request, user_id: str):
+    if user_id in ("@me", request.ctx.user.id):
+        me = request.ctx.user
+
+        async def load_me() -> list[User]:
+            await me.fetch_status()
+            return [me]
+
+        return await conditional_json(
+            request,
+            ("me", me.id),
+            load_me,
+            USER_VERSION,
+            lambda users: utils.dtoa(ApiUser, users[0]),
+        )
+
+    async def load() -> list[User]:
+        user = await User.find_one(User.id == user_id)
+        if not user:
+            raise exceptions.NotFound("User not found")
+
+        await user.fetch_status()
+        return [user]
+
+    # the public profile is the same for everyone asking
+    return await conditional_json(
+        request,
+        ("user", user_id),
+        load,
+        AUTHOR_VERSION,
+        lambda users: utils.dtoa(ApiAuthor, users[0]),
+    )
 
 
 EDITABLE_FIELDS = [
@@ -110,7 +171,9 @@ async def update_user(request: Request, user_id: str):
     if after_bytes != before_bytes:
         user.inc_bytes(after_bytes - before_bytes)
 
+    user.updated_at = datetime.now(UTC)
     await user.save_changes()
+    await forget(user.token)
 
     await user.fetch_status()
 
@@ -136,7 +199,9 @@ async def upload_avatar(request: Request, user_id: str):
         raise exceptions.BadRequest("Image is required")
 
     await _put_avatar_image(user, image)
+    user.updated_at = datetime.now(UTC)
     await user.save_changes()
+    await forget(user.token)
     await user.fetch_status()
 
     publish_event(AuthorUpdated(author=utils.dtoa(ApiAuthor, user)))
@@ -153,7 +218,9 @@ async def delete_avatar(request: Request, user_id: str):
 
     # wipe db first so ui updates even if r2 delete fails
     user.avatar_url = None
+    user.updated_at = datetime.now(UTC)
     await user.save_changes()
+    await forget(user.token)
     await user.fetch_status()
 
     try:
@@ -4,7 +4,7 @@ from sanic import Blueprint, Request, json, exceptions
 from sanic_ext import openapi
 from modules.db import Author, Channel, Message, User, UserFlags, Webhook
 from modules.mentions import extract_mention_usernames, resolve_mentions_for_channel
-from modules import utils
+from modules import acl, utils
 from modules.auth import authorized
 from chat_types.models.webhook import Webhook as ApiWebhook
 from chat_types.models.status import Status
@@ -229,7 +229,7 @@ async def receive_webhook(
     if not await Message.validate_dict(data):
         raise exceptions.BadRequest("Invalid request")
 
-    channel = await Channel.find_one(Channel.id == channel_id)
+    channel = await acl.get_channel(channel_id)
     if not channel:
         raise exceptions.NotFound("Channel not found")
 
@@ -259,6 +259,7 @@ async def receive_webhook(
     message = Message(
         author_id=webhook.id,
         channel_id=channel_id,
+        seq=await Channel.next_seq(channel_id),
         content=data.get("content"),
         user_embeds=data.get("embeds", []),
         mentions=mentions,
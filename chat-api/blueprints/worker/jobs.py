@@ -0,0 +1,59 @@
+from os import getenv
+
+from sanic import Blueprint, Request, json, exceptions
+from sanic_ext import openapi
+
+from modules import kv
+from modules.db import Message
+from modules.jobs import EmbedMessage, JobWorker, SendVerificationEmail
+from modules.resend import send_verification_email
+from modules.urls import embed_message_content
+from modules.utils import internal_auth
+
+bp = Blueprint("jobs")
+
+
+async def embed_message(job: EmbedMessage):
+    message = await Message.get(job.message_id)
+    if message is None or message.deleted_at:
+        return
+    await embed_message_content(message)
+
+
+async def send_verification(job: SendVerificationEmail):
+    await send_verification_email(job.email, job.code)
+
+
+worker = JobWorker(
+    {
+        EmbedMessage: embed_message,
+        SendVerificationEmail: send_verification,
+    },
+    concurrency=int(getenv("JOB_CONCURRENCY", "16")),
+    retry_after_ms=int(getenv("JOB_RETRY_AFTER_MS", "60000")),
+    max_attempts=int(getenv("JOB_MAX_ATTEMPTS", "5")),
+)
+
+
+@bp.after_server_start
+async def start_worker(app, loop):
+    await worker.start()
+
+
+@bp.before_server_stop
+async def stop_worker(app, loop):
+    await worker.stop()
+
+
+@bp.route("/v1/metrics", methods=["GET"])
+@openapi.exclude()
+async def get_metrics(request: Request):
+    if not internal_auth(request):
+        raise exceptions.Unauthorized("Unauthorized")
+
+    return json(
+        {
+            "jobs": worker.stats(),
+            "publisher": kv.publisher.stats(),
+        }
+    )
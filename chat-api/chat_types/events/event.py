@@ -6,7 +6,8 @@ from .channel_updated import ChannelUpdated
 from .message_created import MessageCreated
 from .message_deleted import MessageDeleted
 from .message_updated import MessageUpdated
+from .resync_required import ResyncRequired
 from .typing_started import TypingStarted
 
 
-Event = {"t": EventType.AUTHOR_UPDATED, "d": AuthorUpdated} | {"t": EventType.CHANNEL_CREATED, "d": ChannelCreated} | {"t": EventType.CHANNEL_DELETED, "d": ChannelDeleted} | {"t": EventType.CHANNEL_UPDATED, "d": ChannelUpdated} | {"t": EventType.MESSAGE_CREATED, "d": MessageCreated} | {"t": EventType.MESSAGE_DELETED, "d": MessageDeleted} | {"t": EventType.MESSAGE_UPDATED, "d": MessageUpdated} | {"t": EventType.TYPING_STARTED, "d": TypingStarted}
+Event = {"t": EventType.AUTHOR_UPDATED, "d": AuthorUpdated} | {"t": EventType.CHANNEL_CREATED, "d": ChannelCreated} | {"t": EventType.CHANNEL_DELETED, "d": ChannelDeleted} | {"t": EventType.CHANNEL_UPDATED, "d": ChannelUpdated} | {"t": EventType.MESSAGE_CREATED, "d": MessageCreated} | {"t": EventType.MESSAGE_DELETED, "d": MessageDeleted} | {"t": EventType.MESSAGE_UPDATED, "d": MessageUpdated} | {"t": EventType.RESYNC_REQUIRED, "d": ResyncRequired} | {"t": EventType.TYPING_STARTED, "d": TypingStarted}
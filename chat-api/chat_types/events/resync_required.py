@@ -0,0 +1,7 @@
+from dataclasses import dataclass
+
+
+@dataclass
+class ResyncRequired:
+    # Timestamp of the oldest event the gateway can still replay
+    oldest_event_ts: str | None = None
@@ -6,23 +6,28 @@ from dotenv import load_dotenv
 from sanic import Sanic
 
 import logging
-from modules import db, kv, events
+from modules import acl, auth, compression, db, kv, events, jsoncodec
+from modules.coalesce import writes
 
 load_dotenv()
 
 logging.basicConfig(level=logging.INFO, format="%(name)s - %(levelname)s - %(message)s")
 
 ENVIRONMENT = getenv("ENV", "staging")
-MODE = getenv("MODE", "api")  # api or gateway
+MODE = getenv("MODE", "api")  # api, gateway or worker
 DEBUG = getenv("DEBUG", None) not in (None, "False", "0")
 
-app = Sanic("app")
+app = Sanic("app", dumps=jsoncodec.dumps, loads=jsoncodec.loads)
 app.config["REQUEST_MAX_SIZE"] = (1024**3) * 5  # 5GB
 app.config.CORS_ORIGINS = "*"
+# so browser clients can read it and send it back as If-None-Match
+app.config.CORS_EXPOSE_HEADERS = "etag, x-seq-watermark"
 app.config.FALLBACK_ERROR_FORMAT = "json"
 app.config.API_HOST = f"kaj.gg/{MODE.lower()}"
 app.config.API_SCHEMES = ["https"]
 
+app.on_response(compression.compress_response)
+
 
 @app.after_server_start
 async def attach_db(app, loop):
@@ -30,11 +35,20 @@ async def attach_db(app, loop):
 
     await db.init()
     await kv.init()
+    auth.init()
+    acl.init()
 
     if MODE == "gateway":
         events.init()
 
 
+@app.before_server_stop
+async def flush_pending(app, loop):
+    # don't drop whatever is still sitting in the publish buffer
+    await kv.publisher.flush()
+    await writes.flush()
+
+
 # Compute the real filesystem path to the desired blueprints dir
 blueprints_dir = os.path.join(os.path.dirname(__file__), "blueprints", MODE)
 if not os.path.isdir(blueprints_dir):
@@ -0,0 +1,293 @@
+"""
+who can read which channel, without asking mongo every time.
+
+three kinds of entries, kept in process and in redis:
+    channel:<id>  who made it and whether it's private (a hash)
+    public        ids of every public channel (a set)
+    user:<id>     ids of every channel the user joined or made (a set)
+
+a user can read a channel that's public or in their set, and sees public | their set.
+writes call channel_changed / memberships_changed, which delete the redis keys and
+tell every node to drop its copy.
+
+every key also has an epoch in redis, bumped by those deletes. a fill remembers the
+epoch it read before going to mongo and only writes if it's still the same, so a
+fill that read mongo before a change can't put the old value back after it.
+"""
+
+import asyncio
+import logging
+from dataclasses import dataclass
+from os import getenv
+from typing import Any, Awaitable, Callable, Iterable, Optional
+
+from beanie.operators import In
+from sanic import exceptions
+
+from modules import kv
+from modules.cache import MISSING, TTLCache
+from modules.db import Channel, ChannelMember, find_raw
+
+# every api + gateway node listens here and drops the keys it's sent
+INVALIDATE_CHANNEL = "acl-invalidate"
+
+ACL_REDIS_TTL_SEC = int(getenv("ACL_REDIS_TTL_SEC", "600"))
+
+_local = TTLCache(
+    maxsize=int(getenv("ACL_CACHE_SIZE", "100000")),
+    ttl=float(getenv("ACL_CACHE_TTL_SEC", "60")),
+)
+
+# bumped on every invalidation, a lookup that raced one doesn't get cached
+_generation = 0
+
+# redis can't store an empty set, this member marks "loaded, nothing in it"
+_LOADED = ""
+
+# KEYS: entry, its epoch. ARGV: epoch the fill started at, ttl, command, its args.
+# chunked, lua can only unpack so many arguments at once
+_FILL = """
+if (redis.call('GET', KEYS[2]) or '') ~= ARGV[1] then
+    return 0
+end
+for i = 4, #ARGV, 1000 do
+    redis.call(ARGV[3], KEYS[1], unpack(ARGV, i, math.min(i + 999, #ARGV)))
+end
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return 1
+"""
+_scripts = {}
+
+
+@dataclass(frozen=True)
+class ChannelAccess:
+    id: str
+    author_id: str
+    private: bool
+
+
+def _redis_key(key: str) -> str:
+    return f"{getenv('ENV')}-acl:{key}"
+
+
+def _epoch_key(key: str) -> str:
+    return f"{getenv('ENV')}-acl-epoch:{key}"
+
+
+async def _redis_read(key: str, command: str) -> tuple[Any, Optional[str]]:
+    """
+    the entry (read with `command`) and the epoch to fill it at. no epoch when redis
+    is down, there's no point writing then
+    """
+    try:
+        pipe = kv.get_client().pipeline(transaction=True)
+        getattr(pipe, command)(_redis_key(key))
+        pipe.get(_epoch_key(key))
+        value, epoch = await pipe.execute()
+        return value, (epoch or b"").decode("utf-8")
+    except Exception as e:
+        logging.error(f"acl cache read failed: {e}")
+        return None, None
+
+
+async def _redis_fill(key: str, epoch: Optional[str], command: str, *args):
+    if epoch is None:
+        return
+    client = kv.get_client()
+    if _FILL not in _scripts:
+        _scripts[_FILL] = client.register_script(_FILL)
+    try:
+        await _scripts[_FILL](
+            keys=[_redis_key(key), _epoch_key(key)],
+            args=[epoch, ACL_REDIS_TTL_SEC, command, *args],
+            client=client,
+        )
+    except Exception as e:
+        logging.error(f"acl cache write failed: {e}")
+
+
+async def _cached(key: str, fetch: Callable[[], Awaitable[Any]]) -> Any:
+    if (value := _local.get(key)) is not MISSING:
+        return value
+
+    generation = _generation
+    value = await fetch()
+    if generation == _generation:
+        _local.set(key, value)
+    return value
+
+
+async def _load_set(key: str, load: Callable[[], Awaitable[list[str]]]) -> frozenset:
+    members, epoch = await _redis_read(key, "smembers")
+    if members:
+        return frozenset(m.decode("utf-8") for m in members) - {_LOADED}
+
+    ids = frozenset(await load())
+    await _redis_fill(key, epoch, "SADD", _LOADED, *ids)
+    return ids
+
+
+async def get_channel(channel_id: str) -> Optional[ChannelAccess]:
+    """
+    just enough of a channel to check access, None if there's no such channel
+    """
+
+    key = f"channel:{channel_id}"
+
+    async def fetch() -> Optional[ChannelAccess]:
+        stored, epoch = await _redis_read(key, "hgetall")
+        if stored:
+            return ChannelAccess(
+                id=channel_id,
+                author_id=stored[b"author_id"].decode("utf-8"),
+                private=stored[b"private"] == b"1",
+            )
+
+        stored = await Channel.get_pymongo_collection().find_one(
+            {"_id": channel_id}, {"author_id": 1, "private": 1}
+        )
+        if not stored:
+            # only kept in process, so a wrong id can't fill up redis
+            return None
+
+        channel = ChannelAccess(
+            id=channel_id,
+            author_id=stored["author_id"],
+            private=bool(stored.get("private")),
+        )
+        await _redis_fill(
+            key,
+            epoch,
+            "HSET",
+            "author_id",
+            channel.author_id,
+            "private",
+            "1" if channel.private else "0",
+        )
+        return channel
+
+    return await _cached(key, fetch)
+
+
+async def public_channel_ids() -> frozenset:
+    async def load() -> list[str]:
+        channels = await find_raw(Channel.find(Channel.private == False), ("id",))
+        return [channel["id"] for channel in channels]
+
+    return await _cached("public", lambda: _load_set("public", load))
+
+
+async def user_channel_ids(user_id: str) -> frozenset:
+    """
+    every channel the user joined or made, public or not
+    """
+
+    async def load() -> list[str]:
+        memberships, authored = await asyncio.gather(
+            find_raw(
+                ChannelMember.find(ChannelMember.user_id == user_id), ("channel_id",)
+            ),
+            find_raw(Channel.find(Channel.author_id == user_id), ("id",)),
+        )
+        return [m["channel_id"] for m in memberships] + [c["id"] for c in authored]
+
+    key = f"user:{user_id}"
+    return await _cached(key, lambda: _load_set(key, load))
+
+
+async def _readable(channel: ChannelAccess, user_id: str) -> bool:
+    if not channel.private or channel.author_id == user_id:
+        return True
+    return channel.id in await user_channel_ids(user_id)
+
+
+async def can_read(channel_id: str, user_id: str) -> Optional[bool]:
+    """
+    True/False, or None when the channel doesn't exist
+    """
+    channel = await get_channel(channel_id)
+    if channel is None:
+        return None
+    return await _readable(channel, user_id)
+
+
+async def require_read(channel_id: str, user_id: str) -> ChannelAccess:
+    """
+    the channel, or the 404/403 a route should send
+    """
+    channel = await get_channel(channel_id)
+    if channel is None:
+        raise exceptions.NotFound("Channel not found")
+    if not await _readable(channel, user_id):
+        raise exceptions.Forbidden("You are not a member of this channel")
+    return channel
+
+
+async def visible_channel_ids(user_id: str) -> set[str]:
+    public, joined = await asyncio.gather(
+        public_channel_ids(), user_channel_ids(user_id)
+    )
+    return set(public | joined)
+
+
+async def get_user_channels(
+    user_id: str, project: Optional[Iterable[str]] = None
+) -> list[Channel] | list[dict]:
+    """
+    every channel the user can read, fresh from mongo (last_seq and friends change
+    all the time) but by _id instead of working out which ones first. with `project`
+    they come back as raw records with just those fields (see find_raw)
+    """
+    found = Channel.find(In(Channel.id, list(await visible_channel_ids(user_id))))
+    if project is not None:
+        return await find_raw(found, project)
+    return await found.to_list()
+
+
+def _drop(key: str):
+    global _generation
+    _generation += 1
+    _local.pop(key)
+
+
+async def _forget(*keys: str):
+    for key in keys:
+        _drop(key)
+    try:
+        client = kv.get_client()
+        # bumping the epoch with the delete stops fills that read mongo before this
+        pipe = client.pipeline(transaction=True)
+        for key in keys:
+            pipe.incr(_epoch_key(key))
+            pipe.expire(_epoch_key(key), ACL_REDIS_TTL_SEC)
+            pipe.delete(_redis_key(key))
+        await pipe.execute()
+        pipe = client.pipeline(transaction=False)
+        for key in keys:
+            pipe.publish(INVALIDATE_CHANNEL, key)
+        await pipe.execute()
+    except Exception as e:
+        logging.error(f"failed to invalidate acl cache: {e}")
+
+
+async def channel_changed(channel_id: str, *user_ids: str):
+    """
+    call after a channel is created, updated or deleted. pass its author when
+    creating it and its members when deleting it
+    """
+    await _forget(
+        f"channel:{channel_id}", "public", *[f"user:{user_id}" for user_id in user_ids]
+    )
+
+
+async def memberships_changed(*user_ids: str):
+    """
+    call after users join or leave a channel
+    """
+    await _forget(*[f"user:{user_id}" for user_id in user_ids])
+
+
+def init():
+    asyncio.create_task(
+        kv.invalidation_listener(INVALIDATE_CHANNEL, _drop, _local.clear)
+    )
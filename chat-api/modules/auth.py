@@ -1,9 +1,93 @@
+import asyncio
+import hashlib
+import logging
+from os import getenv
+
+from beanie.odm.utils.parsing import parse_obj
 from modules.db import User
+from modules.cache import TTLCache, MISSING
+from modules import jsoncodec, kv
 from sanic import Request, exceptions
 from functools import wraps
 
+# every api + gateway node listens here and drops the token hashes it's sent
+INVALIDATE_CHANNEL = "auth-invalidate"
 
-async def authenticate(request: Request, override_token: str = None) -> User | None:
+# shared tier so a cold node doesn't hit mongo either. 0 turns it off. it holds the
+# whole stored user (password hash included) so only use it on a private redis
+AUTH_REDIS_TTL_SEC = int(getenv("AUTH_REDIS_TTL_SEC", "0"))
+
+# sha256(token) -> the user document as it's stored. each request parses its own User
+# out of it, so handlers can still change it and save_changes like before
+_users = TTLCache(
+    maxsize=int(getenv("AUTH_CACHE_SIZE", "50000")),
+    ttl=float(getenv("AUTH_CACHE_TTL_SEC", "60")),
+)
+
+# bumped on every invalidation, a lookup that raced one doesn't get cached
+_generation = 0
+
+
+def _token_key(token: str) -> str:
+    # the token itself never goes in a cache key or over pub/sub
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def _redis_key(key: str) -> str:
+    return f"{getenv('ENV')}-auth:{key}"
+
+
+async def _load(key: str, token: str) -> dict | None:
+    if AUTH_REDIS_TTL_SEC:
+        try:
+            if cached := await kv.get_client().get(_redis_key(key)):
+                return jsoncodec.loads(cached)
+        except Exception as e:
+            logging.error(f"auth cache read failed: {e}")
+
+    stored = await User.get_pymongo_collection().find_one({"token": token})
+
+    if stored and AUTH_REDIS_TTL_SEC:
+        try:
+            await kv.get_client().set(
+                _redis_key(key), jsoncodec.dumps(stored), ex=AUTH_REDIS_TTL_SEC
+            )
+        except Exception as e:
+            logging.error(f"auth cache write failed: {e}")
+    return stored
+
+
+def _drop(key: str):
+    global _generation
+    _generation += 1
+    _users.pop(key)
+
+
+async def forget(token: str):
+    """
+    drop a token's cached user on every node. call it after changing a user, and
+    with the old token when one is replaced
+    """
+    key = _token_key(token)
+    _drop(key)
+    try:
+        if AUTH_REDIS_TTL_SEC:
+            await kv.get_client().delete(_redis_key(key))
+        await kv.get_client().publish(INVALIDATE_CHANNEL, key)
+    except Exception as e:
+        logging.error(f"failed to invalidate cached auth: {e}")
+
+
+def init():
+    asyncio.create_task(
+        kv.invalidation_listener(INVALIDATE_CHANNEL, _drop, _users.clear)
+    )
+
+
+async def lookup(request: Request, override_token: str = None) -> dict | None:
+    """
+    the stored user document the request's token belongs to, unparsed
+    """
     tok = (
         override_token
         or request.headers.get("Authorization")
@@ -17,18 +101,37 @@ async def authenticate(request: Request, override_token: str = None) -> User | N
         # we arent initialized yet
         return None
 
-    user = await User.find_one(User.token == tok)
-    return user
+    key = _token_key(tok)
+    if (stored := _users.get(key)) is MISSING:
+        generation = _generation
+        # misses aren't cached, random tokens shouldn't be able to fill the cache
+        if not (stored := await _load(key, tok)):
+            return None
+        if generation == _generation:
+            _users.set(key, stored)
+
+    return stored
+
+
+async def authenticate(request: Request, override_token: str = None) -> User | None:
+    if not (stored := await lookup(request, override_token)):
+        return None
+    return parse_obj(User, stored)
 
 
 def authorized():
     def decorator(f):
         @wraps(f)
         async def decorated_function(request: Request, *args, **kwargs):
-            if not (user := await authenticate(request)):
+            # calls inside a /v1/batch come with the batch's lookup, see modules.batch
+            if (stored := getattr(request.ctx, "stored_user", None)) is None:
+                stored = await lookup(request)
+            if not stored:
                 raise exceptions.Unauthorized("Unauthorized")
 
-            request.ctx.user = user
+            request.ctx.stored_user = stored
+            # every request gets its own User, handlers change and save it
+            request.ctx.user = parse_obj(User, stored)
 
             return await f(request, *args, **kwargs)
 
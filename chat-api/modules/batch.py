@@ -0,0 +1,148 @@
+"""
+many api calls in one request, for POST /v1/batch. a client starting up wants its
+channels, members, emojis, users and the first history page of every channel, dozens
+of requests that each pay for a round trip and a token lookup. in a batch the token is
+looked up once, every call is routed to the same handler it'd hit on its own, and they
+run concurrently (BATCH_CONCURRENCY at a time per batch). each call gets its own
+status, headers and body back, in the order they were sent.
+
+calls run at the same time, so nothing is ordered between them. a write and a read
+that depends on it don't belong in the same batch.
+"""
+
+import asyncio
+import logging
+from inspect import isawaitable
+from os import getenv
+from typing import Any
+
+from sanic import HTTPResponse, Request, exceptions
+from sanic.compat import Header
+from sanic.helpers import STATUS_CODES
+
+from modules import jsoncodec
+
+BATCH_MAX_REQUESTS = int(getenv("BATCH_MAX_REQUESTS", "50"))
+BATCH_CONCURRENCY = int(getenv("BATCH_CONCURRENCY", "8"))
+
+METHODS = ("GET", "POST", "PUT", "PATCH", "DELETE")
+BATCH_PATH = "/v1/batch"
+
+# whatever a call could need from the batch itself. auth is always the batch's
+_INHERITED_HEADERS = ("host", "user-agent", "x-forwarded-for", "x-real-ip")
+
+
+def _error(status: int, message: str) -> tuple[int, dict, bytes]:
+    # same shape as sanic's own json errors
+    description = STATUS_CODES.get(status, b"Error").decode("latin-1")
+    body = {"description": description, "status": status, "message": message}
+    return status, {}, jsoncodec.dumpb(body)
+
+
+def _sub_request(request: Request, call: Any) -> Request:
+    if not isinstance(call, dict):
+        raise exceptions.BadRequest("Each request must be an object")
+
+    method = str(call.get("method") or "GET").upper()
+    path = call.get("path")
+    if method not in METHODS:
+        raise exceptions.BadRequest(f"Unsupported method {method}")
+    if not isinstance(path, str) or not path.startswith("/v1/"):
+        raise exceptions.BadRequest("Path must start with /v1/")
+    if path.split("?", 1)[0].rstrip("/") == BATCH_PATH:
+        raise exceptions.BadRequest("Batches can't be nested")
+
+    headers = {
+        name: value
+        for name in _INHERITED_HEADERS
+        if (value := request.headers.get(name)) is not None
+    }
+    extra = call.get("headers") or {}
+    if not isinstance(extra, dict):
+        raise exceptions.BadRequest("Headers must be an object")
+    for name, value in extra.items():
+        if str(name).lower() not in ("authorization", "host", "content-length"):
+            headers[str(name)] = str(value)
+    if request.headers.get("authorization"):
+        headers["authorization"] = request.headers["authorization"]
+
+    body = b""
+    if call.get("body") is not None:
+        body = jsoncodec.dumpb(call["body"])
+        headers["content-type"] = "application/json"
+    headers["content-length"] = str(len(body))
+
+    sub = Request(
+        path.encode("utf-8"),
+        Header(headers),
+        request.version,
+        method,
+        request.transport,
+        request.app,
+    )
+    sub.body = body
+    sub.conn_info = request.conn_info
+    return sub
+
+
+async def _call(
+    request: Request, stored_user: dict, call: Any
+) -> tuple[int, dict, bytes]:
+    try:
+        sub = _sub_request(request, call)
+        route, handler, params = request.app.router.get(
+            sub.path, sub.method, sub.headers.getone("host", None)
+        )
+        # routes that write their own response as they go mark themselves ctx_streams
+        streams = getattr(route.ctx, "streams", False)
+        if streams or hasattr(handler, "is_stream") or hasattr(handler, "is_websocket"):
+            raise exceptions.BadRequest("Streaming routes can't be batched")
+
+        sub._match_info = {**params}
+        sub.route = route
+        sub.ctx.stored_user = stored_user
+
+        response = handler(sub, **params)
+        if isawaitable(response):
+            response = await response
+        if not isinstance(response, HTTPResponse):
+            raise exceptions.BadRequest("Streaming routes can't be batched")
+    except exceptions.SanicException as e:
+        return _error(e.status_code, str(e))
+    except Exception:
+        logging.exception(f"batched {call!r} failed")
+        return _error(
+            500,
+            "The application encountered an unexpected error and could not continue.",
+        )
+
+    headers = {
+        name.lower(): value
+        for name, value in response.headers.items()
+        if name.lower() not in ("content-type", "content-length")
+    }
+    body = response.body or b""
+    if body and not (response.content_type or "").startswith("application/json"):
+        body = jsoncodec.dumpb(body.decode("utf-8", "replace"))
+    return response.status, headers, body
+
+
+def _encode(status: int, headers: dict, body: bytes) -> bytes:
+    # bodies are json already, spliced in as is instead of decoded and dumped again
+    head = jsoncodec.dumpb({"status": status, "headers": headers})
+    return head[:-1] + b',"body":' + (body or b"null") + b"}"
+
+
+async def run(request: Request, calls: list, stored_user: dict) -> bytes:
+    """
+    run every call in `calls` as `stored_user` and encode the results as
+    {"responses": [{"status", "headers", "body"}, ...]}
+    """
+    gate = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def limited(call: Any) -> bytes:
+        async with gate:
+            return _encode(*await _call(request, stored_user, call))
+
+    encoded = await asyncio.gather(*(limited(call) for call in calls))
+    return b'{"responses":[' + b",".join(encoded) + b"]}"
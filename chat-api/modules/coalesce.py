@@ -0,0 +1,165 @@
+import asyncio
+import logging
+import time
+from collections import defaultdict
+from os import getenv
+from typing import Any
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+
+class WriteCoalescer:
+    """
+    write-behind for hot counters. updates are merged in memory per document ($inc
+    amounts summed, $max values maxed) and written every `interval_ms` as one
+    unordered bulk_write per collection, so a busy channel costs one write per
+    interval instead of one per message.
+
+    anything still pending is lost if the process dies without flushing, so only use
+    it for values that can stand that (counters and "last seen" timestamps). an
+    update mongo keeps rejecting is dropped after `max_retries` flushes, and so are
+    $incs from a flush that failed without saying what landed.
+    """
+
+    def __init__(self, *, interval_ms: int, max_pending: int, max_retries: int = 3):
+        self.interval_ms = interval_ms
+        self.max_pending = max_pending
+        self.max_retries = max_retries
+        # (document model, _id) -> operator -> field -> value
+        self._pending: dict[tuple[type, Any], dict[str, dict[str, Any]]] = {}
+        # (document model, _id) -> flushes its update has failed in a row
+        self._failures: dict[tuple[type, Any], int] = {}
+        self._timer: asyncio.TimerHandle | None = None
+        self._lock = asyncio.Lock()
+
+        self.updates = 0
+        self.writes = 0
+        self.flushes = 0
+        self.errors = 0
+        self.dropped = 0
+        self.flush_ms_max = 0.0
+
+    def inc(self, model: type, doc_id: Any, field: str, amount: int | float):
+        self.updates += 1
+        self._merge(model, doc_id, {"$inc": {field: amount}})
+
+    def max(self, model: type, doc_id: Any, field: str, value: Any):
+        self.updates += 1
+        self._merge(model, doc_id, {"$max": {field: value}})
+
+    def _merge(self, model: type, doc_id: Any, update: dict[str, dict[str, Any]]):
+        key = (model, doc_id)
+        if (ops := self._pending.get(key)) is None:
+            ops = self._pending[key] = {}
+            if len(self._pending) >= self.max_pending:
+                self._schedule(0)
+            elif self._timer is None:
+                self._schedule(self.interval_ms / 1000)
+
+        for field, amount in update.get("$inc", {}).items():
+            inc = ops.setdefault("$inc", {})
+            inc[field] = inc.get(field, 0) + amount
+        for field, value in update.get("$max", {}).items():
+            current = ops.setdefault("$max", {}).get(field)
+            if current is None or value > current:
+                ops["$max"][field] = value
+
+    def _schedule(self, delay: float):
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = asyncio.get_running_loop().call_later(
+            delay, lambda: asyncio.create_task(self.flush())
+        )
+
+    async def flush(self):
+        async with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+            pending, self._pending = self._pending, {}
+            if not pending:
+                return
+
+            by_model: dict[type, list[tuple[Any, dict]]] = defaultdict(list)
+            for (model, doc_id), update in pending.items():
+                by_model[model].append((doc_id, update))
+
+            start = time.perf_counter()
+            for model, updates in by_model.items():
+                await self._write(model, updates)
+
+            self.flushes += 1
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            self.flush_ms_max = max(self.flush_ms_max, elapsed_ms)
+
+    async def _write(self, model: type, updates: list[tuple[Any, dict]]):
+        try:
+            await model.get_pymongo_collection().bulk_write(
+                [UpdateOne({"_id": doc_id}, update) for doc_id, update in updates],
+                ordered=False,
+            )
+            self.writes += len(updates)
+            failed = set()
+        except BulkWriteError as e:
+            failed = {error["index"] for error in e.details.get("writeErrors", [])}
+            self.errors += len(failed)
+            self.writes += len(updates) - len(failed)
+            logging.error(f"{len(failed)} coalesced writes failed: {e}")
+            # merged back in so they go out with the next flush. an update that was
+            # rejected on its own (bad value, validation) would be forever, so give up
+            # on it after a few tries
+            for i in failed:
+                doc_id, update = updates[i]
+                key = (model, doc_id)
+                self._failures[key] = self._failures.get(key, 0) + 1
+                if self._failures[key] > self.max_retries:
+                    del self._failures[key]
+                    self.dropped += 1
+                    logging.error(
+                        f"dropping coalesced write to {model.__name__} {doc_id} "
+                        f"after {self.max_retries} retries: {update}"
+                    )
+                else:
+                    self._merge(model, doc_id, update)
+        except Exception as e:
+            # nothing was confirmed, but some of it may have landed (a timeout after
+            # the write). $max can go again as often as it likes, an $inc sent twice
+            # counts twice, so those are dropped. not counted against max_retries,
+            # this is mongo being away, not the update
+            self.errors += len(updates)
+            logging.error(f"failed to flush {len(updates)} coalesced writes: {e}")
+            for doc_id, update in updates:
+                if "$inc" in update:
+                    self.dropped += 1
+                    logging.error(
+                        f"dropping coalesced $inc to {model.__name__} {doc_id}, it "
+                        f"may or may not have been written: {update['$inc']}"
+                    )
+                if "$max" in update:
+                    self._merge(model, doc_id, {"$max": update["$max"]})
+            return
+
+        for i, (doc_id, _) in enumerate(updates):
+            if i not in failed:
+                self._failures.pop((model, doc_id), None)
+
+    def stats(self) -> dict:
+        return {
+            "updates": self.updates,
+            "writes": self.writes,
+            "flushes": self.flushes,
+            "errors": self.errors,
+            "dropped": self.dropped,
+            "pending": len(self._pending),
+            "coalesced_ratio": self.updates / self.writes if self.writes else 0,
+            "max_flush_ms": self.flush_ms_max,
+        }
+
+
+writes = WriteCoalescer(
+    interval_ms=int(getenv("COALESCE_INTERVAL_MS", "1000")),
+    max_pending=int(getenv("COALESCE_MAX_PENDING", "5000")),
+    max_retries=int(getenv("COALESCE_MAX_RETRIES", "3")),
+)
@@ -0,0 +1,121 @@
+"""
+response compression. big json bodies (history pages, channel and member lists) go
+out as brotli when the client takes it and the brotli package is installed, gzip
+otherwise. small bodies, streams (the gateway), and anything that's already compressed
+or isn't text are sent as is.
+
+zlib and brotli let go of the gil while they work, so bodies past
+COMPRESS_OFFLOAD_BYTES are compressed on the default executor instead of holding up
+the event loop. numbers for typical pages: python -m benchmarks.compression
+"""
+
+import asyncio
+import gzip
+from os import getenv
+from typing import Callable, Optional
+
+from sanic import HTTPResponse, Request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESS_MIN_BYTES = int(getenv("COMPRESS_MIN_BYTES", "1024"))
+COMPRESS_OFFLOAD_BYTES = int(getenv("COMPRESS_OFFLOAD_BYTES", str(256 * 1024)))
+# fast levels, past these the extra cpu buys a couple % on json
+GZIP_LEVEL = int(getenv("COMPRESS_GZIP_LEVEL", "5"))
+BROTLI_QUALITY = int(getenv("COMPRESS_BROTLI_QUALITY", "4"))
+
+_COMPRESSIBLE = ("application/json", "text/", "application/javascript")
+
+
+def gzip_compress(body: bytes) -> bytes:
+    # mtime=0 so the same body always compresses to the same bytes
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def brotli_compress(body: bytes) -> bytes:
+    return brotli.compress(body, quality=BROTLI_QUALITY)
+
+
+def _accepts(accept_encoding: str) -> set[str]:
+    accepted = set()
+    for part in accept_encoding.lower().split(","):
+        coding, _, params = part.strip().partition(";")
+        q = params.strip()
+        if q.startswith("q=") and q[2:].strip() in ("0", "0.0", "0.00", "0.000"):
+            continue
+        accepted.add(coding.strip())
+    return accepted
+
+
+def choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    if not accept_encoding:
+        return None
+    accepted = _accepts(accept_encoding)
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+_ENCODERS: dict[str, Callable[[bytes], bytes]] = {
+    "br": brotli_compress,
+    "gzip": gzip_compress,
+}
+
+
+def _compressible(response: HTTPResponse) -> bool:
+    if not response.body or len(response.body) < COMPRESS_MIN_BYTES:
+        return False
+    if response.status < 200 or response.status in (204, 206, 304):
+        return False
+    if "content-encoding" in response.headers:
+        return False
+    content_type = response.content_type or response.headers.get("content-type", "")
+    return content_type.startswith(_COMPRESSIBLE)
+
+
+def _add_vary(response: HTTPResponse):
+    # other middleware (cors) might vary on something already, keep that
+    current = ", ".join(response.headers.getall("vary", []))
+    names = {name.strip().lower() for name in current.split(",")}
+    if "*" in names or "accept-encoding" in names:
+        return
+    response.headers["vary"] = (
+        f"{current}, accept-encoding" if current.strip() else "accept-encoding"
+    )
+
+
+async def compress_response(request: Request, response: HTTPResponse):
+    """
+    response middleware, see main.py
+    """
+    # streamed responses don't have a body yet
+    if not isinstance(response, HTTPResponse) or not _compressible(response):
+        return
+
+    _add_vary(response)
+    if not (encoding := choose_encoding(request.headers.get("accept-encoding"))):
+        return
+
+    encode = _ENCODERS[encoding]
+    body = response.body
+    if len(body) >= COMPRESS_OFFLOAD_BYTES:
+        compressed = await asyncio.get_running_loop().run_in_executor(
+            None, encode, body
+        )
+    else:
+        compressed = encode(body)
+
+    if len(compressed) >= len(body):
+        return
+
+    response.body = compressed
+    response.headers["content-encoding"] = encoding
+    # the strong tag names the uncompressed bytes, If-None-Match still matches it
+    # (it compares weakly, see modules.etag)
+    if (etag := response.headers.get("etag")) and not etag.startswith("W/"):
+        response.headers["etag"] = f"W/{etag}"
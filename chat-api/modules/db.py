@@ -1,13 +1,18 @@
-import asyncio
-from datetime import datetime, UTC
+import functools
+from dataclasses import dataclass, fields
+from datetime import datetime, timedelta, UTC
 from chat_types.models import Status, MessageType, Embed as ApiEmbed
 from chat_types.models.author import Author as ApiAuthor
 from chat_types.models.flags import Flags as ApiUserFlags
 from dotenv import load_dotenv
 from os import getenv
 from modules.utils import generate_id, generate_secret
+from modules.utils import generate_snowflake, is_snowflake
+from modules.utils import snowflake_bound, snowflake_time
 from modules.utils import pydantic_model_from_dataclass
-from modules.resend import send_verification_email
+from modules import jsoncodec
+from modules.coalesce import writes
+from modules import jobs
 import logging
 from modules.kv import get_client
 import re
@@ -15,13 +20,15 @@ from sanic import exceptions
 
 load_dotenv()
 
-from typing import Optional
+from typing import Any, AsyncIterator, Iterable, Optional
 
 from motor.motor_asyncio import AsyncIOMotorClient
-from pydantic import Field
+from pydantic import BaseModel, Field
+from pymongo import ASCENDING, DESCENDING, TEXT, IndexModel
+from pymongo.errors import OperationFailure
 
-from beanie import Document, init_beanie
-from beanie.operators import In, Or
+from beanie import Document, UpdateResponse, init_beanie
+from beanie.odm.queries.find import FindMany
 
 client = None
 
@@ -29,7 +36,7 @@ client = None
 def convert_dates_to_iso(d):
     for k, v in d.items():
         if isinstance(v, datetime):
-            d[k] = v.isoformat() + "Z"
+            d[k] = jsoncodec.iso(v)
     return d
 
 
@@ -39,11 +46,109 @@ def normalize_title(title: str):
     return title.lower()
 
 
+@functools.cache
+def api_fields(api_cls: type, model: type[Document]) -> tuple[str, ...]:
+    """
+    the fields an api model shares with a document, ie. the projection a listing
+    endpoint needs to build its response (never password, token etc.)
+    """
+    return tuple(f.name for f in fields(api_cls) if f.name in model.model_fields)
+
+
+@functools.cache
+def _raw_defaults(
+    model: type[Document], names: tuple[str, ...]
+) -> tuple[tuple[str, Any], ...]:
+    # defaults for fields older documents might not have, as they'd come out of the
+    # db. factories that need data or the clock are skipped, stored docs have those
+    defaults = []
+    for name in names:
+        field = model.model_fields[name]
+        factory = field.default_factory
+        if factory in (list, dict):
+            defaults.append((name, factory))
+        elif isinstance(factory, type) and issubclass(factory, BaseModel):
+            defaults.append((name, lambda factory=factory: factory().model_dump()))
+        elif factory is None and not field.is_required():
+            defaults.append((name, lambda default=field.default: default))
+    return tuple(defaults)
+
+
+def _to_records(
+    model: type[Document], docs: list[dict], names: tuple[str, ...]
+) -> list[dict]:
+    defaults = _raw_defaults(model, names)
+    for doc in docs:
+        doc["id"] = doc.pop("_id")
+        for name, default in defaults:
+            if name not in doc:
+                doc[name] = default()
+    return docs
+
+
+async def find_raw(query: FindMany, names: Iterable[str]) -> list[dict]:
+    """
+    run a beanie find without building documents: straight through the driver with a
+    projection, no pydantic validation and no state management snapshot. records are
+    plain dicts keyed like the model (`id`, not `_id`), so dtoa and the serializers
+    take them as is. read only, there's nothing to save back.
+    """
+    names = tuple(names)
+    model = query.document_model
+    cursor = model.get_pymongo_collection().find(
+        filter=query.get_filter_query(),
+        projection={("_id" if name == "id" else name): 1 for name in names},
+        sort=query.sort_expressions or None,
+        skip=query.skip_number,
+        limit=query.limit_number,
+    )
+    return _to_records(model, await cursor.to_list(None), names)
+
+
+async def iter_raw(
+    query: FindMany, names: Iterable[str], batch_size: int
+) -> AsyncIterator[list[dict]]:
+    """
+    find_raw for reads too big to hold at once: one server side cursor, handed out
+    `batch_size` records at a time
+    """
+    names = tuple(names)
+    model = query.document_model
+    cursor = model.get_pymongo_collection().find(
+        filter=query.get_filter_query(),
+        projection={("_id" if name == "id" else name): 1 for name in names},
+        sort=query.sort_expressions or None,
+        batch_size=batch_size,
+    )
+    try:
+        while batch := await cursor.to_list(batch_size):
+            yield _to_records(model, batch, names)
+    finally:
+        await cursor.close()
+
+
+async def _find(found: FindMany, project: Optional[Iterable[str]]) -> list:
+    # documents as usual, or raw records when the caller asked for a projection
+    if project is None:
+        return await found.to_list()
+    return await find_raw(found, project)
+
+
 Embed = pydantic_model_from_dataclass(ApiEmbed, name="Embed")
 Author = pydantic_model_from_dataclass(ApiAuthor, name="Author")
 UserFlags = pydantic_model_from_dataclass(ApiUserFlags, name="UserFlags")
 
 
+def _connections_key(user_id: str) -> str:
+    # v2: zset member=conn id, score=last seen ms
+    return f"{getenv('ENV')}-gateway-connections-v2:{user_id}"
+
+
+def _stale_cutoff() -> int:
+    stale_sec = int(getenv("GATEWAY_CONN_STALE_SEC", "600"))
+    return int(datetime.now(UTC).timestamp() * 1000) - (stale_sec * 1000)
+
+
 class User(Document):
     id: str = Field(default_factory=generate_id)
     username: str
@@ -79,13 +184,9 @@ class User(Document):
         return convert_dates_to_iso(d)
 
     async def fetch_status(self):
-        # v2: zset member=conn id, score=last seen ms
-        key = f"{getenv('ENV')}-gateway-connections-v2:{self.id}"
-        stale_sec = int(getenv("GATEWAY_CONN_STALE_SEC", "600"))
-        cutoff = int(datetime.now(UTC).timestamp() * 1000) - (stale_sec * 1000)
-
+        key = _connections_key(self.id)
         # clean up stale conns so users don't get stuck "online" forever
-        await get_client().zremrangebyscore(key, 0, cutoff)
+        await get_client().zremrangebyscore(key, 0, _stale_cutoff())
         count = await get_client().zcard(key)
 
         self.status = (
@@ -95,11 +196,12 @@ class User(Document):
 
     def inc_bytes(self, amount: int):
         self.bytes += amount
+        # the coalesced $inc is what persists it. keep save_changes from also $setting
+        # a (possibly cached, stale) total over increments from other requests
+        if self._saved_state is not None:
+            self._saved_state["bytes"] = self.bytes
 
-        async def _inc_bytes():
-            await User.find_one(User.id == self.id).update({"$inc": {"bytes": amount}})
-
-        asyncio.create_task(_inc_bytes())
+        writes.inc(User, self.id, "bytes", amount)
 
     def self_bytes(self) -> int:
         return (
@@ -110,16 +212,26 @@ class User(Document):
             + len(self.color or "")
         )
 
+    async def _save_and_forget(self):
+        # modules.auth caches users by token on every node. imported here because
+        # it imports this module
+        from modules.auth import forget
+
+        await self.save_changes()
+        await forget(self.token)
+
     async def start_verification(self):
         self.verification_code = generate_id()
-        await self.save_changes()
-        await send_verification_email(self.email, self.verification_code)
+        await self._save_and_forget()
+        await jobs.enqueue(
+            jobs.SendVerificationEmail(self.email, self.verification_code)
+        )
 
     async def verify(self, code: str):
         if code == self.verification_code:
             self.verified = True
             self.verification_code = None
-            await self.save_changes()
+            await self._save_and_forget()
             return True
         return False
 
@@ -172,6 +284,41 @@ class User(Document):
     class Settings:
         name = "users"
         use_state_management = True
+        indexes = [
+            IndexModel([("token", ASCENDING)], name="token", unique=True),
+            IndexModel([("username", ASCENDING)], name="username", unique=True),
+            IndexModel([("email", ASCENDING)], name="email", unique=True),
+            # /v1/sync asks for authors changed since a (updated_at, -_id) cursor
+            IndexModel(
+                [("updated_at", ASCENDING), ("_id", DESCENDING)], name="updated_ids"
+            ),
+        ]
+
+
+async def fetch_statuses(users: list[User | dict]) -> None:
+    """
+    fetch_status for a whole list of users, documents or raw records (with
+    default_status in the projection), in one redis round trip instead of two each
+    """
+    if not users:
+        return
+
+    cutoff = _stale_cutoff()
+    pipe = get_client().pipeline(transaction=False)
+    for user in users:
+        key = _connections_key(user["id"] if isinstance(user, dict) else user.id)
+        pipe.zremrangebyscore(key, 0, cutoff)
+        pipe.zcard(key)
+    counts = (await pipe.execute())[1::2]
+
+    for user, count in zip(users, counts):
+        if isinstance(user, dict):
+            online = user.get("default_status") or Status.ONLINE
+            user["status"] = online if count and int(count) > 0 else Status.OFFLINE
+        else:
+            user.status = (
+                user.default_status if count and int(count) > 0 else Status.OFFLINE
+            )
 
 
 class StoredFile(Document):
@@ -197,15 +344,74 @@ class StoredFile(Document):
     class Settings:
         name = "files"
         use_state_management = True
+        indexes = [
+            IndexModel([("owner_id", ASCENDING)], name="owner"),
+        ]
+
+
+# cuids always start with a letter and snowflakes are all digits,
+# so this splits a channel's history into its snowflake and legacy halves
+LEGACY_ID_MIN = "a"
+
+
+def _message_created_at(data: dict) -> datetime:
+    if is_snowflake(data.get("id") or ""):
+        return snowflake_time(data["id"])
+    return datetime.now(UTC)
+
+
+# how long a reserved seq gets to show up in mongo before a hole at it is taken to be
+# a failed insert rather than one that's still being written
+SEQ_GRACE_SEC = int(getenv("SEQ_GRACE_SEC", "30"))
+
+
+def _utc(value: Optional[datetime]) -> Optional[datetime]:
+    # raw records come back naive
+    if value is None or value.tzinfo is not None:
+        return value
+    return value.replace(tzinfo=UTC)
+
+
+def settled_prefix(
+    records: list[dict], after_seq: int, settled_before: datetime
+) -> tuple[list[dict], int]:
+    """
+    the part of a seq ordered page a client can safely step over, and the seq to
+    resume from after it. seqs are reserved before the message is saved, so seq N+1
+    can be in mongo while N is still on its way. the page stops at the first hole
+    unless the message after it was created before `settled_before`: N was reserved
+    before that message, so by then its insert has failed, not just not finished yet
+    """
+    settled: list[dict] = []
+    watermark = after_seq
+    for record in records:
+        if (
+            record["seq"] > watermark + 1
+            and _utc(record["created_at"]) > settled_before
+        ):
+            break
+        settled.append(record)
+        watermark = record["seq"]
+    return settled, watermark
+
+
+@dataclass
+class HistoryCursor:
+    created_at: datetime
+    # None when the cursor is just a timestamp
+    id: Optional[str] = None
 
 
 class Message(Document):
-    id: str = Field(default_factory=generate_id)
+    # new messages get time ordered snowflakes, old ones keep their cuids
+    id: str = Field(default_factory=generate_snowflake)
     type: MessageType = Field(default=MessageType.DEFAULT)
     author_id: str
     channel_id: str
     file_ids: list[str] = Field(default_factory=list)
-    created_at: datetime = Field(default_factory=lambda: datetime.now(UTC))
+    created_at: datetime = Field(default_factory=_message_created_at)
+    # per channel sequence number from Channel.next_seq, None on old messages
+    seq: Optional[int] = Field(default=None)
     content: Optional[str] = Field(default=None)
     nonce: Optional[str] = Field(default=None)
     updated_at: Optional[datetime] = None
@@ -214,11 +420,202 @@ class Message(Document):
     system_embeds: list[Embed] = Field(default_factory=list)
     mentions: list[str] = Field(default_factory=list)
     author: Optional[Author] = Field(default=None)
+    # new random value on every change (edits, unfurls), never sent to clients. keys
+    # the serialized copy in serializers.fragments
+    version: Optional[str] = None
 
     @property
     def embeds(self) -> list[Embed]:
         return self.user_embeds + self.system_embeds
 
+    @classmethod
+    async def search(
+        cls,
+        text: str,
+        channel_id: str,
+        *,
+        author_id: Optional[str] = None,
+        after: Optional[datetime] = None,
+        before: Optional[datetime] = None,
+        offset: int = 0,
+        limit: int = 25,
+        project: Optional[Iterable[str]] = None,
+    ) -> list["Message"] | list[dict]:
+        """
+        full text search over one channel's part of the content_text index, best match
+        first. cost scales with how common the terms are in that channel, not with how
+        big the channel or the whole collection is.
+        with `project` you get raw records with just those fields (see find_raw).
+        """
+        query = {
+            "$text": {"$search": text},
+            # the index is prefixed by channel_id, mongo wants an equality on it
+            "channel_id": channel_id,
+            "deleted_at": None,
+        }
+        if author_id:
+            query["author_id"] = author_id
+        if after or before:
+            query["created_at"] = {
+                **({"$gt": after} if after else {}),
+                **({"$lt": before} if before else {}),
+            }
+
+        # beanie hands sort tuples straight to pymongo, which knows about $meta
+        found = (
+            cls.find(query)
+            .sort([("score", {"$meta": "textScore"}), ("_id", DESCENDING)])
+            .skip(offset)
+            .limit(limit)
+        )
+        return await _find(found, project)
+
+    @classmethod
+    async def get_history(
+        cls,
+        query: dict,
+        *,
+        before: Optional[HistoryCursor] = None,
+        after: Optional[HistoryCursor] = None,
+        limit: int = 50,
+        project: Optional[Iterable[str]] = None,
+    ) -> list["Message"] | list[dict]:
+        """
+        one page of history. newest first, unless only `after` is given, then oldest
+        first so paging forward doesn't skip anything.
+
+        every snowflake message is newer than every legacy one, so this reads the
+        snowflake range off the _id index and only falls back to created_at for the
+        legacy part when the page runs past it.
+
+        with `project` the page comes back as raw records (see find_raw).
+        """
+        snowflakes: Optional[dict] = {"$lt": LEGACY_ID_MIN}
+        legacy: Optional[dict] = {}
+
+        if before:
+            if before.id and is_snowflake(before.id):
+                snowflakes["$lt"] = before.id
+            elif before.id:
+                snowflakes = None
+                legacy["$lt"] = before.created_at
+            else:
+                snowflakes["$lt"] = snowflake_bound(before.created_at)
+                legacy["$lt"] = before.created_at
+
+        if after:
+            if after.id and is_snowflake(after.id):
+                snowflakes["$gt"] = after.id
+                legacy = None
+            elif after.id:
+                if legacy is not None:
+                    legacy["$gt"] = after.created_at
+            else:
+                if snowflakes is not None:
+                    snowflakes["$gt"] = snowflake_bound(after.created_at, upper=True)
+                if legacy is not None:
+                    legacy["$gt"] = after.created_at
+
+        newest_first = not (after and not before)
+
+        async def _snowflakes(n: int) -> list:
+            if snowflakes is None or n <= 0:
+                return []
+            return await _find(
+                cls.find({**query, "_id": snowflakes})
+                .sort(-cls.id if newest_first else +cls.id)
+                .limit(n),
+                project,
+            )
+
+        async def _legacy(n: int) -> list:
+            if legacy is None or n <= 0:
+                return []
+            legacy_query = {**query, "_id": {"$gte": LEGACY_ID_MIN}}
+            if legacy:
+                legacy_query["created_at"] = legacy
+            return await _find(
+                cls.find(legacy_query)
+                .sort(-cls.created_at if newest_first else +cls.created_at)
+                .limit(n),
+                project,
+            )
+
+        if newest_first:
+            messages = await _snowflakes(limit)
+            return messages + await _legacy(limit - len(messages))
+
+        messages = await _legacy(limit)
+        return messages + await _snowflakes(limit - len(messages))
+
+    @classmethod
+    async def since_seq(
+        cls, channel_id: str, after_seq: int, *, limit: int, project: Iterable[str]
+    ) -> tuple[list[dict], int]:
+        """
+        messages with a seq past `after_seq`, oldest first, deleted ones included so
+        clients find out about those too. and the seq to ask from next time, which
+        is where the page stopped at a hole that might still fill in (settled_prefix)
+        """
+        after_seq = max(after_seq, 0)
+        records = await find_raw(
+            cls.find({"channel_id": channel_id, "seq": {"$gt": after_seq}})
+            .sort(+cls.seq)
+            .limit(limit),
+            project,
+        )
+        settled_before = datetime.now(UTC) - timedelta(seconds=SEQ_GRACE_SEC)
+        page, watermark = settled_prefix(records, after_seq, settled_before)
+
+        if len(page) == len(records) < limit:
+            # nothing saved past the page, but seqs might have been reserved. once
+            # the newest reservation is old enough those are failed inserts too
+            channel = await find_raw(
+                Channel.find(Channel.id == channel_id), ("last_seq", "last_seq_at")
+            )
+            if channel and channel[0]["last_seq"] > watermark:
+                reserved_at = _utc(channel[0].get("last_seq_at"))
+                if reserved_at is None or reserved_at <= settled_before:
+                    watermark = channel[0]["last_seq"]
+
+        return page, watermark
+
+    @classmethod
+    async def export(
+        cls,
+        channel_id: str,
+        *,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        batch_size: int = 1000,
+        project: Iterable[str],
+    ) -> AsyncIterator[list[dict]]:
+        """
+        every live message in a channel, or just the ones from `since` up to `until`,
+        oldest first and as raw records `batch_size` at a time. legacy messages come
+        first off the created_at index, then snowflakes off the _id one, like
+        get_history
+        """
+        query = {"deleted_at": None, "channel_id": channel_id}
+        snowflakes = {"$lt": LEGACY_ID_MIN}
+        legacy = {"_id": {"$gte": LEGACY_ID_MIN}}
+        created = {}
+        if since:
+            snowflakes["$gte"] = snowflake_bound(since)
+            created["$gte"] = since
+        if until:
+            snowflakes["$lt"] = snowflake_bound(until)
+            created["$lt"] = until
+        if created:
+            legacy["created_at"] = created
+
+        for found in (
+            cls.find({**query, **legacy}).sort(+cls.created_at),
+            cls.find({**query, "_id": snowflakes}).sort(+cls.id),
+        ):
+            async for batch in iter_raw(found, project, batch_size):
+                yield batch
+
     @classmethod
     async def validate_dict(cls, data: dict) -> bool:
         if data.get("embeds"):
@@ -293,6 +690,52 @@ class Message(Document):
     class Settings:
         name = "messages"
         use_state_management = True
+        indexes = [
+            # history: equality on channel + deleted_at, then sort/range on the id.
+            # also /v1/sync deletes, by (deleted_at, -_id)
+            IndexModel(
+                [
+                    ("channel_id", ASCENDING),
+                    ("deleted_at", ASCENDING),
+                    ("_id", DESCENDING),
+                ],
+                name="channel_ids",
+            ),
+            # same thing for legacy cuid messages, which only sort by created_at.
+            # walked backwards it's /v1/sync's (created_at, -_id) order
+            IndexModel(
+                [
+                    ("channel_id", ASCENDING),
+                    ("deleted_at", ASCENDING),
+                    ("created_at", DESCENDING),
+                    ("_id", ASCENDING),
+                ],
+                name="channel_created",
+            ),
+            # since_seq range reads, also guards against handing out a seq twice
+            IndexModel(
+                [("channel_id", ASCENDING), ("seq", ASCENDING)],
+                name="channel_seq",
+                unique=True,
+                partialFilterExpression={"seq": {"$gt": 0}},
+            ),
+            # /v1/sync edits since a (updated_at, -_id) cursor
+            IndexModel(
+                [
+                    ("channel_id", ASCENDING),
+                    ("updated_at", ASCENDING),
+                    ("_id", DESCENDING),
+                ],
+                name="channel_updated",
+            ),
+            # search + `contains`, always within one channel. no language so chat
+            # slang isn't stemmed or dropped
+            IndexModel(
+                [("channel_id", ASCENDING), ("content", TEXT)],
+                name="content_text",
+                default_language="none",
+            ),
+        ]
 
 
 class Emoji(Document):
@@ -338,6 +781,13 @@ class Emoji(Document):
     class Settings:
         name = "emojis"
         use_state_management = True
+        indexes = [
+            IndexModel(
+                [("owner_id", ASCENDING), ("name", ASCENDING)],
+                name="owner_name",
+                unique=True,
+            ),
+        ]
 
 
 class Channel(Document):
@@ -350,32 +800,26 @@ class Channel(Document):
     updated_at: datetime = Field(default_factory=lambda: datetime.now(UTC))
     deleted_at: Optional[datetime] = None
     last_message_at: Optional[datetime] = None
+    # seq of the newest message, bumped atomically by next_seq
+    last_seq: int = 0
+    # when next_seq last handed one out, never sent to clients
+    last_seq_at: Optional[datetime] = None
     private: bool = False
 
     @classmethod
-    async def get_user_channels(cls, user_id: str):
-        public_channels = cls.find(Or(cls.private == False, cls.author_id == user_id))
-
-        memberships = ChannelMember.find(ChannelMember.user_id == user_id)
-
-        public_channels, memberships = await asyncio.gather(
-            public_channels.to_list(),
-            memberships.to_list(),
+    async def next_seq(cls, channel_id: str) -> int:
+        """
+        reserve the next message seq for a channel. a seq can be reserved and then
+        never used (failed insert), or saved after a later one, see
+        Message.since_seq
+        """
+        channel = await cls.find_one(cls.id == channel_id).update(
+            {"$inc": {"last_seq": 1}, "$currentDate": {"last_seq_at": True}},
+            response_type=UpdateResponse.NEW_DOCUMENT,
         )
-
-        member_channel_ids = {cm.channel_id for cm in memberships}
-
-        private_channels = []
-        if member_channel_ids:
-            private_channels = await cls.find(
-                In(cls.id, list(member_channel_ids)), cls.private == True
-            ).to_list()
-
-        channels = {channel.id: channel for channel in public_channels}
-        for channel in private_channels:
-            channels[channel.id] = channel
-
-        return list(channels.values())
+        if not channel:
+            raise exceptions.NotFound("Channel not found")
+        return channel.last_seq
 
     @classmethod
     async def validate_dict(cls, data: dict) -> bool:
@@ -397,6 +841,11 @@ class Channel(Document):
     class Settings:
         name = "channels"
         use_state_management = True
+        indexes = [
+            # modules.acl loads the public channels and a user's own ones off these
+            IndexModel([("private", ASCENDING)], name="private"),
+            IndexModel([("author_id", ASCENDING)], name="author"),
+        ]
 
     def dict(self):
         return convert_dates_to_iso(super().model_dump(exclude={"deleted_at"}))
@@ -431,6 +880,12 @@ class Webhook(Document):
     class Settings:
         name = "webhooks"
         use_state_management = True
+        indexes = [
+            # not unique, creating a webhook never checked names
+            IndexModel(
+                [("channel_id", ASCENDING), ("name", ASCENDING)], name="channel_name"
+            ),
+        ]
 
 
 class ChannelMember(Document):
@@ -443,6 +898,23 @@ class ChannelMember(Document):
     class Settings:
         name = "channel_members"
         use_state_management = True
+        indexes = [
+            # not unique, joining an invite twice has always made a second row
+            IndexModel(
+                [("channel_id", ASCENDING), ("user_id", ASCENDING)],
+                name="channel_user",
+            ),
+            IndexModel([("user_id", ASCENDING)], name="user"),
+            # /v1/sync joins since a (created_at, -_id) cursor
+            IndexModel(
+                [
+                    ("channel_id", ASCENDING),
+                    ("created_at", ASCENDING),
+                    ("_id", DESCENDING),
+                ],
+                name="channel_joined",
+            ),
+        ]
 
 
 class ChannelInvite(Document):
@@ -470,6 +942,72 @@ class ChannelInvite(Document):
     class Settings:
         name = "channel_invites"
         use_state_management = True
+        indexes = [
+            IndexModel([("code", ASCENDING)], name="code", unique=True),
+            IndexModel([("channel_id", ASCENDING)], name="channel"),
+        ]
+
+
+DOCUMENT_MODELS = [
+    User,
+    StoredFile,
+    Message,
+    Channel,
+    ChannelMember,
+    Emoji,
+    Webhook,
+    ChannelInvite,
+]
+
+
+async def ensure_indexes() -> list[str]:
+    """
+    create any declared index that's missing and check the rest still match.
+    one at a time so a single bad index (eg. old duplicate data vs a unique index)
+    gets logged instead of taking the whole node down. returns the failures.
+    """
+    failures = []
+    for model in DOCUMENT_MODELS:
+        collection = model.get_pymongo_collection()
+        existing = await collection.index_information()
+
+        for index in getattr(model.Settings, "indexes", []):
+            spec = index.document
+            label = f"{model.Settings.name}.{spec['name']}"
+
+            if (current := existing.get(spec["name"])) is not None:
+                if TEXT in spec["key"].values():
+                    # mongo reports text indexes as _fts/_ftsx, compare the fields instead.
+                    # plus any plain keys around them, like a channel_id prefix
+                    text_keys = {k for k, v in spec["key"].items() if v == TEXT}
+                    plain_keys = [(k, v) for k, v in spec["key"].items() if v != TEXT]
+                    key_matches = (
+                        set(current.get("weights", {})) == text_keys
+                        and [
+                            (k, v)
+                            for k, v in current["key"]
+                            if k not in ("_fts", "_ftsx")
+                        ]
+                        == plain_keys
+                    )
+                else:
+                    key_matches = list(current["key"]) == list(spec["key"].items())
+
+                if not key_matches or bool(current.get("unique")) != bool(
+                    spec.get("unique")
+                ):
+                    failures.append(label)
+                    logging.error(f"index {label} doesn't match its declaration")
+                continue
+
+            try:
+                await collection.create_indexes([index])
+                logging.info(f"Created index {label}")
+            except OperationFailure as e:
+                failures.append(label)
+                logging.error(f"failed to create index {label}: {e}")
+
+    return failures
 
 
 async def init():
@@ -477,15 +1015,9 @@ async def init():
     client = AsyncIOMotorClient(getenv("MONGO_URL"))
     await init_beanie(
         database=client[getenv("ENV")],
-        document_models=[
-            User,
-            StoredFile,
-            Message,
-            Channel,
-            ChannelMember,
-            Emoji,
-            Webhook,
-            ChannelInvite,
-        ],
+        document_models=DOCUMENT_MODELS,
+        # we create these ourselves so one failure doesn't kill startup
+        skip_indexes=True,
     )
+    await ensure_indexes()
     logging.info("Connected to MongoDB")
@@ -0,0 +1,82 @@
+"""
+strong etags + If-None-Match for read endpoints.
+
+a tag is worked out from the fields that change whenever a resource does (updated_at,
+counters, status...) of the records the endpoint read anyway, never by encoding the
+body and hashing that. a client that already has the current version gets a bodyless
+304 and the response is never built or encoded.
+"""
+
+import hashlib
+from typing import Any, Awaitable, Callable, Hashable, Iterable
+
+from sanic import HTTPResponse, Request, raw
+
+from modules import jsoncodec
+from modules.singleflight import flights
+
+# clients have to revalidate every time, and it's per user so no shared caches
+CACHE_CONTROL = "private, no-cache"
+
+# per resource, the fields that change whenever anything in its api form does
+CHANNEL_VERSION = ("id", "updated_at", "last_seq", "last_message_at")
+# bytes and status move without updated_at
+AUTHOR_VERSION = ("id", "updated_at", "status", "bytes", "flags")
+USER_VERSION = AUTHOR_VERSION + ("verified",)
+# small enough that the fields are the version
+EMOJI_VERSION = ("id", "name", "animated", "mime_type", "ext")
+INVITE_VERSION = ("id", "uses", "max_uses", "expires_at")
+
+
+def _values(record: Any) -> dict:
+    return record if isinstance(record, dict) else vars(record)
+
+
+def make_etag(records: Iterable[Any], fields: tuple[str, ...]) -> str:
+    """
+    tag for a list of records (raw dicts or documents), from just `fields` of each
+    """
+    versions = tuple(
+        tuple(_values(record).get(name) for name in fields) for record in records
+    )
+    digest = hashlib.blake2b(repr(versions).encode("utf-8"), digest_size=16)
+    return f'"{digest.hexdigest()}"'
+
+
+def matches(request: Request, etag: str) -> bool:
+    if not (header := request.headers.get("If-None-Match")):
+        return False
+    if header.strip() == "*":
+        return True
+    # If-None-Match compares weakly, a W/ prefix doesn't stop a match
+    return etag in (tag.strip().removeprefix("W/") for tag in header.split(","))
+
+
+async def conditional_json(
+    request: Request,
+    key: Hashable,
+    load: Callable[[], Awaitable[list[Any]]],
+    fields: tuple[str, ...],
+    build: Callable[[list[Any]], Any],
+) -> HTTPResponse:
+    """
+    `load` the records (shared between identical concurrent requests, see
+    modules.singleflight), tag them by `fields`, and 304 if the client has that tag.
+    otherwise `build` the body from them (or its json, as bytes), encoded once per
+    version
+    """
+    records = await flights.do(key, load)
+    etag = make_etag(records, fields)
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    if matches(request, etag):
+        return HTTPResponse(status=304, headers=headers)
+
+    async def encoded() -> bytes:
+        body = build(records)
+        return body if isinstance(body, bytes) else jsoncodec.dumpb(body)
+
+    return raw(
+        await flights.do((key, etag), encoded),
+        headers=headers,
+        content_type="application/json",
+    )
@@ -1,11 +1,17 @@
-from dataclasses import Field, asdict, dataclass, field
+from dataclasses import Field, dataclass, field
+from datetime import datetime
 from os import getenv
 import time
 import asyncio
 from collections import defaultdict
-import json
 from typing import Any
-from modules.kv import publish, get_client
+from modules.kv import (
+    publish,
+    publish_ephemeral,
+    get_client,
+    events_trimmed_before,
+    EPHEMERAL_CHANNEL,
+)
 from chat_types.events import (
     EventType,
     MessageCreated,
@@ -16,18 +22,19 @@ from chat_types.events import (
     TypingStarted,
     ChannelDeleted,
     ChannelUpdated,
+    ResyncRequired,
 )
 from chat_types.models.author import Author as ApiAuthor
-from modules.db import Channel, User
+from modules.db import Channel, User, fetch_statuses
 from modules.utils import (
     dataclass_from_dict,
     dtoa,
-    convert_enums_to_strings,
-    convert_dates_to_iso,
     generate_id,
 )
 import logging
 import sanic
+from modules import acl, history, jsoncodec, payloads
+from modules.coalesce import writes
 
 
 @dataclass
@@ -37,8 +44,7 @@ class UserEntitlements:
 
     @classmethod
     async def from_user(cls, user: User):
-        user_channels = await Channel.get_user_channels(user.id)
-        return cls(channels=set(channel.id for channel in user_channels), user=user)
+        return cls(channels=await acl.visible_channel_ids(user.id), user=user)
 
     def validate(
         self,
@@ -96,10 +102,15 @@ EVENT_TYPES = {
     TypingStarted: EventType.TYPING_STARTED,
     ChannelDeleted: EventType.CHANNEL_DELETED,
     ChannelUpdated: EventType.CHANNEL_UPDATED,
+    ResyncRequired: EventType.RESYNC_REQUIRED,
 }
 
 EVENT_CLASSES = {v: k for k, v in EVENT_TYPES.items()}
 
+# these go over redis pub/sub instead of the stream, so they never get replayed
+# and never push real events out of the replay window
+EPHEMERAL_EVENTS = {TypingStarted}
+
 user_entitlements: dict[str, UserEntitlements] = {}
 connections: dict[str, set[GatewayConnection]] = defaultdict(set)
 
@@ -132,7 +143,7 @@ def format_event(
 ):
     return {
         "t": EVENT_TYPES[type(event)].value,
-        "d": convert_enums_to_strings(convert_dates_to_iso(asdict(event))),
+        "d": event,
         "ts": str(int(time.time() * 1000)),
     }
 
@@ -154,37 +165,47 @@ def publish_event(
     """
 
     if isinstance(event, MessageCreated):
+        # coalesced, a busy channel gets one write per flush instead of one per message
+        writes.max(
+            Channel,
+            event.message.get("channel_id"),
+            "last_message_at",
+            datetime.fromisoformat(event.message.get("created_at")),
+        )
 
-        async def update_chan():
-            await Channel.find_one(
-                Channel.id == event.message.get("channel_id")
-            ).update({"$set": {"last_message_at": event.message.get("created_at")}})
-
-        asyncio.create_task(update_chan())
-
-    asyncio.create_task(
-        publish(
-            {
-                "t": EVENT_TYPES[type(event)].value,
-                "d": json.dumps(
-                    convert_enums_to_strings(convert_dates_to_iso(asdict(event))),
-                    separators=(",", ":"),
-                    indent=None,
-                ),
-                "ts": str(int(time.time() * 1000)),
-            }
+    if isinstance(event, (MessageCreated, MessageUpdated, MessageDeleted)):
+        asyncio.create_task(history.apply(event))
+
+    if type(event) in EPHEMERAL_EVENTS:
+        # no ts on purpose: clients resume from ts, and these can't be resumed from
+        asyncio.create_task(
+            publish_ephemeral(
+                {
+                    "t": EVENT_TYPES[type(event)].value,
+                    "d": event,
+                }
+            )
         )
+        return
+
+    publish(
+        {
+            "t": EVENT_TYPES[type(event)].value,
+            **payloads.pack(jsoncodec.dumps(event)),
+            "ts": str(int(time.time() * 1000)),
+        }
     )
 
 
 def parse_event(fields: dict) -> tuple[EventType, dict, Any]:
+    tag = fields.get(b"c")
     raw_event_data = {
         "t": fields[b"t"].decode("utf-8"),
-        "d": fields[b"d"].decode("utf-8"),
+        "d": payloads.unpack(fields[b"d"], tag.decode("utf-8") if tag else None),
         "ts": fields[b"ts"].decode("utf-8"),
     }
 
-    event = json.loads(raw_event_data["d"])
+    event = jsoncodec.loads(raw_event_data["d"])
     raw_event_data["d"] = event
     event_type = EventType(raw_event_data["t"])
 
@@ -195,6 +216,39 @@ def parse_event(fields: dict) -> tuple[EventType, dict, Any]:
     )
 
 
+async def _parse_or_skip(event_id, fields: dict) -> tuple[EventType, dict, Any] | None:
+    # one entry this node can't decode shouldn't take the whole stream down with it
+    try:
+        await _load_dictionary(fields)
+        return parse_event(fields)
+    except payloads.UnsupportedCodec as e:
+        logging.error(f"skipping event {event_id!r}: {e}")
+        return None
+
+
+async def _load_dictionary(fields: dict):
+    # entries packed by a node with a different dictionary (mid deploy), go fetch it once
+    tag = fields.get(b"c")
+    dict_id = payloads.missing_dictionary(tag.decode("utf-8") if tag else None)
+    if not dict_id:
+        return
+    content = await get_client().hget(payloads.DICT_KEY, dict_id)
+    if content is None:
+        raise payloads.UnknownDictionary(f"unknown event dictionary {dict_id}")
+    payloads.add_dictionary(dict_id, content)
+
+
+def parse_ephemeral_event(data: bytes) -> tuple[EventType, dict, Any]:
+    raw_event_data = jsoncodec.loads(data)
+    event_type = EventType(raw_event_data["t"])
+
+    return (
+        event_type,
+        raw_event_data,
+        dataclass_from_dict(EVENT_CLASSES[event_type], raw_event_data["d"]),
+    )
+
+
 async def update_user_entitlements(user: User):
     user_entitlements[user.id] = await UserEntitlements.from_user(user)
 
@@ -247,11 +301,12 @@ async def _connection_heartbeat_loop():
 
 
 def _format_sse(evt: dict) -> str:
-    return f"data: {json.dumps(evt, separators=(',', ':'), indent=None)}\n\n"
+    return f"data: {jsoncodec.dumps(evt)}\n\n"
 
 
-async def _send_event(conn: GatewayConnection, evt: dict):
-    await conn.writer.send(_format_sse(evt))
+async def _send_event(conn: GatewayConnection, evt: dict | str):
+    # str = frame that was already formatted once for every connection on this node
+    await conn.writer.send(evt if isinstance(evt, str) else _format_sse(evt))
 
 
 async def _stream_live_events(start_id: str = "$"):
@@ -271,7 +326,8 @@ async def _stream_live_events(start_id: str = "$"):
                 for event_id, fields in entries:
                     last_id = event_id
 
-                    yield parse_event(fields)
+                    if (parsed := await _parse_or_skip(event_id, fields)) is not None:
+                        yield parsed
 
         except Exception as e:
             logging.error(f"[Gateway] error streaming live events: {e}")
@@ -284,14 +340,25 @@ async def _replay_events_since(last_event_id: str):
     """
     entries = await get_client().xrange("events", min=last_event_id, max="+")
 
-    for _, fields in entries:
-        yield parse_event(fields)
+    for event_id, fields in entries:
+        if (parsed := await _parse_or_skip(event_id, fields)) is not None:
+            yield parsed
 
 
 async def replay_events(user_id: str, conn: GatewayConnection, last_event_ts: int):
     entitlements = user_entitlements.get(user_id)
     if not entitlements:
         return
+
+    # if stuff newer than the resume point got trimmed, a replay would be quietly partial.
+    # tell the client to refetch instead of pretending it's caught up
+    trimmed_before = await events_trimmed_before()
+    if last_event_ts <= trimmed_before:
+        logging.info(f" ---> {user_id} resumed from {last_event_ts}, needs resync")
+        await _send_event(
+            conn, format_event(ResyncRequired(oldest_event_ts=str(trimmed_before)))
+        )
+        return
     async for event_type, raw_event_data, event in _replay_events_since(last_event_ts):
         logging.info(f" ---> REPLAYING EVENT: {event_type.value}")
         if entitlements.validate(event):
@@ -307,7 +374,7 @@ async def populate_client_cache(user_id: str, conn: GatewayConnection):
         return
 
     users = await User.find().to_list(None)
-    await asyncio.gather(*[user.fetch_status() for user in users])
+    await fetch_statuses(users)
     for user in users:
         if user.id != user_id:
             await _send_event(
@@ -331,22 +398,29 @@ EVENT_HANDLERS = {
 }
 
 
+def _fan_out(event_type: EventType, raw_event_data: dict, event: Any):
+    if handler := EVENT_HANDLERS.get(event_type):
+        handler(event)
+
+    frame = None
+    for user_id, entitlements in user_entitlements.items():
+        if entitlements.validate(event):
+            # encode once per node, not once per connection
+            frame = frame or _format_sse(raw_event_data)
+            for conn in connections[user_id]:
+                asyncio.create_task(
+                    _send_event(
+                        conn,
+                        frame,
+                    )
+                )
+
+
 async def event_listener():
     try:
         async for event_type, raw_event_data, event in _stream_live_events():
             logging.info(f" ---> RECEIVED EVENT: {event_type.value}")
-            if handler := EVENT_HANDLERS.get(event_type):
-                handler(event)
-
-            for user_id, entitlements in user_entitlements.items():
-                if entitlements.validate(event):
-                    for conn in connections[user_id]:
-                        asyncio.create_task(
-                            _send_event(
-                                conn,
-                                raw_event_data,
-                            )
-                        )
+            _fan_out(event_type, raw_event_data, event)
     except Exception as e:
         logging.error(f"[Gateway] error streaming live events: {e}")
 
@@ -354,6 +428,26 @@ async def event_listener():
         asyncio.create_task(event_listener())
 
 
+async def ephemeral_listener():
+    pubsub = get_client().pubsub(ignore_subscribe_messages=True)
+    try:
+        await pubsub.subscribe(EPHEMERAL_CHANNEL)
+        async for message in pubsub.listen():
+            if message.get("type") != "message":
+                continue
+            try:
+                _fan_out(*parse_ephemeral_event(message["data"]))
+            except Exception as e:
+                logging.error(f"[Gateway] bad ephemeral event: {e}")
+    except Exception as e:
+        logging.error(f"[Gateway] error listening for ephemeral events: {e}")
+
+    finally:
+        await pubsub.aclose()
+        asyncio.create_task(ephemeral_listener())
+
+
 def init():
     asyncio.create_task(event_listener())
+    asyncio.create_task(ephemeral_listener())
     asyncio.create_task(_connection_heartbeat_loop())
@@ -0,0 +1,279 @@
+"""
+the newest HISTORY_CACHE_SIZE messages of every channel that's being read, already
+encoded, in redis. opening a channel (a history page with no cursor or filters) is
+answered from here without touching mongo, any other page still goes to mongo.
+
+    history:<id>           message ids scored by created_at (a sorted set)
+    history:<id>:messages  id -> the message's api json, plus
+                           :loaded   "all" (that's the whole channel) or "some"
+                           :version  bumped by every edit / delete
+                           ~<id>     an edit's json, or "" for a delete, that got
+                                     here before the message itself (see below)
+    history:<id>:early     ids of those ~ entries scored by created_at
+
+message events keep it up to date in place (see events.publish_event), nothing is
+invalidated on a new message. a fill from mongo that raced an edit or delete is thrown
+away instead of written (the :version check), so it can't bring back old content.
+channels nobody reads just expire.
+
+events come from every node, so nothing orders a create before its edit or delete.
+a change to a message that isn't cached yet but belongs in the window is left as a
+~ entry, and the create takes the edit instead of its own json, or is dropped after a
+delete. ~ entries are trimmed with the window and capped at its size.
+"""
+
+import logging
+from datetime import datetime
+from os import getenv
+from typing import Awaitable, Callable, Optional
+
+from chat_types.events import MessageCreated, MessageDeleted, MessageUpdated
+from modules import jsoncodec, kv, utils
+
+# has to cover the biggest page (100) for every default page to be cacheable
+HISTORY_CACHE_SIZE = int(getenv("HISTORY_CACHE_SIZE", "100"))
+HISTORY_CACHE_TTL_SEC = int(getenv("HISTORY_CACHE_TTL_SEC", "3600"))
+
+# KEYS: ids, messages, early. ARGV: limit. a fill of an empty channel leaves no ids
+# set, so a missing one is a miss rather than proof the channel has nothing in it
+_READ = """
+local loaded = redis.call('HGET', KEYS[2], ':loaded')
+if not loaded or redis.call('EXISTS', KEYS[1]) == 0 then
+    return false
+end
+local ids = redis.call('ZREVRANGE', KEYS[1], 0, tonumber(ARGV[1]) - 1)
+if #ids < tonumber(ARGV[1]) and loaded ~= 'all' then
+    return false
+end
+if #ids == 0 then
+    return {}
+end
+return redis.call('HMGET', KEYS[2], unpack(ids))
+"""
+
+# KEYS: ids, messages, early. ARGV: size, ttl, loaded, version, then id, created_at
+# ms and json for every message. a fill passes loaded + the version it started at, a
+# new message passes neither and is only added to channels that are cached (or
+# filling), never over an entry that's already there, and never after its delete
+_ADD = """
+local size = tonumber(ARGV[1])
+local new = ARGV[4] == ''
+if new then
+    if redis.call('EXISTS', KEYS[2]) == 0 then
+        return 0
+    end
+elseif redis.call('HGET', KEYS[2], ':version') ~= ARGV[4] then
+    return 0
+end
+for i = 5, #ARGV, 3 do
+    local id, json = ARGV[i], ARGV[i + 2]
+    local early = redis.call('HGET', KEYS[2], '~' .. id)
+    if early then
+        redis.call('HDEL', KEYS[2], '~' .. id)
+        redis.call('ZREM', KEYS[3], id)
+        if new then
+            json = early
+        end
+    end
+    if new and redis.call('ZSCORE', KEYS[1], id) then
+        json = ''
+    end
+    if json ~= '' then
+        redis.call('ZADD', KEYS[1], ARGV[i + 1], id)
+        redis.call('HSET', KEYS[2], id, json)
+    end
+end
+if ARGV[3] ~= '' then
+    redis.call('HSET', KEYS[2], ':loaded', ARGV[3])
+end
+local old = redis.call('ZRANGE', KEYS[1], 0, -(size + 1))
+if #old > 0 then
+    redis.call('ZREMRANGEBYRANK', KEYS[1], 0, -(size + 1))
+    redis.call('HDEL', KEYS[2], unpack(old))
+    if redis.call('HGET', KEYS[2], ':loaded') == 'all' then
+        redis.call('HSET', KEYS[2], ':loaded', 'some')
+    end
+    local oldest = redis.call('ZRANGE', KEYS[1], 0, 0, 'WITHSCORES')
+    local stale = redis.call('ZRANGEBYSCORE', KEYS[3], '-inf', '(' .. oldest[2])
+    for _, id in ipairs(stale) do
+        redis.call('HDEL', KEYS[2], '~' .. id)
+    end
+    redis.call('ZREMRANGEBYSCORE', KEYS[3], '-inf', '(' .. oldest[2])
+end
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+redis.call('EXPIRE', KEYS[2], ARGV[2])
+redis.call('EXPIRE', KEYS[3], ARGV[2])
+return 1
+"""
+
+# KEYS: ids, messages, early. ARGV: ttl, size, id, created_at ms ('' when unknown),
+# json (no json removes it)
+_CHANGE = """
+if redis.call('EXISTS', KEYS[2]) == 0 then
+    return
+end
+redis.call('HINCRBY', KEYS[2], ':version', 1)
+local id, score, json = ARGV[3], ARGV[4], ARGV[5]
+if redis.call('ZSCORE', KEYS[1], id) then
+    if json == nil then
+        redis.call('ZREM', KEYS[1], id)
+        redis.call('HDEL', KEYS[2], id)
+    else
+        redis.call('HSET', KEYS[2], id, json)
+    end
+elseif score ~= '' then
+    -- not cached. if it belongs in the window its create hasn't been applied yet
+    local size = tonumber(ARGV[2])
+    local oldest = redis.call('ZRANGE', KEYS[1], 0, 0, 'WITHSCORES')
+    if #oldest == 0 or redis.call('ZCARD', KEYS[1]) < size
+        or tonumber(score) >= tonumber(oldest[2]) then
+        redis.call('ZADD', KEYS[3], score, id)
+        redis.call('HSET', KEYS[2], '~' .. id, json or '')
+        local extra = redis.call('ZRANGE', KEYS[3], 0, -(size + 1))
+        for _, old in ipairs(extra) do
+            redis.call('HDEL', KEYS[2], '~' .. old)
+        end
+        redis.call('ZREMRANGEBYRANK', KEYS[3], 0, -(size + 1))
+    end
+    redis.call('EXPIRE', KEYS[3], ARGV[1])
+end
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+redis.call('EXPIRE', KEYS[2], ARGV[1])
+"""
+
+_scripts = {}
+
+hits = 0
+misses = 0
+
+
+def _keys(channel_id: str) -> list[str]:
+    key = f"{getenv('ENV')}-history:{channel_id}"
+    return [key, f"{key}:messages", f"{key}:early"]
+
+
+async def _run(script: str, channel_id: str, *args):
+    client = kv.get_client()
+    if script not in _scripts:
+        _scripts[script] = client.register_script(script)
+    return await _scripts[script](keys=_keys(channel_id), args=args, client=client)
+
+
+def _ms(created_at: str) -> int:
+    return int(datetime.fromisoformat(created_at).timestamp() * 1000)
+
+
+def _entry(message: dict) -> tuple:
+    return message["id"], _ms(message["created_at"]), jsoncodec.dumps(message)
+
+
+async def get_page(channel_id: str, limit: int) -> Optional[bytes]:
+    """
+    the newest `limit` messages as a json array, ready to send. None when the
+    channel isn't cached (or not enough of it)
+    """
+    global hits, misses
+    try:
+        encoded = await _run(_READ, channel_id, limit)
+    except Exception as e:
+        logging.error(f"history cache read failed: {e}")
+        encoded = None
+
+    if encoded is None or None in encoded:
+        misses += 1
+        return None
+    hits += 1
+    return b"[" + b",".join(encoded) + b"]"
+
+
+async def fill(
+    channel_id: str, load: Callable[[int], Awaitable[list[dict]]]
+) -> list[dict]:
+    """
+    `load` the newest HISTORY_CACHE_SIZE messages (serialized, newest first) from
+    mongo, cache them and hand them back
+    """
+    messages_key = _keys(channel_id)[1]
+    try:
+        # marks the channel as filling first, so new messages from here on get added
+        pipe = kv.get_client().pipeline(transaction=True)
+        pipe.hincrby(messages_key, ":version", 0)
+        pipe.expire(messages_key, HISTORY_CACHE_TTL_SEC)
+        version, _ = await pipe.execute()
+    except Exception as e:
+        logging.error(f"history cache read failed: {e}")
+        return await load(HISTORY_CACHE_SIZE)
+
+    messages = await load(HISTORY_CACHE_SIZE)
+    args = []
+    for message in messages:
+        args.extend(_entry(message))
+    try:
+        await _run(
+            _ADD,
+            channel_id,
+            HISTORY_CACHE_SIZE,
+            HISTORY_CACHE_TTL_SEC,
+            "all" if len(messages) < HISTORY_CACHE_SIZE else "some",
+            version,
+            *args,
+        )
+    except Exception as e:
+        logging.error(f"history cache write failed: {e}")
+    return messages
+
+
+async def apply(
+    event: MessageCreated | MessageUpdated | MessageDeleted,
+):
+    """
+    keep cached history in step with a message event. events can be applied in any
+    order, see the top of this module
+    """
+    try:
+        if isinstance(event, MessageCreated):
+            await _run(
+                _ADD,
+                event.message["channel_id"],
+                HISTORY_CACHE_SIZE,
+                HISTORY_CACHE_TTL_SEC,
+                "",
+                "",
+                *_entry(event.message),
+            )
+        elif isinstance(event, MessageUpdated):
+            await _run(
+                _CHANGE,
+                event.message["channel_id"],
+                HISTORY_CACHE_TTL_SEC,
+                HISTORY_CACHE_SIZE,
+                event.message["id"],
+                _ms(event.message["created_at"]),
+                jsoncodec.dumps(event.message),
+            )
+        else:
+            # only snowflakes say when they were made, legacy messages are all far
+            # older than anything that could still be on its way
+            created_at = (
+                int(utils.snowflake_time(event.message_id).timestamp() * 1000)
+                if utils.is_snowflake(event.message_id)
+                else ""
+            )
+            await _run(
+                _CHANGE,
+                event.channel_id,
+                HISTORY_CACHE_TTL_SEC,
+                HISTORY_CACHE_SIZE,
+                event.message_id,
+                created_at,
+            )
+    except Exception as e:
+        logging.error(f"history cache update failed: {e}")
+
+
+def stats() -> dict:
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_ratio": hits / (hits + misses) if hits + misses else 0,
+    }
@@ -0,0 +1,250 @@
+"""
+durable background work. api nodes enqueue jobs onto a redis stream and `MODE=worker`
+nodes (blueprints/worker) read them through a consumer group and run them, so the work
+survives restarts, has a concurrency limit and stays off the api event loop.
+
+a job that raises isn't acked. once it's sat pending for JOB_RETRY_AFTER_MS any worker
+claims it and runs it again, which is also how jobs held by a dead worker come back.
+after JOB_MAX_ATTEMPTS deliveries it goes to the dead letter stream instead.
+"""
+
+import asyncio
+import logging
+import os
+import socket
+from dataclasses import dataclass
+from os import getenv
+from typing import Any, Awaitable, Callable
+
+from redis.exceptions import ResponseError
+
+from modules import jsoncodec, kv
+from modules.cache import TTLCache
+from modules.utils import dataclass_from_dict
+
+STREAM = "jobs"
+GROUP = "workers"
+DEAD_STREAM = "jobs-dead"
+
+# only the newest dead jobs are kept around to look at
+DEAD_MAX_LEN = int(getenv("JOB_DEAD_MAX_LEN", "10000"))
+
+
+@dataclass
+class EmbedMessage:
+    """
+    unfurl the links in a message into system embeds
+    """
+
+    message_id: str
+
+
+@dataclass
+class SendVerificationEmail:
+    email: str
+    code: str
+
+
+JOB_TYPES: dict[str, type] = {
+    job_type.__name__: job_type for job_type in (EmbedMessage, SendVerificationEmail)
+}
+
+Handler = Callable[[Any], Awaitable[None]]
+
+
+async def enqueue(job: Any) -> str:
+    """
+    queue a job (one of JOB_TYPES) for the workers, returns its stream id
+    """
+    entry_id = await kv.get_client().xadd(
+        STREAM, {"type": type(job).__name__, "data": jsoncodec.dumps(job)}
+    )
+    return entry_id.decode("utf-8") if isinstance(entry_id, bytes) else entry_id
+
+
+def _str(value: bytes | str) -> str:
+    return value.decode("utf-8") if isinstance(value, bytes) else value
+
+
+class JobWorker:
+    """
+    runs up to `concurrency` jobs at a time from the stream. `handlers` maps each job
+    type to the coroutine that does it
+    """
+
+    def __init__(
+        self,
+        handlers: dict[type, Handler],
+        *,
+        concurrency: int,
+        retry_after_ms: int,
+        max_attempts: int,
+    ):
+        self.handlers = handlers
+        self.concurrency = concurrency
+        self.retry_after_ms = retry_after_ms
+        self.max_attempts = max_attempts
+        self.consumer = f"{socket.gethostname()}-{os.getpid()}"
+        self._running: set[asyncio.Task] = set()
+        self._loops: list[asyncio.Task] = []
+        # last error per entry, so whatever ends up dead says why
+        self._errors = TTLCache(maxsize=10000, ttl=3600)
+
+        self.done = 0
+        self.failed = 0
+        self.retried = 0
+        self.dead = 0
+
+    async def start(self):
+        try:
+            # from 0, so jobs queued before the first worker ever started still run
+            await kv.get_client().xgroup_create(STREAM, GROUP, id="0", mkstream=True)
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+        self._loops = [
+            asyncio.create_task(self._read_loop()),
+            asyncio.create_task(self._reclaim_loop()),
+        ]
+        logging.info(f"job worker {self.consumer} started")
+
+    async def stop(self, timeout: float = 30):
+        for loop in self._loops:
+            loop.cancel()
+        # anything that doesn't finish in time stays pending and gets reclaimed
+        if self._running:
+            await asyncio.wait(self._running, timeout=timeout)
+
+        client = kv.get_client()
+        try:
+            # consumers are per process, don't let the group collect dead ones. only
+            # safe when we hold nothing, deleting a consumer drops its pending jobs
+            if not await client.xpending_range(
+                STREAM, GROUP, min="-", max="+", count=1, consumername=self.consumer
+            ):
+                await client.xgroup_delconsumer(STREAM, GROUP, self.consumer)
+        except Exception as e:
+            logging.error(f"failed to remove job consumer {self.consumer}: {e}")
+
+    def _spawn(self, entry_id: bytes, fields: dict):
+        task = asyncio.create_task(self._run(entry_id, fields))
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+    async def _read_loop(self):
+        client = kv.get_client()
+        while True:
+            try:
+                if (free := self.concurrency - len(self._running)) <= 0:
+                    await asyncio.wait(
+                        self._running, return_when=asyncio.FIRST_COMPLETED
+                    )
+                    continue
+
+                read = await client.xreadgroup(
+                    GROUP, self.consumer, {STREAM: ">"}, count=free, block=5000
+                )
+                for _, entries in read or []:
+                    for entry_id, fields in entries:
+                        self._spawn(entry_id, fields)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"error reading jobs: {e}")
+                await asyncio.sleep(1)
+
+    async def _reclaim_loop(self):
+        while True:
+            await asyncio.sleep(self.retry_after_ms / 1000)
+            try:
+                await self._reclaim()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"error reclaiming jobs: {e}")
+
+    async def _reclaim(self):
+        client = kv.get_client()
+        stale = await client.xpending_range(
+            STREAM, GROUP, min="-", max="+", count=100, idle=self.retry_after_ms
+        )
+        for pending in stale:
+            if len(self._running) >= self.concurrency:
+                return
+
+            # min idle again, so two workers can't both take it
+            claimed = await client.xclaim(
+                STREAM,
+                GROUP,
+                self.consumer,
+                self.retry_after_ms,
+                [pending["message_id"]],
+            )
+            if not claimed:
+                continue
+
+            entry_id, fields = claimed[0]
+            if not fields:
+                # deleted from the stream out from under us, nothing left to run
+                await client.xack(STREAM, GROUP, entry_id)
+                continue
+
+            if pending["times_delivered"] >= self.max_attempts:
+                await self._bury(entry_id, fields, pending["times_delivered"])
+            else:
+                self.retried += 1
+                self._spawn(entry_id, fields)
+
+    async def _run(self, entry_id: bytes, fields: dict):
+        name = _str(fields.get(b"type", b""))
+        try:
+            if (job_type := JOB_TYPES.get(name)) not in self.handlers:
+                raise LookupError(f"no handler for job type {name!r}")
+            job = dataclass_from_dict(job_type, jsoncodec.loads(fields[b"data"]))
+            await self.handlers[job_type](job)
+        except Exception as e:
+            self.failed += 1
+            self._errors.set(entry_id, f"{type(e).__name__}: {e}")
+            logging.error(f"job {name} {_str(entry_id)} failed: {e}")
+            return
+
+        await self._finish(entry_id)
+        self.done += 1
+
+    async def _finish(self, entry_id: bytes, *dead: dict):
+        pipe = kv.get_client().pipeline(transaction=True)
+        for fields in dead:
+            pipe.xadd(DEAD_STREAM, fields, maxlen=DEAD_MAX_LEN, approximate=True)
+        pipe.xack(STREAM, GROUP, entry_id)
+        # done with it, no reason to keep it in the stream
+        pipe.xdel(STREAM, entry_id)
+        await pipe.execute()
+        self._errors.pop(entry_id)
+
+    async def _bury(self, entry_id: bytes, fields: dict, attempts: int):
+        error = self._errors.get(entry_id, "unknown, failed on another worker")
+        logging.error(
+            f"job {_str(fields.get(b'type', b''))} {_str(entry_id)} gave up after"
+            f" {attempts} attempts: {error}"
+        )
+        await self._finish(
+            entry_id,
+            {
+                **fields,
+                b"id": entry_id,
+                b"attempts": attempts,
+                b"error": error,
+            },
+        )
+        self.dead += 1
+
+    def stats(self) -> dict:
+        return {
+            "consumer": self.consumer,
+            "running": len(self._running),
+            "done": self.done,
+            "failed": self.failed,
+            "retried": self.retried,
+            "dead": self.dead,
+        }
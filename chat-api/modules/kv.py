@@ -1,3 +1,4 @@
+import asyncio
 import sanic
 from os import getenv
 import redis.asyncio as redis
@@ -7,9 +8,22 @@ from redis.commands.search.query import Query
 from redis.commands.search.field import TextField, VectorField
 import aiohttp
 import logging
+import os
+import socket
+import time
+from typing import Callable
+from modules import jsoncodec, payloads, utils
 
 client = None
 
+# pub/sub channel for events that should never land in the replayable stream
+EPHEMERAL_CHANNEL = "ephemeral-events"
+
+# how long events stay replayable. time based so a busy hour can't eat the window
+EVENT_RETENTION_SEC = int(getenv("EVENT_RETENTION_SEC", str(60 * 60 * 6)))
+# and a hard cap on top, so a flood can't grow the stream without bound in that window
+EVENT_STREAM_MAX_LEN = int(getenv("EVENT_STREAM_MAX_LEN", "1000000"))
+
 # fields
 id = TextField("id")
 type = TextField("type")
@@ -119,14 +133,260 @@ async def reconfigure_index():
     await create_fields()
 
 
-async def publish(payload: dict):
-    logging.info(f" ---> PUBLISHING EVENT: {payload.get('t')}")
-    return await client.xadd(
-        "events",
-        payload,
-        maxlen=100_000,
-        approximate=True,
-    )
+def _retention_cutoff_ms() -> int:
+    return int(time.time() * 1000) - (EVENT_RETENTION_SEC * 1000)
+
+
+class StreamPublisher:
+    """
+    buffers events for a few ms (or until `max_batch` pile up) and writes them to the
+    stream in one pipeline, instead of one XADD round trip per event.
+    flushes are serialized so stream order is the same as publish order. a batch
+    redis didn't take is retried `max_retries` times, backing off from
+    `retry_delay_ms`, before it's dropped.
+    """
+
+    def __init__(
+        self,
+        stream: str,
+        *,
+        max_batch: int,
+        max_delay_ms: int,
+        max_retries: int = 3,
+        retry_delay_ms: int = 50,
+    ):
+        self.stream = stream
+        self.max_batch = max_batch
+        self.max_delay_ms = max_delay_ms
+        self.max_retries = max_retries
+        self.retry_delay_ms = retry_delay_ms
+        self._buffer: list[dict] = []
+        self._timer: asyncio.TimerHandle | None = None
+        self._lock = asyncio.Lock()
+
+        self.batches = 0
+        self.events = 0
+        self.errors = 0
+        self.retries = 0
+        self.max_batch_size = 0
+        self.last_batch_size = 0
+        self.flush_ms_total = 0.0
+        self.flush_ms_max = 0.0
+
+    def publish(self, payload: dict):
+        logging.info(f" ---> PUBLISHING EVENT: {payload.get('t')}")
+        self._buffer.append(payload)
+
+        if len(self._buffer) >= self.max_batch:
+            self._schedule(0)
+        elif self._timer is None:
+            self._schedule(self.max_delay_ms / 1000)
+
+    def _schedule(self, delay: float):
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = asyncio.get_running_loop().call_later(
+            delay, lambda: asyncio.create_task(self.flush())
+        )
+
+    async def flush(self):
+        async with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+            attempts = 0
+            while self._buffer:
+                batch = self._buffer[: self.max_batch]
+                del self._buffer[: self.max_batch]
+                if await self._write(batch):
+                    attempts = 0
+                elif attempts < self.max_retries:
+                    # back in front so order holds, new events queue up behind it. a
+                    # batch that partly landed goes out again, a few events twice
+                    # beats a gap nobody can see
+                    self._buffer[:0] = batch
+                    self.retries += 1
+                    await asyncio.sleep(self.retry_delay_ms / 1000 * 2**attempts)
+                    attempts += 1
+                else:
+                    self.errors += 1
+                    logging.error(
+                        f"dropping {len(batch)} events after {attempts} retries"
+                    )
+                    attempts = 0
+
+    async def _write(self, batch: list[dict]) -> bool:
+        start = time.perf_counter()
+        pipe = client.pipeline(transaction=False)
+        for i, payload in enumerate(batch):
+            # trimming once per batch is plenty
+            last = i == len(batch) - 1
+            pipe.xadd(
+                self.stream,
+                payload,
+                minid=_retention_cutoff_ms() if last else None,
+                approximate=True,
+            )
+        # xadd takes minid or maxlen, not both
+        pipe.xtrim(self.stream, maxlen=EVENT_STREAM_MAX_LEN, approximate=True)
+
+        try:
+            await pipe.execute()
+        except Exception as e:
+            logging.error(f"failed to publish {len(batch)} events: {e}")
+            return False
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self.batches += 1
+        self.events += len(batch)
+        self.last_batch_size = len(batch)
+        self.max_batch_size = max(self.max_batch_size, len(batch))
+        self.flush_ms_total += elapsed_ms
+        self.flush_ms_max = max(self.flush_ms_max, elapsed_ms)
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "events": self.events,
+            "errors": self.errors,
+            "retries": self.retries,
+            "pending": len(self._buffer),
+            "last_batch_size": self.last_batch_size,
+            "max_batch_size": self.max_batch_size,
+            "avg_batch_size": self.events / self.batches if self.batches else 0,
+            "avg_flush_ms": self.flush_ms_total / self.batches if self.batches else 0,
+            "max_flush_ms": self.flush_ms_max,
+        }
+
+
+publisher = StreamPublisher(
+    "events",
+    max_batch=int(getenv("PUBLISH_MAX_BATCH", "100")),
+    max_delay_ms=int(getenv("PUBLISH_MAX_DELAY_MS", "5")),
+    max_retries=int(getenv("PUBLISH_MAX_RETRIES", "3")),
+    retry_delay_ms=int(getenv("PUBLISH_RETRY_DELAY_MS", "50")),
+)
+
+
+def publish(payload: dict):
+    publisher.publish(payload)
+
+
+def _stream_id_ms(stream_id: bytes | str | None) -> int:
+    if not stream_id:
+        return 0
+    if isinstance(stream_id, bytes):
+        stream_id = stream_id.decode("utf-8")
+    return int(stream_id.split("-", 1)[0])
+
+
+async def events_trimmed_before() -> int:
+    """
+    ms timestamp that replay is complete from. anything older may have been trimmed
+    """
+    try:
+        info = await client.xinfo_stream("events")
+    except ResponseError:
+        # no stream yet, nothing was ever trimmed
+        return 0
+
+    # redis 7+ tracks the newest id it ever dropped, which is exactly the gap edge
+    if (max_deleted := info.get("max-deleted-entry-id")) is not None:
+        return _stream_id_ms(max_deleted)
+
+    # older redis: approximate trimming only drops stuff past the cutoff, unless the
+    # stream is at its cap and then the oldest entry left is the edge
+    if info["length"] >= EVENT_STREAM_MAX_LEN and info.get("first-entry"):
+        return max(_retention_cutoff_ms(), _stream_id_ms(info["first-entry"][0]))
+    return _retention_cutoff_ms()
+
+
+async def publish_ephemeral(payload: dict):
+    # fire and forget, nobody replays these so a node that isn't listening just misses it
+    return await client.publish(EPHEMERAL_CHANNEL, jsoncodec.dumps(payload))
+
+
+async def invalidation_listener(
+    channel: str, drop: Callable[[str], None], reset: Callable[[], None]
+):
+    """
+    calls `drop` with every key published on `channel`, for in-process caches that
+    have to forget things when another node changes them. anything published while
+    we weren't subscribed is lost, so `reset` throws the whole cache away
+    """
+    pubsub = get_client().pubsub(ignore_subscribe_messages=True)
+    try:
+        await pubsub.subscribe(channel)
+        async for message in pubsub.listen():
+            if message.get("type") != "message":
+                continue
+            key = message["data"]
+            drop(key.decode("utf-8") if isinstance(key, bytes) else key)
+    except Exception as e:
+        logging.error(f"error listening for invalidations on {channel}: {e}")
+
+    finally:
+        await pubsub.aclose()
+        reset()
+        asyncio.create_task(invalidation_listener(channel, drop, reset))
+
+
+async def debounce(key: str, window_ms: int) -> bool:
+    """
+    returns True only for the first call for `key` inside the window (shared across nodes)
+    """
+    return bool(await client.set(key, 1, nx=True, px=window_ms))
+
+
+# snowflake worker ids (modules.utils) are leased per process, with a ttl so a crashed
+# process gives its id back
+WORKER_LEASE_SEC = int(getenv("WORKER_LEASE_SEC", "60"))
+
+# KEYS: lease. ARGV: owner, ttl
+_RENEW_LEASE = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+
+def _lease_key(worker_id: int) -> str:
+    return f"{getenv('ENV')}-snowflake-worker:{worker_id}"
+
+
+async def lease_worker_id() -> tuple[int, str]:
+    """
+    claim a snowflake worker id nobody else holds and start using it
+    """
+    owner = f"{socket.gethostname()}:{os.getpid()}:{utils.generate_id()}"
+    # start past the last one handed out, so processes don't all probe from 0
+    start = await client.incr(f"{getenv('ENV')}-snowflake-worker-next")
+    for i in range(utils.SNOWFLAKE_WORKERS):
+        worker_id = (start + i) % utils.SNOWFLAKE_WORKERS
+        if await client.set(_lease_key(worker_id), owner, nx=True, ex=WORKER_LEASE_SEC):
+            utils.set_worker_id(worker_id)
+            logging.info(f"leased snowflake worker id {worker_id}")
+            return worker_id, owner
+    raise RuntimeError("every snowflake worker id is leased")
+
+
+async def _keep_worker_lease(worker_id: int, owner: str):
+    renew = client.register_script(_RENEW_LEASE)
+    while True:
+        await asyncio.sleep(WORKER_LEASE_SEC / 3)
+        try:
+            if not await renew(
+                keys=[_lease_key(worker_id)], args=[owner, WORKER_LEASE_SEC]
+            ):
+                # expired under us (redis restart, a long stall), it might be someone
+                # else's by now. take a fresh one
+                logging.error(f"lost snowflake worker id {worker_id}, leasing another")
+                worker_id, owner = await lease_worker_id()
+        except Exception as e:
+            logging.error(f"failed to renew snowflake worker lease: {e}")
 
 
 def get_client():
@@ -141,5 +401,11 @@ async def init():
     client = redis.from_url(getenv("REDIS_URL"))
     logging.info("Connected to Redis")
 
+    asyncio.create_task(_keep_worker_lease(*await lease_worker_id()))
+
+    # every mode publishes (workers send unfurl updates), so every mode registers the
+    # dictionary it packs with. gateways on other builds fetch it from here
+    await client.hsetnx(payloads.DICT_KEY, payloads.DICT_ID, payloads.DICT_CONTENT)
+
     if getenv("MODE") == "api":
         await create_fields()
@@ -3,6 +3,7 @@ from typing import Iterable
 
 from beanie.operators import In
 
+from modules.acl import ChannelAccess
 from modules.db import Channel, ChannelMember, User
 
 
@@ -31,7 +32,7 @@ def extract_mention_usernames(content: str) -> list[str]:
 
 
 async def resolve_mentions_for_channel(
-    channel: Channel, usernames: Iterable[str]
+    channel: Channel | ChannelAccess, usernames: Iterable[str]
 ) -> list[str]:
     usernames = [u for u in usernames if u]
     if not usernames:
@@ -0,0 +1,172 @@
+"""
+compact encoding for event payloads stored in the redis stream.
+
+payloads are compressed with zstd against a raw-content dictionary built from our own
+event types (every field name and enum value we emit), so even a tiny TYPING_STARTED
+sized event shrinks instead of growing. the dictionary is stored in redis by id, so a
+gateway running a different build can still decode entries during a rolling deploy.
+"""
+
+import enum
+import types
+import zlib
+from dataclasses import fields, is_dataclass
+from datetime import datetime
+from typing import Union, get_args, get_origin, get_type_hints
+
+from chat_types import events as _events
+from chat_types import models as _models
+from modules import jsoncodec
+
+try:
+    # python 3.14+
+    from compression import zstd as _zstd
+except ImportError:
+    _zstd = None
+
+try:
+    import zstandard as _zstandard
+except ImportError:
+    _zstandard = None
+
+DICT_KEY = "event-dicts"
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 3
+
+
+def _sample(tp, depth: int = 0):
+    # fake instance of a type, good enough to show the dictionary what our json looks like
+    origin = get_origin(tp)
+    args = get_args(tp)
+
+    if origin is Union or isinstance(tp, types.UnionType):
+        non_none = [a for a in args if a is not type(None)]
+        return _sample(non_none[0], depth) if non_none else None
+    if origin is list:
+        return [_sample(args[0], depth)] if args else []
+    if is_dataclass(tp):
+        if depth > 3:
+            return None
+        hints = get_type_hints(tp)
+        return {f.name: _sample(hints[f.name], depth + 1) for f in fields(tp)}
+    if isinstance(tp, type) and issubclass(tp, enum.Enum):
+        return next(iter(tp)).value
+    if tp is datetime:
+        return "2025-01-01T00:00:00.000000Z"
+    if tp is bool:
+        return False
+    if tp in (int, float):
+        return 0
+    return ""
+
+
+def _build_dictionary() -> bytes:
+    parts: list[str] = []
+
+    for mod in (_models, _events):
+        for obj in vars(mod).values():
+            if isinstance(obj, type) and issubclass(obj, enum.Enum):
+                parts.extend(f'"{m.value}"' for m in obj)
+
+    # zstd likes the most useful content at the end of the dictionary
+    for obj in vars(_events).values():
+        if is_dataclass(obj):
+            parts.append(jsoncodec.dumps(_sample(obj)))
+
+    return "".join(parts).encode("utf-8")
+
+
+DICT_CONTENT = _build_dictionary()
+DICT_ID = format(zlib.crc32(DICT_CONTENT), "08x")
+
+
+def _zlib_codec(content: bytes):
+    def compress(data: bytes) -> bytes:
+        c = zlib.compressobj(ZLIB_LEVEL, zdict=content)
+        return c.compress(data) + c.flush()
+
+    def decompress(data: bytes) -> bytes:
+        d = zlib.decompressobj(zdict=content)
+        return d.decompress(data) + d.flush()
+
+    return compress, decompress
+
+
+def _zstd_codec(content: bytes):
+    if _zstd is not None:
+        zd = _zstd.ZstdDict(content, is_raw=True)
+        return (
+            lambda data: _zstd.compress(data, level=ZSTD_LEVEL, zstd_dict=zd),
+            lambda data: _zstd.decompress(data, zstd_dict=zd),
+        )
+
+    zd = _zstandard.ZstdCompressionDict(
+        content, dict_type=_zstandard.DICT_TYPE_RAWCONTENT
+    )
+    compressor = _zstandard.ZstdCompressor(level=ZSTD_LEVEL, dict_data=zd)
+    decompressor = _zstandard.ZstdDecompressor(dict_data=zd)
+    return compressor.compress, decompressor.decompress
+
+
+CODEC = "zstd" if (_zstd is not None or _zstandard is not None) else "zlib"
+_CODEC_FACTORIES = {"zlib": _zlib_codec}
+if CODEC == "zstd":
+    _CODEC_FACTORIES["zstd"] = _zstd_codec
+
+_dictionaries: dict[str, bytes] = {DICT_ID: DICT_CONTENT}
+_codecs: dict[str, tuple] = {}
+
+
+class UnsupportedCodec(ValueError):
+    """
+    an entry packed with a codec this node can't decode
+    """
+
+
+class UnknownDictionary(UnsupportedCodec):
+    """
+    an entry packed against a dictionary nobody registered (see kv.init)
+    """
+
+
+def _codec(tag: str):
+    if tag not in _codecs:
+        name, dict_id = tag.split(":", 1)
+        if (factory := _CODEC_FACTORIES.get(name)) is None:
+            # zstandard is a dependency below 3.14, this is a broken install
+            raise UnsupportedCodec(f"this node can't decode {name} payloads")
+        if (content := _dictionaries.get(dict_id)) is None:
+            raise UnknownDictionary(f"unknown event dictionary {dict_id}")
+        _codecs[tag] = factory(content)
+    return _codecs[tag]
+
+
+TAG = f"{CODEC}:{DICT_ID}"
+
+
+def pack(text: str) -> dict:
+    """
+    stream fields for a json payload
+    """
+    return {"d": _codec(TAG)[0](text.encode("utf-8")), "c": TAG}
+
+
+def missing_dictionary(tag: str | None) -> str | None:
+    """
+    id of the dictionary needed to unpack `tag` if we don't have it yet
+    """
+    if not tag:
+        return None
+    dict_id = tag.split(":", 1)[1]
+    return None if dict_id in _dictionaries else dict_id
+
+
+def add_dictionary(dict_id: str, content: bytes):
+    _dictionaries[dict_id] = content
+
+
+def unpack(data: bytes, tag: str | None) -> str:
+    # entries from before compression have no tag and are plain json
+    if not tag:
+        return data.decode("utf-8")
+    return _codec(tag)[1](data).decode("utf-8")
@@ -1,34 +1,93 @@
 from __future__ import annotations
 
-from typing import Iterable, Optional
+import types
+from os import getenv
+from dataclasses import fields
+from datetime import datetime
+from enum import Enum
+from typing import Callable, Iterable, Optional, Union, get_args, get_origin
 
 from beanie.operators import In
+from pydantic import BaseModel
 
+from chat_types.models import Author as ApiAuthor
 from chat_types.models import File as ApiFile
 from chat_types.models import Message as ApiMessage
-from modules import utils
+from modules import jsoncodec, utils
+from modules.cache import BytesLRU
 from modules.db import Message as DbMessage
-from modules.db import StoredFile
+from modules.db import StoredFile, User as DbUser, api_fields
+from modules.etag import AUTHOR_VERSION
+
+
+def _iso(value: Optional[datetime]) -> Optional[str]:
+    return None if value is None else jsoncodec.iso(value)
+
+
+def _enum_value(value):
+    return value.value if isinstance(value, Enum) else value
+
+
+def _copy_list(value):
+    return None if value is None else list(value)
+
+
+def _converter(annotation) -> Optional[Callable]:
+    if get_origin(annotation) is Union or isinstance(annotation, types.UnionType):
+        annotation = next(a for a in get_args(annotation) if a is not type(None))
+    if get_origin(annotation) is list:
+        return _copy_list
+    if annotation is datetime:
+        return _iso
+    if isinstance(annotation, type) and issubclass(annotation, Enum):
+        return _enum_value
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return utils.jsonable
+    return None
+
+
+# worked out once at import instead of per message: every api field the db document
+# has, and how to turn it into json. embeds and files are built separately below
+_MESSAGE_PLAN: tuple[tuple[str, Optional[Callable]], ...] = tuple(
+    (f.name, _converter(DbMessage.model_fields[f.name].annotation))
+    for f in fields(ApiMessage)
+    if f.name in DbMessage.model_fields
+)
+_FILE_FIELDS = tuple(
+    f.name for f in fields(ApiFile) if f.name in StoredFile.model_fields
+)
+
+# the projection for raw message reads (db.find_raw): the plan plus what embeds and
+# files are built from, and the version fragments are keyed by
+MESSAGE_FIELDS: tuple[str, ...] = tuple(name for name, _ in _MESSAGE_PLAN) + (
+    "file_ids",
+    "user_embeds",
+    "system_embeds",
+    "version",
+)
+
+# the projection for bulk author reads, default_status is for db.fetch_statuses
+AUTHOR_FIELDS = api_fields(ApiAuthor, DbUser) + ("default_status",)
+
+# (message id, version) -> the message's api json. a message gets a new version
+# whenever it changes, so entries never go stale, old ones just fall out of the lru.
+# authors are in here too, keyed by their etag.AUTHOR_VERSION fields
+fragments = BytesLRU(
+    maxbytes=int(getenv("FRAGMENT_CACHE_BYTES", str(64 * 1024 * 1024)))
+)
 
 
 def stored_file_to_api(file: StoredFile) -> dict:
-    return utils.dtoa(
-        ApiFile,
-        {
-            "id": file.id,
-            "name": file.name,
-            "mime_type": file.mime_type,
-            "size": file.size,
-            "url": file.url,
-        },
-    )
-
-
-def _merge_embeds(message_dump: dict) -> list[dict]:
+    values = vars(file)
+    return {name: values[name] for name in _FILE_FIELDS}
+
+
+def _embeds(values: dict) -> list[dict]:
     # embeds are split in db but the api model only wants `embeds`
-    return (message_dump.get("user_embeds") or []) + (
-        message_dump.get("system_embeds") or []
-    )
+    return [
+        embed if isinstance(embed, dict) else embed.model_dump()
+        for embed in (values["user_embeds"] or []) + (values["system_embeds"] or [])
+    ]
 
 
 async def _files_by_id(file_ids: list[str]) -> dict[str, StoredFile]:
@@ -38,40 +97,108 @@ async def _files_by_id(file_ids: list[str]) -> dict[str, StoredFile]:
     return {f.id: f for f in files}
 
 
+def _values(message: DbMessage | dict) -> dict:
+    # raw records (db.find_raw) already are the values. beanie hooks __getattribute__
+    # on documents, reading straight out of __dict__ skips that for every field
+    # (we never lazy parse documents)
+    return message if isinstance(message, dict) else vars(message)
+
+
+def _message_to_api(
+    message: DbMessage | dict, files_by_id: dict[str, StoredFile]
+) -> dict:
+    values = _values(message)
+
+    d = {}
+    for name, convert in _MESSAGE_PLAN:
+        value = values[name]
+        d[name] = convert(value) if convert else value
+
+    d["embeds"] = _embeds(values)
+    d["files"] = [
+        stored_file_to_api(files_by_id[fid])
+        for fid in values["file_ids"] or []
+        if fid in files_by_id
+    ]
+    return d
+
+
 async def message_to_api(
-    message: DbMessage,
+    message: DbMessage | dict,
     *,
     files_by_id: Optional[dict[str, StoredFile]] = None,
 ) -> dict:
-    # beanie gives us a consistent dump and it already turns nested pydantic models into dicts
-    d = message.model_dump(exclude={"deleted_at"})
-    d = utils.convert_dates_to_iso(d)
+    if files_by_id is None:
+        files_by_id = await _files_by_id(list(_values(message)["file_ids"] or []))
+    return _message_to_api(message, files_by_id)
 
-    embeds = _merge_embeds(d)
-    file_ids = list(d.get("file_ids") or [])
 
+async def messages_to_api(
+    messages: Iterable[DbMessage | dict],
+    *,
+    files_by_id: Optional[dict[str, StoredFile]] = None,
+) -> list[dict]:
+    """
+    a whole page in one go: one file lookup for every message, then a flat pass over
+    each document with the field plan above (no model_dump, no recursive walks).
+    takes documents or raw records with MESSAGE_FIELDS
+    """
+    msgs = list(messages)
     if files_by_id is None:
+        file_ids: list[str] = []
+        for m in msgs:
+            file_ids.extend(_values(m)["file_ids"] or [])
         files_by_id = await _files_by_id(file_ids)
 
-    files = [
-        stored_file_to_api(files_by_id[fid]) for fid in file_ids if fid in files_by_id
-    ]
-
-    return utils.dtoa(
-        ApiMessage,
-        {
-            **d,
-            "embeds": embeds,
-            "files": files,
-        },
-    )
+    return [_message_to_api(m, files_by_id) for m in msgs]
 
 
-async def messages_to_api(messages: Iterable[DbMessage]) -> list[dict]:
+async def messages_to_json(
+    messages: Iterable[DbMessage | dict],
+    *,
+    files_by_id: Optional[dict[str, StoredFile]] = None,
+) -> bytes:
+    """
+    messages_to_api, already encoded as a json array. messages that were encoded
+    before (same id and version) are copied out of `fragments`, only the rest get
+    their files looked up and are serialized
+    """
     msgs = list(messages)
-    file_ids: list[str] = []
-    for m in msgs:
-        file_ids.extend(m.file_ids or [])
+    encoded: list[Optional[bytes]] = []
+    missing: list[int] = []
+    for i, m in enumerate(msgs):
+        values = _values(m)
+        encoded.append(fragments.get((values["id"], values["version"])))
+        if encoded[i] is None:
+            missing.append(i)
+
+    if missing and files_by_id is None:
+        file_ids: list[str] = []
+        for i in missing:
+            file_ids.extend(_values(msgs[i])["file_ids"] or [])
+        files_by_id = await _files_by_id(file_ids)
 
-    files_by_id = await _files_by_id(file_ids)
-    return [await message_to_api(m, files_by_id=files_by_id) for m in msgs]
+    for i in missing:
+        values = _values(msgs[i])
+        encoded[i] = jsoncodec.dumpb(_message_to_api(msgs[i], files_by_id))
+        fragments.set((values["id"], values["version"]), encoded[i])
+
+    return b"[" + b",".join(encoded) + b"]"
+
+
+def authors_to_json(authors: Iterable[DbUser | dict]) -> bytes:
+    """
+    authors encoded as a json array. each is copied out of `fragments` when it was
+    encoded before at the same version, so a popular author is encoded once per change
+    """
+    encoded: list[bytes] = []
+    for author in authors:
+        values = _values(author)
+        version = repr(tuple(values.get(name) for name in AUTHOR_VERSION))
+        key = (values["id"], "author", version)
+        if (fragment := fragments.get(key)) is None:
+            fragment = jsoncodec.dumpb(utils.dtoa(ApiAuthor, author))
+            fragments.set(key, fragment)
+        encoded.append(fragment)
+
+    return b"[" + b",".join(encoded) + b"]"
@@ -0,0 +1,74 @@
+"""
+collapses identical concurrent reads into one. the first request for a key runs the
+load, every request for the same key that comes in while it's running waits for that
+result (or exception) instead of running its own query. nothing is kept once it's
+done, this isn't a cache, it just stops a spike from sending mongo N copies of the
+same query.
+
+only for loads whose result doesn't depend on who's asking. check access per request
+first, then share the part that's the same for everyone.
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Hashable, TypeVar
+
+from sanic import HTTPResponse, raw
+
+from modules import jsoncodec
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    def __init__(self):
+        self._flights: dict[Hashable, asyncio.Future] = {}
+        self.calls = 0
+        self.shared = 0
+
+    async def do(self, key: Hashable, load: Callable[[], Awaitable[T]]) -> T:
+        """
+        the result of `load`, shared with everyone asking for `key` at the same time.
+        it's handed to all of them, so it shouldn't be mutated (bytes are ideal)
+        """
+        self.calls += 1
+        if (flight := self._flights.get(key)) is None:
+            flight = asyncio.ensure_future(load())
+            self._flights[key] = flight
+            flight.add_done_callback(lambda done: self._land(key, done))
+        else:
+            self.shared += 1
+
+        # shielded, a client that hangs up doesn't cancel it for everyone else
+        return await asyncio.shield(flight)
+
+    def _land(self, key: Hashable, flight: asyncio.Future):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        # mark the exception as seen even if every waiter went away
+        if not flight.cancelled():
+            flight.exception()
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "shared": self.shared,
+            "in_flight": len(self._flights),
+            "shared_ratio": self.shared / self.calls if self.calls else 0,
+        }
+
+
+flights = SingleFlight()
+
+
+async def shared_json(
+    key: Hashable, load: Callable[[], Awaitable[Any]]
+) -> HTTPResponse:
+    """
+    a json response for `load`, which runs and is encoded once for every request
+    asking for `key` at the same time
+    """
+
+    async def encoded() -> bytes:
+        return jsoncodec.dumpb(await load())
+
+    return raw(await flights.do(key, encoded), content_type="application/json")
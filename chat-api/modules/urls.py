@@ -11,6 +11,7 @@ from bs4 import BeautifulSoup
 from chat_types.events import MessageUpdated
 from modules.events import publish_event
 from modules.serializers import message_to_api
+from modules.utils import generate_id
 
 
 _URL_RE = re.compile(r"https?://[^\s]+", re.IGNORECASE)
@@ -362,6 +363,7 @@ async def embed_message_content(message: DbMessage):
     if message.system_embeds == embeds:
         return
     message.system_embeds = embeds
+    message.version = generate_id()
     await message.save_changes()
 
     publish_event(MessageUpdated(message=await message_to_api(message)))
@@ -1,9 +1,13 @@
 from enum import Enum
 from os import getenv
-from typing import Any, Type, TypeVar
+import functools
+import os
+import socket
+import time
+import zlib
+from typing import Any, Callable, Type, TypeVar
 import types
 import aiohttp
-from attr import asdict
 from sanic import Request
 import base64
 from datetime import UTC, datetime
@@ -13,6 +17,7 @@ import logging
 from dataclasses import MISSING
 from pydantic import BaseModel, ConfigDict, Field, create_model
 from beanie import Document
+from modules import jsoncodec
 from typing import get_origin, get_args, Union, List
 import enum
 
@@ -21,18 +26,87 @@ SECRET_GENERATOR: Cuid = Cuid(length=32)
 
 T = TypeVar("T")
 
+# snowflakes: 41 bits of ms since SNOWFLAKE_EPOCH_MS, 10 bits of worker, 12 bits of sequence.
+# rendered as zero padded decimal so string order == time order, and since cuids always
+# start with a letter every snowflake sorts before every cuid
+SNOWFLAKE_EPOCH_MS = 1735689600000  # 2025-01-01
+SNOWFLAKE_WIDTH = 19
+_WORKER_BITS = 10
+_SEQUENCE_BITS = 12
+_MAX_SEQUENCE = (1 << _SEQUENCE_BITS) - 1
+SNOWFLAKE_WORKERS = 1 << _WORKER_BITS
+# every server process leases its own from redis at startup (kv.lease_worker_id), two
+# processes sharing one would hand out the same ids. this is just for scripts and
+# tests that never connect
+_worker_id = (
+    zlib.crc32(f"{socket.gethostname()}:{os.getpid()}".encode()) % SNOWFLAKE_WORKERS
+)
+
+_snowflake_last_ms = 0
+_snowflake_sequence = 0
+
 
 def generate_id():
     return CUID_GENERATOR.generate()
 
 
+def _snowflake(ms: int, worker: int, sequence: int) -> str:
+    value = ((ms - SNOWFLAKE_EPOCH_MS) << (_WORKER_BITS + _SEQUENCE_BITS)) | (
+        worker << _SEQUENCE_BITS
+    )
+    return str(value | sequence).zfill(SNOWFLAKE_WIDTH)
+
+
+def set_worker_id(worker_id: int):
+    global _worker_id
+    _worker_id = worker_id
+
+
+def generate_snowflake() -> str:
+    global _snowflake_last_ms, _snowflake_sequence
+
+    # never go backwards even if the clock does
+    ms = max(int(time.time() * 1000), _snowflake_last_ms)
+    if ms == _snowflake_last_ms:
+        _snowflake_sequence = (_snowflake_sequence + 1) & _MAX_SEQUENCE
+        if _snowflake_sequence == 0:
+            # 4096 ids in one ms, borrow the next one
+            ms += 1
+    else:
+        _snowflake_sequence = 0
+    _snowflake_last_ms = ms
+
+    return _snowflake(ms, _worker_id, _snowflake_sequence)
+
+
+def is_snowflake(id_: str) -> bool:
+    return len(id_) == SNOWFLAKE_WIDTH and id_.isdigit()
+
+
+def snowflake_time(id_: str) -> datetime:
+    ms = (int(id_) >> (_WORKER_BITS + _SEQUENCE_BITS)) + SNOWFLAKE_EPOCH_MS
+    return datetime.fromtimestamp(ms / 1000, UTC)
+
+
+def snowflake_bound(dt: datetime, *, upper: bool = False) -> str:
+    """
+    smallest (or largest) possible snowflake for the ms `dt` falls in
+    """
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=UTC)
+    ms = max(int(dt.timestamp() * 1000), SNOWFLAKE_EPOCH_MS)
+    if upper:
+        return _snowflake(ms, (1 << _WORKER_BITS) - 1, _MAX_SEQUENCE)
+    return _snowflake(ms, 0, 0)
+
+
 def generate_secret():
     return SECRET_GENERATOR.generate()
 
 
 def convert_dates_to_iso(d):
     if isinstance(d, datetime):
-        return d.isoformat() + "Z"
+        return jsoncodec.iso(d)
     if isinstance(d, list):
         return [convert_dates_to_iso(item) for item in d]
     if not isinstance(d, dict):
@@ -56,6 +130,42 @@ def convert_enums_to_strings(d):
     return d
 
 
+_SCALARS = frozenset({str, int, float, bool, type(None)})
+
+
+@functools.cache
+def _field_names(cls: type) -> tuple[str, ...]:
+    return tuple(f.name for f in fields(cls))
+
+
+def jsonable(value: Any) -> Any:
+    """
+    convert_dates_to_iso + convert_enums_to_strings in a single pass, that also turns
+    dataclasses and pydantic models into dicts. builds new containers instead of
+    editing the input in place.
+    """
+    t = type(value)
+    if t in _SCALARS:
+        return value
+    if t is dict:
+        return {k: jsonable(v) for k, v in value.items()}
+    if t is list:
+        return [jsonable(v) for v in value]
+    if isinstance(value, datetime):
+        return jsoncodec.iso(value)
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, BaseModel):
+        return jsonable(value.model_dump())
+    if is_dataclass(value):
+        return {name: jsonable(getattr(value, name)) for name in _field_names(t)}
+    if isinstance(value, dict):
+        return {k: jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [jsonable(v) for v in value]
+    return value
+
+
 def is_pydantic_model(cls) -> bool:
     try:
         return issubclass(cls, (BaseModel, Document))
@@ -64,27 +174,41 @@ def is_pydantic_model(cls) -> bool:
         return False
 
 
+@functools.cache
+def _dtoa_plan(cls: type) -> tuple[tuple[str, ...], tuple[tuple[str, Callable], ...]]:
+    # fields and @property getters of an api class, worked out once per class
+    properties = tuple(
+        (name, attr.fget)
+        for name in dir(cls)
+        if isinstance(attr := getattr(cls, name, None), property)
+    )
+    return _field_names(cls), properties
+
+
 def dtoa(cls: Type[T], data: dict | Any) -> T:
     """
     Converts a dictionary or dataclass to a dictionary using the fields of the given class.
     """
 
-    field_names = {f.name for f in fields(cls)}
+    names, properties = _dtoa_plan(cls)
+
+    if not properties and isinstance(data, BaseModel):
+        # only the fields we need, straight off the model instead of a full model_dump
+        values = vars(data)
+        return {name: jsonable(values[name]) for name in names if name in values}
+
     if is_dataclass(data):
-        data = asdict(data)
-    if "model_dump" in dir(data):
+        data = {name: getattr(data, name) for name in _field_names(type(data))}
+    elif hasattr(data, "model_dump"):
         data = data.model_dump()
     # get any @property fields
-    for k, v in data.items():
-        if hasattr(cls, k) and isinstance(getattr(cls, k), property):
-            data[k] = getattr(cls, k).fget(data)
-    data = {k: v for k, v in data.items() if k in field_names}
+    for name, fget in properties:
+        if name in data:
+            data[name] = fget(data)
 
     # make sure any datetime objects are converted to ISO strings
     # and any enums are converted to strings
-    data = convert_dates_to_iso(data)
-    data = convert_enums_to_strings(data)
-    return data
+    return {name: jsonable(data[name]) for name in names if name in data}
 
 
 def internal_auth(request: Request) -> bool:
@@ -163,70 +287,91 @@ def retry(times: int = 3):
     return decorator
 
 
-def dataclass_from_dict(klass, data):
+_DECODERS: dict[Any, Callable[[Any], Any]] = {}
+
+
+def _passthrough(data):
+    return data
+
+
+def _decoder(klass) -> Callable[[Any], Any]:
     """
-    Recursively convert a dict (or list of dicts) into a dataclass instance.
-    Handles nested dataclasses, optional fields, lists, and basic types.
+    build (once) and cache a function that turns json data into `klass`
     """
+    if (decoder := _DECODERS.get(klass)) is not None:
+        return decoder
 
-    def is_dataclass_type(cls):
-        try:
-            return hasattr(cls, "__dataclass_fields__")
-        except Exception:
-            return False
-
-    def _convert(klass, data):
-        # Handle None for Optional/Union fields
-        if data is None:
-            return None
+    origin = get_origin(klass)
+    args = get_args(klass)
 
-        origin = get_origin(klass)
-        args = get_args(klass)
+    # Handle lists
+    if origin == list or origin == List:
+        item_decoder = _decoder(args[0])
 
-        # Handle lists
-        if origin == list or origin == List:
+        def decoder(data):
+            if data is None:
+                return None
             if not isinstance(data, list):
                 raise TypeError(f"Expected list for {klass}, got {type(data)}")
-            return [_convert(args[0], item) for item in data]
+            return [item_decoder(item) for item in data]
 
-        # Handle Optionals and Unions (Optional is Union[..., NoneType])
-        if (
-            origin == Union
-            or isinstance(klass, types.UnionType)
-            or origin == types.UnionType
-        ):
-            union_args = args
-            if not union_args and hasattr(klass, "__args__"):
-                union_args = getattr(klass, "__args__", ())
-            non_none_args = [arg for arg in union_args if arg is not type(None)]
+    # Handle Optionals and Unions (Optional is Union[..., NoneType])
+    elif origin == Union or isinstance(klass, types.UnionType):
+        options = [_decoder(arg) for arg in args if arg is not type(None)]
+
+        def decoder(data):
+            if data is None:
+                return None
             # Try to build with the non-None type(s)
-            for typ in non_none_args:
+            for option in options:
                 try:
-                    return _convert(typ, data)
+                    return option(data)
                 except Exception:
                     continue
             return data  # fallback for unknown Union
 
-        # Handle dictionaries as data for dataclasses
-        if is_dataclass_type(klass) and isinstance(data, dict):
-            fld_types = {f.name: f.type for f in fields(klass)}
-            converted = {}
-            for key, val in data.items():
-                if key in fld_types:
-                    converted[key] = _convert(fld_types[key], val)
-                else:
-                    converted[key] = val  # unknown/extra field, just pass through
-            return klass(**converted)
-
-        if isinstance(klass, type) and issubclass(klass, enum.Enum):
-            if isinstance(data, klass):
+    # Handle dictionaries as data for dataclasses
+    elif isinstance(klass, type) and is_dataclass(klass):
+        # filled in after registering so self referencing types don't loop forever
+        field_decoders: dict[str, Callable] = {}
+
+        def decoder(data):
+            if not isinstance(data, dict):
+                return data
+            # unknown/extra fields just pass through
+            return klass(
+                **{
+                    key: field_decoders[key](val) if key in field_decoders else val
+                    for key, val in data.items()
+                }
+            )
+
+        _DECODERS[klass] = decoder
+        field_decoders.update({f.name: _decoder(f.type) for f in fields(klass)})
+
+    elif isinstance(klass, type) and issubclass(klass, enum.Enum):
+
+        def decoder(data):
+            if data is None or isinstance(data, klass):
                 return data
             return klass(data)
 
+    else:
         # Fallback: just return as-is
-        return data
+        decoder = _passthrough
 
-    return _convert(klass, data)
+    _DECODERS[klass] = decoder
+    return decoder
+
+
+def dataclass_from_dict(klass, data):
+    """
+    Recursively convert a dict (or list of dicts) into a dataclass instance.
+    Handles nested dataclasses, optional fields, lists, and basic types.
+    """
+    if data is None:
+        return None
+    return _decoder(klass)(data)
 
 
 class DataclassBackedModel(BaseModel):
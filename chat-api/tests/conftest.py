@@ -0,0 +1,67 @@
+from os import getenv
+from uuid import uuid4
+
+import pytest
+import redis.asyncio as redis
+from beanie import init_beanie
+
+from modules import db, kv
+
+
+@pytest.fixture
+async def redis_client(monkeypatch):
+    """
+    kv's client, on the redis at REDIS_URL when there is one and an in-process
+    fakeredis (lua scripts included) otherwise. keys are namespaced per test
+    """
+    if getenv("REDIS_URL"):
+        client = redis.from_url(getenv("REDIS_URL"))
+    else:
+        fakeredis = pytest.importorskip("fakeredis")
+        client = fakeredis.FakeAsyncRedis()
+
+    env = f"test-{uuid4().hex[:8]}"
+    monkeypatch.setenv("ENV", env)
+    monkeypatch.setattr(kv, "client", client)
+    try:
+        yield client
+    finally:
+        async for key in client.scan_iter(f"{env}-*"):
+            await client.delete(key)
+        await client.aclose()
+
+
+@pytest.fixture
+async def mongo(monkeypatch):
+    """
+    beanie set up on a throwaway database, the mongo at MONGO_URL when there is one
+    and mongomock otherwise. mongomock has no query planner, indexes aren't created
+    """
+    name = f"test-{uuid4().hex[:8]}"
+    if getenv("MONGO_URL"):
+        from motor.motor_asyncio import AsyncIOMotorClient
+
+        client = AsyncIOMotorClient(getenv("MONGO_URL"))
+    else:
+        mongomock = pytest.importorskip("mongomock")
+        mongomock_motor = pytest.importorskip("mongomock_motor")
+
+        # beanie asks for authorizedCollections, which mongomock doesn't know about
+        list_names = mongomock.database.Database.list_collection_names
+        monkeypatch.setattr(
+            mongomock.database.Database,
+            "list_collection_names",
+            lambda self, filter=None, session=None, **_: list_names(
+                self, filter, session
+            ),
+        )
+        client = mongomock_motor.AsyncMongoMockClient()
+
+    await init_beanie(
+        database=client[name], document_models=db.DOCUMENT_MODELS, skip_indexes=True
+    )
+    try:
+        yield client[name]
+    finally:
+        await client.drop_database(name)
+        client.close()
@@ -0,0 +1,81 @@
+import pytest
+from sanic import exceptions
+
+from modules import acl
+from modules.acl import ChannelAccess
+
+
+@pytest.fixture(autouse=True)
+def cached():
+    # everything below is answered from the in-process tier, no redis or mongo
+    acl._local.clear()
+    acl._local.set(
+        "channel:open", ChannelAccess(id="open", author_id="u1", private=False)
+    )
+    acl._local.set(
+        "channel:secret", ChannelAccess(id="secret", author_id="u1", private=True)
+    )
+    acl._local.set("channel:gone", None)
+    acl._local.set("public", frozenset({"open"}))
+    acl._local.set("user:u1", frozenset({"open", "secret"}))
+    acl._local.set("user:u2", frozenset({"secret"}))
+    acl._local.set("user:u3", frozenset())
+    yield
+    acl._local.clear()
+
+
+async def test_can_read():
+    assert await acl.can_read("open", "u3") is True
+    assert await acl.can_read("secret", "u1") is True
+    assert await acl.can_read("secret", "u2") is True
+    assert await acl.can_read("secret", "u3") is False
+    assert await acl.can_read("gone", "u1") is None
+
+
+async def test_require_read_raises_like_the_routes_did():
+    assert (await acl.require_read("secret", "u2")).author_id == "u1"
+
+    with pytest.raises(exceptions.NotFound):
+        await acl.require_read("gone", "u1")
+    with pytest.raises(exceptions.Forbidden):
+        await acl.require_read("secret", "u3")
+
+
+async def test_visible_channel_ids():
+    assert await acl.visible_channel_ids("u2") == {"open", "secret"}
+    assert await acl.visible_channel_ids("u3") == {"open"}
+
+
+async def test_dropped_entries_are_reloaded():
+    acl._drop("user:u2")
+    assert "user:u2" not in acl._local
+
+    generation = acl._generation
+    acl._drop("user:u3")
+    assert acl._generation == generation + 1
+
+
+async def test_fills_write_through_to_redis(redis_client):
+    async def load():
+        return ["a", "b"]
+
+    assert await acl._load_set("user:u9", load) == {"a", "b"}
+
+    stored = await redis_client.smembers(acl._redis_key("user:u9"))
+    assert stored == {b"", b"a", b"b"}
+
+
+async def test_a_fill_that_raced_a_change_isnt_written(redis_client):
+    async def load():
+        # the user joins a channel after mongo was read, before the fill is written
+        await acl.memberships_changed("u9")
+        return ["stale"]
+
+    assert await acl._load_set("user:u9", load) == {"stale"}
+    assert not await redis_client.exists(acl._redis_key("user:u9"))
+
+    async def reload():
+        return ["stale", "joined"]
+
+    assert await acl._load_set("user:u9", reload) == {"stale", "joined"}
+    assert await redis_client.exists(acl._redis_key("user:u9"))
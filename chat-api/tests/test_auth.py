@@ -0,0 +1,68 @@
+from types import SimpleNamespace
+
+import pytest
+
+from modules import auth
+from modules.db import User
+
+
+@pytest.fixture
+def loads(monkeypatch):
+    calls = []
+
+    async def _load(key, token):
+        calls.append(token)
+        return {"_id": "u1", "token": token} if token == "good" else None
+
+    monkeypatch.setattr(auth, "_load", _load)
+    # building the User needs beanie initialized, the stored dict is enough here
+    monkeypatch.setattr(auth, "parse_obj", lambda model, stored: dict(stored))
+    # beanie only adds the query fields at init
+    monkeypatch.setattr(User, "token", "token", raising=False)
+    auth._users.clear()
+    return calls
+
+
+def _request(token: str):
+    return SimpleNamespace(headers={"Authorization": token}, args={})
+
+
+async def test_token_lookups_are_cached(loads):
+    assert (await auth.authenticate(_request("good")))["_id"] == "u1"
+    assert (await auth.authenticate(_request("good")))["_id"] == "u1"
+
+    assert loads == ["good"]
+    assert "good" not in auth._users
+
+
+async def test_unknown_tokens_are_not_cached(loads):
+    assert await auth.authenticate(_request("bad")) is None
+    assert await auth.authenticate(_request("bad")) is None
+
+    assert loads == ["bad", "bad"] and len(auth._users) == 0
+
+
+async def test_invalidation_drops_the_entry(loads):
+    await auth.authenticate(_request("good"))
+    auth._drop(auth._token_key("good"))
+    await auth.authenticate(_request("good"))
+
+    assert loads == ["good", "good"]
+
+
+async def test_verifying_drops_the_cached_user(mongo, redis_client):
+    user = User(
+        id="u1",
+        username="someone",
+        password="x",
+        token="tok",
+        email="u@x.y",
+        verification_code="code",
+    )
+    await user.insert()
+    auth._users.clear()
+    assert not (await auth.authenticate(_request("tok"))).verified
+
+    assert await user.verify("code")
+
+    assert (await auth.authenticate(_request("tok"))).verified
@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+from sanic import Request, Sanic, exceptions, json
+from sanic.compat import Header
+
+from modules import auth, batch, jsoncodec
+
+app = Sanic("batch_test")
+running = {"now": 0, "most": 0}
+
+
+@app.get("/v1/things/<thing_id>")
+@auth.authorized()
+async def get_thing(request, thing_id):
+    if thing_id == "missing":
+        raise exceptions.NotFound("no thing")
+    if thing_id == "boom":
+        raise ValueError("boom")
+
+    running["now"] += 1
+    running["most"] = max(running["most"], running["now"])
+    await asyncio.sleep(0.001)
+    running["now"] -= 1
+    return json(
+        {"id": thing_id, "user": request.ctx.user["_id"], "q": request.args.get("q")},
+        headers={"ETag": '"v1"'},
+    )
+
+
+@app.get("/v1/download", ctx_streams=True)
+@auth.authorized()
+async def download(request):
+    raise AssertionError("streaming routes shouldn't run in a batch")
+
+
+@app.post("/v1/echo")
+@auth.authorized()
+async def echo(request):
+    return json(request.json)
+
+
+app.router.finalize()
+
+
+@pytest.fixture(autouse=True)
+def no_lookups(monkeypatch):
+    async def lookup(request, override_token=None):
+        raise AssertionError("batched calls shouldn't look the token up again")
+
+    monkeypatch.setattr(auth, "lookup", lookup)
+    monkeypatch.setattr(auth, "parse_obj", lambda model, stored: dict(stored))
+    running.update(now=0, most=0)
+
+
+async def _run(calls: list) -> list[dict]:
+    request = Request(
+        b"/v1/batch", Header({"authorization": "tok"}), "1.1", "POST", None, app
+    )
+    return jsoncodec.loads(await batch.run(request, calls, {"_id": "u1"}))["responses"]
+
+
+async def test_every_call_gets_its_own_status_in_order():
+    responses = await _run(
+        [
+            {"path": "/v1/things/a?q=1"},
+            {"path": "/v1/things/missing"},
+            {"method": "POST", "path": "/v1/echo", "body": {"a": 1}},
+            {"path": "/v1/things/boom"},
+            {"path": "/v1/batch"},
+            {"path": "/v1/download"},
+            "nope",
+        ]
+    )
+
+    assert [r["status"] for r in responses] == [200, 404, 200, 500, 400, 400, 400]
+    assert responses[0]["body"] == {"id": "a", "user": "u1", "q": "1"}
+    assert responses[0]["headers"]["etag"] == '"v1"'
+    assert responses[1]["body"]["message"] == "no thing"
+    assert responses[2]["body"] == {"a": 1}
+
+
+async def test_concurrency_is_capped(monkeypatch):
+    monkeypatch.setattr(batch, "BATCH_CONCURRENCY", 3)
+
+    responses = await _run([{"path": f"/v1/things/{i}"} for i in range(10)])
+
+    assert [r["body"]["id"] for r in responses] == [str(i) for i in range(10)]
+    assert running["most"] == 3
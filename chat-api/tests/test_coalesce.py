@@ -0,0 +1,90 @@
+from datetime import datetime
+
+from pymongo.errors import BulkWriteError
+
+from modules.coalesce import WriteCoalescer
+
+
+class Collection:
+    def __init__(self):
+        self.batches = []
+
+    async def bulk_write(self, requests, ordered=True):
+        self.batches.append([(r._filter, r._doc) for r in requests])
+
+
+class Model:
+    collection = Collection()
+
+    @classmethod
+    def get_pymongo_collection(cls):
+        return cls.collection
+
+
+async def test_updates_merge_into_one_write_per_document():
+    Model.collection = Collection()
+    writes = WriteCoalescer(interval_ms=60_000, max_pending=100)
+
+    for amount in (10, 20, 5):
+        writes.inc(Model, "u1", "bytes", amount)
+    writes.max(Model, "c1", "last_message_at", datetime(2025, 6, 1, 12, 31))
+    writes.max(Model, "c1", "last_message_at", datetime(2025, 6, 1, 12, 30))
+    await writes.flush()
+
+    assert Model.collection.batches == [
+        [
+            ({"_id": "u1"}, {"$inc": {"bytes": 35}}),
+            (
+                {"_id": "c1"},
+                {"$max": {"last_message_at": datetime(2025, 6, 1, 12, 31)}},
+            ),
+        ]
+    ]
+    assert writes.stats()["updates"] == 5
+    assert writes.stats()["writes"] == 2
+    assert writes.stats()["pending"] == 0
+
+
+async def test_failed_flush_keeps_only_max_for_the_next_one():
+    class Broken(Model):
+        @classmethod
+        def get_pymongo_collection(cls):
+            raise ConnectionError("mongo is down")
+
+    writes = WriteCoalescer(interval_ms=60_000, max_pending=100)
+    writes.inc(Broken, "u1", "bytes", 10)
+    writes.max(Broken, "u1", "last_seen", 7)
+    await writes.flush()
+    writes.inc(Broken, "u1", "bytes", 5)
+
+    # the 10 may have been written already, sending it again could count it twice
+    assert writes.stats()["errors"] == 1
+    assert writes.stats()["dropped"] == 1
+    assert writes._pending == {
+        (Broken, "u1"): {"$max": {"last_seen": 7}, "$inc": {"bytes": 5}}
+    }
+
+
+async def test_rejected_updates_are_dropped_after_max_retries():
+    class Rejecting(Collection):
+        async def bulk_write(self, requests, ordered=True):
+            await super().bulk_write(requests, ordered)
+            errors = [
+                {"index": i, "code": 14, "errmsg": "can't $inc a string"}
+                for i, r in enumerate(requests)
+                if r._filter["_id"] == "bad"
+            ]
+            if errors:
+                raise BulkWriteError({"writeErrors": errors})
+
+    Model.collection = Rejecting()
+    writes = WriteCoalescer(interval_ms=60_000, max_pending=100, max_retries=2)
+    writes.inc(Model, "bad", "bytes", 1)
+    writes.inc(Model, "u1", "bytes", 1)
+
+    for _ in range(3):
+        await writes.flush()
+
+    assert [len(batch) for batch in Model.collection.batches] == [2, 1, 1]
+    assert writes.stats()["dropped"] == 1
+    assert writes.stats()["pending"] == 0 and writes._failures == {}
@@ -0,0 +1,69 @@
+import json
+from datetime import datetime
+
+from chat_types.events import AuthorUpdated, MessageCreated
+from chat_types.models import Author as ApiAuthor
+from chat_types.models import MessageType, Status
+from chat_types.models.flags import Flags
+from modules import jsoncodec, utils
+
+CREATED = datetime(2025, 6, 1, 12, 30)
+
+
+def test_jsonable_converts_in_one_pass_without_touching_input():
+    data = {"at": CREATED, "status": Status.AWAY, "items": [{"type": MessageType.JOIN}]}
+
+    assert utils.jsonable(data) == {
+        "at": "2025-06-01T12:30:00Z",
+        "status": "away",
+        "items": [{"type": "join"}],
+    }
+    assert data["at"] is CREATED
+
+
+def test_dtoa_keeps_only_api_fields():
+    author = utils.dtoa(
+        ApiAuthor,
+        {"id": "u1", "username": "x", "password": "nope", "created_at": CREATED},
+    )
+
+    assert author == {"id": "u1", "username": "x", "created_at": "2025-06-01T12:30:00Z"}
+
+
+def test_event_round_trip():
+    event = AuthorUpdated(
+        author=ApiAuthor(
+            id="u1", username="x", status=Status.ONLINE, flags=Flags(admin=True)
+        )
+    )
+
+    decoded = utils.dataclass_from_dict(
+        AuthorUpdated, json.loads(json.dumps(utils.jsonable(event)))
+    )
+
+    assert decoded == event
+    assert decoded.author.status is Status.ONLINE
+
+
+def test_decoding_nested_models_and_enums():
+    decoded = utils.dataclass_from_dict(
+        MessageCreated, {"message": {"id": "m1", "type": "join", "mentions": ["u2"]}}
+    )
+
+    assert decoded.message.id == "m1"
+    assert decoded.message.type is MessageType.JOIN
+    assert decoded.message.mentions == ["u2"]
+    assert utils.dataclass_from_dict(MessageCreated, None) is None
+
+
+def test_jsoncodec_dumps_events_without_a_conversion_pass():
+    event = AuthorUpdated(
+        author=ApiAuthor(id="u1", created_at=CREATED, status=Status.AWAY)
+    )
+
+    decoded = jsoncodec.loads(jsoncodec.dumps({"t": MessageType.JOIN, "d": event}))
+
+    assert decoded["t"] == "join"
+    assert decoded["d"]["author"]["created_at"] == "2025-06-01T12:30:00Z"
+    assert decoded["d"]["author"]["status"] == "away"
+    assert decoded["d"] == utils.jsonable(event)
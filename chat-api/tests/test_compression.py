@@ -0,0 +1,62 @@
+import gzip
+from types import SimpleNamespace
+
+from sanic import HTTPResponse, json, raw
+
+from modules import compression
+from modules.compression import choose_encoding, compress_response
+
+BODY = {"messages": [{"id": str(i), "content": "hello there " * 4} for i in range(50)]}
+
+
+def _request(accept_encoding: str | None = "gzip, deflate"):
+    headers = {"accept-encoding": accept_encoding} if accept_encoding else {}
+    return SimpleNamespace(headers=headers)
+
+
+def test_choose_encoding():
+    assert choose_encoding(None) is None
+    assert choose_encoding("identity") is None
+    assert choose_encoding("deflate, gzip;q=0.5") == "gzip"
+    assert choose_encoding("gzip;q=0") is None
+    expected = "br" if compression.brotli is not None else "gzip"
+    assert choose_encoding("gzip, br") == expected
+
+
+async def test_large_json_is_gzipped_and_etag_weakened():
+    response = json(BODY, headers={"ETag": '"abc"'})
+    original = response.body
+
+    await compress_response(_request(), response)
+
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "accept-encoding"
+    assert response.headers["etag"] == 'W/"abc"'
+    assert gzip.decompress(response.body) == original
+
+
+async def test_left_alone():
+    small = json({"ok": True})
+    image = raw(b"\x89PNG" * 1000, content_type="image/png")
+    not_modified = HTTPResponse(status=304)
+    no_gzip = json(BODY)
+
+    for response in (small, image, not_modified):
+        await compress_response(_request(), response)
+        assert "content-encoding" not in response.headers
+    await compress_response(_request(None), no_gzip)
+
+    assert "content-encoding" not in no_gzip.headers
+    # still varies, a client that does take gzip would get a different body
+    assert no_gzip.headers["vary"] == "accept-encoding"
+
+
+async def test_vary_is_added_to_not_replaced():
+    cors = json(BODY, headers={"Vary": "Origin"})
+    already = json(BODY, headers={"Vary": "Accept-Encoding, Origin"})
+
+    await compress_response(_request(), cors)
+    await compress_response(_request(), already)
+
+    assert cors.headers["vary"] == "Origin, accept-encoding"
+    assert already.headers["vary"] == "Accept-Encoding, Origin"
@@ -0,0 +1,45 @@
+from types import SimpleNamespace
+
+from modules import etag, jsoncodec
+from modules.etag import CHANNEL_VERSION, conditional_json, make_etag
+
+CHANNELS = [{"id": "c1", "name": "general", "last_seq": 4, "updated_at": None}]
+
+
+def _request(if_none_match: str | None = None):
+    headers = {"If-None-Match": if_none_match} if if_none_match else {}
+    return SimpleNamespace(headers=headers)
+
+
+def test_etag_only_follows_version_fields():
+    tag = make_etag(CHANNELS, CHANNEL_VERSION)
+
+    renamed = [{**CHANNELS[0], "name": "x"}]
+    new_message = [{**CHANNELS[0], "last_seq": 5}]
+
+    assert make_etag(renamed, ("id", "name")) != make_etag(CHANNELS, ("id", "name"))
+    assert make_etag(new_message, CHANNEL_VERSION) != tag
+    assert tag.startswith('"') and tag.endswith('"')
+
+
+async def test_matching_tag_gets_304_without_building_the_body():
+    built = []
+
+    async def load():
+        return CHANNELS
+
+    def build(channels):
+        built.append(channels)
+        return channels
+
+    fresh = await conditional_json(_request(), "k", load, CHANNEL_VERSION, build)
+    tag = fresh.headers["ETag"]
+    again = await conditional_json(
+        _request(f'W/"nope", {tag}'), "k", load, CHANNEL_VERSION, build
+    )
+
+    assert fresh.status == 200 and jsoncodec.loads(fresh.body) == CHANNELS
+    assert again.status == 304 and not again.body
+    assert again.headers["ETag"] == tag
+    assert len(built) == 1
+    assert etag.matches(_request("*"), tag)
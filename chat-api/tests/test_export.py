@@ -0,0 +1,106 @@
+import gzip
+from datetime import UTC, datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+from blueprints.api import export as export_bp
+from modules import acl, jsoncodec, utils
+from modules.db import Message
+
+T0 = datetime(2026, 1, 1, tzinfo=UTC)
+
+
+def _at(minutes: int) -> datetime:
+    return T0 + timedelta(minutes=minutes)
+
+
+def _snowflake(minutes: int) -> str:
+    return utils._snowflake(int(_at(minutes).timestamp() * 1000), 0, 0)
+
+
+@pytest.fixture
+async def messages(mongo):
+    # legacy cuids don't sort by time, so they're inserted out of order on purpose
+    legacy = [("clzz", 2), ("claa", 0), ("clmm", 1)]
+    for message_id, minutes in legacy:
+        await Message(
+            id=message_id,
+            author_id="u1",
+            channel_id="c1",
+            content=message_id,
+            created_at=_at(minutes),
+        ).insert()
+    for minutes in (5, 3, 4):
+        await Message(
+            id=_snowflake(minutes),
+            author_id="u1",
+            channel_id="c1",
+            content=f"at {minutes}",
+            created_at=_at(minutes),
+        ).insert()
+    # neither of these is exported
+    await Message(
+        id=_snowflake(6), author_id="u1", channel_id="c1", deleted_at=_at(7)
+    ).insert()
+    await Message(
+        id=_snowflake(6)[:-1] + "1", author_id="u1", channel_id="c2", content="x"
+    ).insert()
+
+    return ["claa", "clmm", "clzz", _snowflake(3), _snowflake(4), _snowflake(5)]
+
+
+async def _export(**bounds) -> list[list[str]]:
+    return [
+        [record["id"] for record in batch]
+        async for batch in Message.export(
+            "c1", batch_size=2, project=("id", "created_at"), **bounds
+        )
+    ]
+
+
+async def test_legacy_then_snowflakes(messages):
+    # (mongomock's to_list ignores its length, so batch sizes aren't checked here)
+    batches = await _export()
+
+    assert [i for batch in batches for i in batch] == messages
+
+
+async def test_since_and_until_bound_both_id_ranges(messages):
+    # since is inclusive and until exclusive, in both halves
+    batches = await _export(since=_at(1), until=_at(4))
+
+    assert [i for batch in batches for i in batch] == ["clmm", "clzz", _snowflake(3)]
+
+    batches = await _export(since=_at(3), until=_at(5))
+    assert [i for batch in batches for i in batch] == [_snowflake(3), _snowflake(4)]
+
+
+async def test_export_route_streams_gzipped_ndjson(messages, monkeypatch):
+    async def require_read(channel_id, user_id):
+        return None
+
+    monkeypatch.setattr(acl, "require_read", require_read)
+    sent: list[bytes] = []
+
+    class Response:
+        async def send(self, data: bytes):
+            sent.append(data)
+
+        async def eof(self):
+            sent.append(b"<eof>")
+
+    async def respond(**kwargs):
+        assert kwargs["content_type"] == "application/gzip"
+        return Response()
+
+    request = SimpleNamespace(
+        args={"gzip": "true", "since": _snowflake(4)},
+        ctx=SimpleNamespace(user=SimpleNamespace(id="u1")),
+        respond=respond,
+    )
+    await export_bp.export_channel.__wrapped__(request, "c1")
+
+    assert sent[-1] == b"<eof>"
+    lines = gzip.decompress(b"".join(sent[:-1])).splitlines()
+    assert [jsoncodec.loads(line)["id"] for line in lines] == messages[-2:]
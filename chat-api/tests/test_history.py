@@ -0,0 +1,145 @@
+import json
+
+import pytest
+
+from chat_types.events import MessageCreated, MessageDeleted, MessageUpdated
+from modules import history, utils
+
+
+@pytest.fixture
+def cached(monkeypatch):
+    # what the read script hands back, no redis here
+    returns = {}
+
+    async def run(script, channel_id, *args):
+        return returns.get(channel_id)
+
+    monkeypatch.setattr(history, "_run", run)
+    return returns
+
+
+async def test_page_is_the_cached_json_joined(cached):
+    cached["c1"] = [b'{"id":"2"}', b'{"id":"1"}']
+    cached["empty"] = []
+
+    assert json.loads(await history.get_page("c1", 2)) == [{"id": "2"}, {"id": "1"}]
+    assert await history.get_page("empty", 50) == b"[]"
+
+
+async def test_cold_or_incomplete_pages_are_misses(cached):
+    cached["partial"] = [b'{"id":"2"}', None]
+    misses = history.misses
+
+    assert await history.get_page("cold", 50) is None
+    assert await history.get_page("partial", 2) is None
+    assert history.misses == misses + 2
+
+
+def test_entries_are_scored_by_created_at():
+    message = {"id": "m1", "channel_id": "c1", "created_at": "2025-06-01T12:30:00Z"}
+
+    entry_id, score, encoded = history._entry(message)
+
+    assert (entry_id, score) == ("m1", 1748781000000)
+    assert json.loads(encoded) == message
+
+
+# the rest run the lua scripts, on fakeredis unless there's a REDIS_URL
+
+
+def _message(n: int, content: str = "hi") -> dict:
+    return {
+        "id": f"m{n}",
+        "channel_id": "c1",
+        "content": content,
+        "created_at": f"2025-06-01T12:{n:02d}:00Z",
+    }
+
+
+async def _fill(messages: list[dict]) -> list[dict]:
+    async def load(limit):
+        return messages[:limit]
+
+    return await history.fill("c1", load)
+
+
+async def _page(limit: int) -> list[dict] | None:
+    body = await history.get_page("c1", limit)
+    return None if body is None else json.loads(body)
+
+
+async def test_filled_pages_are_served_newest_first(redis_client):
+    assert await _page(2) is None
+    await _fill([_message(3), _message(2), _message(1)])
+
+    assert [m["id"] for m in await _page(2)] == ["m3", "m2"]
+    assert [m["id"] for m in await _page(50)] == ["m3", "m2", "m1"]
+
+
+async def test_events_keep_the_page_current(redis_client):
+    await _fill([_message(2), _message(1)])
+
+    await history.apply(MessageCreated(message=_message(3)))
+    await history.apply(MessageUpdated(message=_message(2, "edited")))
+    await history.apply(MessageDeleted(message_id="m1", channel_id="c1"))
+
+    page = await _page(50)
+    assert [m["id"] for m in page] == ["m3", "m2"]
+    assert page[1]["content"] == "edited"
+
+
+async def test_a_missing_id_set_is_a_miss(redis_client):
+    await _fill([_message(1)])
+    ids_key, _, _ = history._keys("c1")
+    await redis_client.delete(ids_key)
+
+    assert await _page(1) is None
+    assert await _page(50) is None
+
+
+async def test_changes_refresh_both_keys(redis_client):
+    await _fill([_message(1)])
+    ids_key, messages_key, _ = history._keys("c1")
+    await redis_client.expire(ids_key, 5)
+    await redis_client.expire(messages_key, 5)
+
+    await history.apply(MessageUpdated(message=_message(1, "edited")))
+
+    assert await redis_client.ttl(ids_key) > 5
+    assert await redis_client.ttl(messages_key) > 5
+
+
+async def test_a_fill_that_raced_an_edit_isnt_written(redis_client):
+    async def load(limit):
+        # edited after mongo was read, before the fill is written
+        await history.apply(MessageUpdated(message=_message(1, "edited")))
+        return [_message(1)]
+
+    assert await history.fill("c1", load) == [_message(1)]
+    assert await _page(1) is None
+
+
+async def test_a_delete_before_its_create_keeps_it_deleted(redis_client):
+    await _fill([_message(1)])
+
+    # another node's delete got here first. deletes only carry the id, so only
+    # snowflakes (which say when they were made) leave a tombstone
+    message = _message(2) | {
+        "id": utils._snowflake(history._ms(_message(2)["created_at"]), 0, 0)
+    }
+    await history.apply(MessageDeleted(channel_id="c1", message_id=message["id"]))
+    await history.apply(MessageCreated(message=message))
+
+    assert [m["id"] for m in await _page(1)] == ["m1"]
+
+
+async def test_an_edit_before_its_create_is_kept(redis_client):
+    await _fill([_message(1)])
+
+    await history.apply(MessageUpdated(message=_message(2, "edited")))
+    await history.apply(MessageCreated(message=_message(2)))
+    # a create delivered twice doesn't undo the edit either
+    await history.apply(MessageCreated(message=_message(2)))
+
+    assert await _page(2) == [_message(2, "edited"), _message(1)]
+    assert await redis_client.zcard(history._keys("c1")[2]) == 0
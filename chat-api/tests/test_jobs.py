@@ -0,0 +1,89 @@
+import pytest
+
+from modules import jsoncodec, kv
+from modules.jobs import DEAD_STREAM, STREAM, EmbedMessage, JobWorker
+
+
+class Pipeline:
+    def __init__(self, calls):
+        self.calls = calls
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.calls.append((name, args))
+
+    async def execute(self):
+        pass
+
+
+class Client:
+    def __init__(self, pending=()):
+        self.calls = []
+        self.pending = list(pending)
+
+    def pipeline(self, transaction=True):
+        return Pipeline(self.calls)
+
+    async def xpending_range(self, *args, **kwargs):
+        return self.pending
+
+    async def xclaim(self, stream, group, consumer, min_idle, ids):
+        return [(ids[0], fields(EmbedMessage(message_id="m1")))]
+
+
+def fields(job) -> dict:
+    return {b"type": type(job).__name__.encode(), b"data": jsoncodec.dumps(job)}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    client = Client()
+    monkeypatch.setattr(kv, "client", client)
+    return client
+
+
+def make_worker(handler) -> JobWorker:
+    return JobWorker(
+        {EmbedMessage: handler}, concurrency=4, retry_after_ms=1000, max_attempts=3
+    )
+
+
+async def test_finished_jobs_are_acked_and_removed(client):
+    ran = []
+
+    async def handler(job):
+        ran.append(job)
+
+    worker = make_worker(handler)
+    await worker._run(b"1-0", fields(EmbedMessage(message_id="m1")))
+
+    assert ran == [EmbedMessage(message_id="m1")]
+    assert [name for name, _ in client.calls] == ["xack", "xdel"]
+    assert worker.stats()["done"] == 1
+
+
+async def test_failed_jobs_stay_pending(client):
+    async def handler(job):
+        raise ValueError("unfurl timed out")
+
+    worker = make_worker(handler)
+    await worker._run(b"1-0", fields(EmbedMessage(message_id="m1")))
+
+    assert client.calls == []
+    assert worker.stats()["failed"] == 1
+
+
+async def test_jobs_out_of_attempts_go_to_the_dead_letter_stream(client):
+    async def handler(job):
+        raise ValueError("unfurl timed out")
+
+    worker = make_worker(handler)
+    await worker._run(b"1-0", fields(EmbedMessage(message_id="m1")))
+    client.pending = [{"message_id": b"1-0", "times_delivered": 3}]
+    await worker._reclaim()
+
+    name, (stream, dead) = client.calls[0]
+    assert (name, stream) == ("xadd", DEAD_STREAM)
+    assert dead[b"error"] == "ValueError: unfurl timed out"
+    assert dead[b"attempts"] == 3
+    assert client.calls[1] == ("xack", (STREAM, "workers", b"1-0"))
+    assert worker.stats()["dead"] == 1
@@ -0,0 +1,99 @@
+import pytest
+
+from modules import kv, utils
+
+
+async def test_worker_ids_are_leased_one_per_process(redis_client):
+    first, first_owner = await kv.lease_worker_id()
+    second, _ = await kv.lease_worker_id()
+
+    assert first != second
+    assert utils._worker_id == second
+    assert await redis_client.get(kv._lease_key(first)) == first_owner.encode()
+
+
+async def test_taken_ids_are_skipped(redis_client, monkeypatch):
+    monkeypatch.setattr(utils, "SNOWFLAKE_WORKERS", 3)
+    # whatever the counter hands out next, only 2 is free
+    for worker_id in (0, 1):
+        await redis_client.set(kv._lease_key(worker_id), "someone else")
+
+    assert (await kv.lease_worker_id())[0] == 2
+    with pytest.raises(RuntimeError):
+        await kv.lease_worker_id()
+
+
+async def test_renewing_only_works_for_the_owner(redis_client):
+    worker_id, owner = await kv.lease_worker_id()
+    renew = redis_client.register_script(kv._RENEW_LEASE)
+    key = kv._lease_key(worker_id)
+
+    assert await renew(keys=[key], args=[owner, 60]) == 1
+    assert await renew(keys=[key], args=["not me", 60]) == 0
+    await redis_client.delete(key)
+    assert await renew(keys=[key], args=[owner, 60]) == 0
+
+
+async def test_the_stream_is_capped_from_the_front(redis_client, monkeypatch):
+    monkeypatch.setattr(kv, "EVENT_STREAM_MAX_LEN", 100)
+    stream = f"{kv.getenv('ENV')}-events"
+    publisher = kv.StreamPublisher(stream, max_batch=50, max_delay_ms=5)
+    for i in range(300):
+        publisher.publish({"t": "TEST", "d": str(i)})
+    await publisher.flush()
+
+    # approximate, so a real redis keeps up to a node's worth more
+    assert 100 <= await redis_client.xlen(stream) < 300
+    ((_, first),) = await redis_client.xrange(stream, count=1)
+    assert first[b"d"] != b"0"
+
+
+class Flaky:
+    """kv.client whose next `failures` pipelines fail"""
+
+    def __init__(self, client, failures: int):
+        self.client = client
+        self.failures = failures
+
+    def pipeline(self, transaction: bool):
+        pipe = self.client.pipeline(transaction=transaction)
+        if self.failures:
+            self.failures -= 1
+
+            async def execute():
+                raise ConnectionError("redis is down")
+
+            pipe.execute = execute
+        return pipe
+
+
+async def test_failed_batches_are_retried_in_order(redis_client, monkeypatch):
+    monkeypatch.setattr(kv, "client", Flaky(redis_client, failures=2))
+    stream = f"{kv.getenv('ENV')}-events"
+    publisher = kv.StreamPublisher(
+        stream, max_batch=2, max_delay_ms=5, max_retries=3, retry_delay_ms=0
+    )
+    for i in range(5):
+        publisher.publish({"t": "TEST", "d": str(i)})
+    await publisher.flush()
+
+    entries = await redis_client.xrange(stream)
+    assert [fields[b"d"] for _, fields in entries] == [b"0", b"1", b"2", b"3", b"4"]
+    assert publisher.stats()["retries"] == 2
+    assert publisher.stats()["errors"] == 0
+
+
+async def test_batches_are_dropped_after_max_retries(redis_client, monkeypatch):
+    monkeypatch.setattr(kv, "client", Flaky(redis_client, failures=2))
+    stream = f"{kv.getenv('ENV')}-events"
+    publisher = kv.StreamPublisher(
+        stream, max_batch=2, max_delay_ms=5, max_retries=1, retry_delay_ms=0
+    )
+    for i in range(3):
+        publisher.publish({"t": "TEST", "d": str(i)})
+    await publisher.flush()
+
+    entries = await redis_client.xrange(stream)
+    assert [fields[b"d"] for _, fields in entries] == [b"2"]
+    assert publisher.stats()["errors"] == 1
+    assert publisher.stats()["pending"] == 0
@@ -0,0 +1,49 @@
+import pytest
+
+from modules import events, payloads
+
+
+def test_round_trip_with_this_nodes_codec():
+    text = '{"message":{"id":"1","content":"hello there"}}'
+    packed = payloads.pack(text)
+
+    assert packed["c"] == payloads.TAG
+    assert payloads.unpack(packed["d"], packed["c"]) == text
+
+
+def test_zlib_entries_still_unpack():
+    text = '{"channel_id":"c1","user_id":"u1"}'
+    compress, _ = payloads._zlib_codec(payloads.DICT_CONTENT)
+
+    assert payloads.unpack(compress(text.encode()), f"zlib:{payloads.DICT_ID}") == text
+
+
+@pytest.mark.skipif(payloads.CODEC != "zstd", reason="needs zstd")
+def test_zstd_round_trip():
+    text = '{"author":{"id":"u1","status":"online"}}'
+    compress, _ = payloads._zstd_codec(payloads.DICT_CONTENT)
+
+    assert payloads.unpack(compress(text.encode()), f"zstd:{payloads.DICT_ID}") == text
+
+
+def test_untagged_entries_are_plain_json():
+    assert payloads.unpack(b'{"a":1}', None) == '{"a":1}'
+
+
+def test_foreign_tags():
+    assert payloads.missing_dictionary(f"zstd:{payloads.DICT_ID}") is None
+    assert payloads.missing_dictionary("zstd:deadbeef") == "deadbeef"
+
+    with pytest.raises(payloads.UnsupportedCodec):
+        payloads.unpack(b"...", f"lz4:{payloads.DICT_ID}")
+
+
+def test_unregistered_dictionaries_are_unsupported():
+    with pytest.raises(payloads.UnknownDictionary):
+        payloads.unpack(b"...", f"{payloads.CODEC}:deadbeef")
+
+
+async def test_entries_with_an_unknown_dictionary_are_skipped(redis_client):
+    fields = {b"t": b"MESSAGE_DELETED", b"d": b"...", b"c": b"zstd:deadbeef"}
+
+    assert await events._parse_or_skip(b"1-0", fields) is None
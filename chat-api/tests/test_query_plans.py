@@ -0,0 +1,217 @@
+from os import getenv
+
+import pytest
+from beanie import init_beanie
+from beanie.operators import In, Or
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from modules import db
+from modules.db import (
+    Channel,
+    ChannelInvite,
+    ChannelMember,
+    Emoji,
+    Message,
+    StoredFile,
+    User,
+    Webhook,
+)
+
+pytestmark = pytest.mark.skipif(
+    not getenv("MONGO_URL"), reason="needs a real mongo (MONGO_URL) to explain queries"
+)
+
+
+@pytest.fixture
+async def database():
+    client = AsyncIOMotorClient(getenv("MONGO_URL"))
+    database = client["query-plan-test"]
+    await init_beanie(
+        database=database, document_models=db.DOCUMENT_MODELS, skip_indexes=True
+    )
+    assert await db.ensure_indexes() == []
+
+    # explain on an empty collection is just EOF, give the planner something to look at
+    await User(id="u1", username="u", password="x", token="t", email="u@x.y").insert()
+    await Message(
+        id="m1", author_id="u1", channel_id="c1", seq=1, content="hi"
+    ).insert()
+    await Channel(id="c1", name="chan", topic="", author_id="u1").insert()
+    await ChannelMember(channel_id="c1", user_id="u1").insert()
+    await ChannelInvite(channel_id="c1", author_id="u1", code="abc").insert()
+    await Webhook(id="w1", owner_id="u1", name="hook", channel_id="c1").insert()
+    await Emoji(owner_id="u1", name="emoji", animated=False).insert()
+    await StoredFile(owner_id="u1", key="k").insert()
+
+    try:
+        yield database
+    finally:
+        await client.drop_database("query-plan-test")
+        client.close()
+
+
+def _stages(plan: dict):
+    yield plan.get("stage")
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            yield from _stages(plan[key])
+    for child in plan.get("inputStages", []):
+        yield from _stages(child)
+
+
+HOT_QUERIES = [
+    ("auth", User, lambda: User.find(User.token == "t"), None),
+    ("username", User, lambda: User.find(User.username == "u"), None),
+    ("email", User, lambda: User.find(User.email == "u@x.y"), None),
+    (
+        "login",
+        User,
+        lambda: User.find(Or(User.username == "u", User.email == "u")),
+        None,
+    ),
+    (
+        "history",
+        Message,
+        lambda: Message.find(
+            {"deleted_at": None, "channel_id": "c1", "_id": {"$lt": "a"}}
+        ),
+        [("_id", -1)],
+    ),
+    (
+        "history_after",
+        Message,
+        lambda: Message.find(
+            {"deleted_at": None, "channel_id": "c1", "_id": {"$gt": "0", "$lt": "a"}}
+        ),
+        [("_id", 1)],
+    ),
+    (
+        "history_legacy",
+        Message,
+        lambda: Message.find(
+            {"deleted_at": None, "channel_id": "c1", "_id": {"$gte": "a"}}
+        ),
+        [("created_at", -1)],
+    ),
+    (
+        "since_seq",
+        Message,
+        lambda: Message.find({"channel_id": "c1", "seq": {"$gt": 0}}),
+        [("seq", 1)],
+    ),
+    (
+        "sync_creates",
+        Message,
+        lambda: Message.find(
+            {
+                "channel_id": {"$in": ["c1"]},
+                "deleted_at": None,
+                "created_at": {"$gte": 0},
+                "$nor": [{"created_at": 0, "_id": {"$gte": "a"}}],
+            }
+        ),
+        [("created_at", 1), ("_id", -1)],
+    ),
+    (
+        "sync_edits",
+        Message,
+        lambda: Message.find(
+            {
+                "channel_id": {"$in": ["c1"]},
+                "deleted_at": None,
+                "updated_at": {"$gte": 0},
+                "$nor": [{"updated_at": 0, "_id": {"$gte": "a"}}],
+            }
+        ),
+        [("updated_at", 1), ("_id", -1)],
+    ),
+    (
+        "sync_deletes",
+        Message,
+        lambda: Message.find({"channel_id": {"$in": ["c1"]}, "deleted_at": {"$gt": 0}}),
+        [("deleted_at", 1), ("_id", -1)],
+    ),
+    (
+        "sync_members",
+        ChannelMember,
+        lambda: ChannelMember.find(
+            {"channel_id": {"$in": ["c1"]}, "created_at": {"$gt": 0}}
+        ),
+        [("created_at", 1), ("_id", -1)],
+    ),
+    (
+        "sync_authors",
+        User,
+        lambda: User.find({"_id": {"$in": ["u1"]}, "updated_at": {"$gt": 0}}),
+        [("updated_at", 1), ("_id", -1)],
+    ),
+    ("bulk_users", User, lambda: User.find(In(User.id, ["u1", "u2"])), None),
+    (
+        # ranking sorts the matches in memory, what matters is it never scans
+        "search",
+        Message,
+        lambda: Message.find(
+            {
+                "$text": {"$search": "hi"},
+                "channel_id": "c1",
+                "deleted_at": None,
+            }
+        ),
+        None,
+    ),
+    (
+        "membership",
+        ChannelMember,
+        lambda: ChannelMember.find(
+            ChannelMember.channel_id == "c1", ChannelMember.user_id == "u1"
+        ),
+        None,
+    ),
+    (
+        "user_memberships",
+        ChannelMember,
+        lambda: ChannelMember.find(ChannelMember.user_id == "u1"),
+        None,
+    ),
+    ("public_channels", Channel, lambda: Channel.find(Channel.private == False), None),
+    (
+        "authored_channels",
+        Channel,
+        lambda: Channel.find(Channel.author_id == "u1"),
+        None,
+    ),
+    (
+        "invite",
+        ChannelInvite,
+        lambda: ChannelInvite.find(ChannelInvite.code == "abc"),
+        None,
+    ),
+    (
+        "webhook",
+        Webhook,
+        lambda: Webhook.find(
+            Webhook.id == "w1", Webhook.secret == "s", Webhook.channel_id == "c1"
+        ),
+        None,
+    ),
+    (
+        "emoji_name",
+        Emoji,
+        lambda: Emoji.find(Emoji.owner_id == "u1", Emoji.name == "emoji"),
+        None,
+    ),
+]
+
+
+@pytest.mark.parametrize(
+    "name,model,query,sort", HOT_QUERIES, ids=[q[0] for q in HOT_QUERIES]
+)
+async def test_hot_query_uses_an_index(database, name, model, query, sort):
+    cursor = model.get_pymongo_collection().find(query().get_filter_query())
+    if sort:
+        cursor = cursor.sort(sort)
+
+    plan = (await cursor.explain())["queryPlanner"]["winningPlan"]
+    stages = set(_stages(plan))
+    assert "COLLSCAN" not in stages, f"{name} does a collection scan: {plan}"
+    assert "SORT" not in stages, f"{name} sorts in memory: {plan}"
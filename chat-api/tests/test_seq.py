@@ -0,0 +1,44 @@
+from datetime import UTC, datetime, timedelta
+
+from modules.db import settled_prefix
+
+NOW = datetime(2026, 1, 1, tzinfo=UTC)
+SETTLED = NOW - timedelta(seconds=30)
+
+
+def _record(seq: int, age: int) -> dict:
+    # raw records come back naive
+    created_at = (NOW - timedelta(seconds=age)).replace(tzinfo=None)
+    return {"id": f"m{seq}", "seq": seq, "created_at": created_at}
+
+
+def test_contiguous_page_is_all_settled():
+    records = [_record(4, 1), _record(5, 1), _record(6, 0)]
+
+    page, watermark = settled_prefix(records, 3, SETTLED)
+
+    assert page == records and watermark == 6
+
+
+def test_fresh_hole_stops_the_page():
+    # 5 was reserved but isn't saved yet, 6 beat it
+    records = [_record(4, 2), _record(6, 1), _record(7, 0)]
+
+    page, watermark = settled_prefix(records, 3, SETTLED)
+
+    assert [r["seq"] for r in page] == [4] and watermark == 4
+
+
+def test_hole_at_the_start_stops_everything():
+    page, watermark = settled_prefix([_record(5, 1)], 3, SETTLED)
+
+    assert page == [] and watermark == 3
+
+
+def test_old_hole_is_stepped_over():
+    # 5 was reserved before 6 was saved a minute ago, its insert failed
+    records = [_record(4, 90), _record(6, 60), _record(7, 1)]
+
+    page, watermark = settled_prefix(records, 3, SETTLED)
+
+    assert page == records and watermark == 7
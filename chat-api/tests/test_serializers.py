@@ -0,0 +1,133 @@
+from datetime import datetime
+
+from chat_types.models import MessageType, Status
+from modules.db import Author, Embed, Message, StoredFile, UserFlags, _to_records
+from modules import jsoncodec
+from modules.serializers import MESSAGE_FIELDS, fragments, message_to_api
+from modules.serializers import authors_to_json, messages_to_api, messages_to_json
+
+CREATED = datetime(2025, 6, 1, 12, 30)
+
+
+def _message(**kwargs) -> Message:
+    return Message.model_construct(
+        **{
+            "id": "0000000000000000001",
+            "type": MessageType.DEFAULT,
+            "author_id": "u1",
+            "channel_id": "c1",
+            "seq": 1,
+            "content": "hi",
+            "created_at": CREATED,
+            "updated_at": None,
+            "file_ids": [],
+            "mentions": [],
+            "user_embeds": [],
+            "system_embeds": [],
+            "author": None,
+            **kwargs,
+        }
+    )
+
+
+async def test_message_fields_are_json_ready():
+    [d] = await messages_to_api([_message(mentions=["u2"])])
+
+    assert d["type"] == "default"
+    assert d["created_at"] == "2025-06-01T12:30:00Z"
+    assert d["updated_at"] is None
+    assert d["mentions"] == ["u2"]
+    assert d["seq"] == 1
+    assert d["files"] == [] and d["embeds"] == []
+    assert d["deleted_at"] is None
+    assert "file_ids" not in d and "user_embeds" not in d
+
+
+async def test_embeds_are_merged_and_files_resolved():
+    file = StoredFile.model_construct(
+        id="f1", owner_id="u1", name="a.png", mime_type="image/png", size=3, key="k"
+    )
+    message = _message(
+        file_ids=["f1", "gone"],
+        user_embeds=[Embed(title="mine")],
+        system_embeds=[Embed(title="link", url="https://kaj.gg")],
+    )
+
+    d = await message_to_api(message, files_by_id={"f1": file})
+
+    assert [e["title"] for e in d["embeds"]] == ["mine", "link"]
+    assert d["files"] == [
+        {"id": "f1", "name": "a.png", "mime_type": "image/png", "size": 3, "url": ""}
+    ]
+
+
+async def test_webhook_author_is_converted():
+    author = Author(
+        id="w1",
+        username="hook",
+        created_at=CREATED,
+        updated_at=CREATED,
+        status=Status.ONLINE,
+        flags=UserFlags(webhook=True),
+    )
+
+    d = await message_to_api(_message(author=author), files_by_id={})
+
+    assert d["author"]["status"] == "online"
+    assert d["author"]["created_at"] == "2025-06-01T12:30:00Z"
+    assert d["author"]["flags"]["webhook"] is True
+
+
+async def test_raw_records_serialize_like_documents():
+    message = _message(seq=None, system_embeds=[Embed(title="link")])
+    # what the driver hands back for an old message: projected, `_id`, no seq/mentions
+    stored = {
+        ("_id" if k == "id" else k): v
+        for k, v in message.model_dump().items()
+        if k in MESSAGE_FIELDS and k not in ("seq", "mentions")
+    }
+
+    [record] = _to_records(Message, [stored], MESSAGE_FIELDS)
+
+    assert record["id"] == message.id and "_id" not in record
+    assert record["mentions"] == [] and record["seq"] is None
+    assert await messages_to_api([record], files_by_id={}) == await messages_to_api(
+        [message], files_by_id={}
+    )
+
+
+async def test_encoded_pages_reuse_fragments_until_the_version_changes():
+    fragments.clear()
+    page = [_message(), _message(id="0000000000000000002", content="yo")]
+
+    first = await messages_to_json(page, files_by_id={})
+    hits = fragments.hits
+    again = await messages_to_json(page, files_by_id={})
+    edited = await messages_to_json([_message(content="edited", version="v2")])
+
+    assert jsoncodec.loads(first) == await messages_to_api(page, files_by_id={})
+    assert again == first and fragments.hits == hits + 2
+    assert jsoncodec.loads(edited)[0]["content"] == "edited"
+    assert len(fragments) == 3
+
+
+def test_authors_are_encoded_once_per_version():
+    fragments.clear()
+    author = {
+        "id": "u1",
+        "username": "kaj",
+        "created_at": CREATED,
+        "updated_at": CREATED,
+        "status": Status.ONLINE,
+        "default_status": "online",
+        "bytes": 10,
+        "flags": {"admin": False, "webhook": False},
+    }
+
+    first = authors_to_json([author])
+    hits = fragments.hits
+    assert authors_to_json([author]) == first and fragments.hits == hits + 1
+
+    away = jsoncodec.loads(authors_to_json([{**author, "status": Status.AWAY}]))
+    assert jsoncodec.loads(first)[0]["status"] == "online"
+    assert away[0]["status"] == "away" and "default_status" not in away[0]
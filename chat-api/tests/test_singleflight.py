@@ -0,0 +1,60 @@
+import asyncio
+
+import pytest
+
+from modules.singleflight import SingleFlight
+
+
+async def test_concurrent_calls_share_one_load():
+    flights = SingleFlight()
+    loads = 0
+    release = asyncio.Event()
+
+    async def load():
+        nonlocal loads
+        loads += 1
+        await release.wait()
+        return b"[]"
+
+    waiting = [asyncio.create_task(flights.do("k", load)) for _ in range(5)]
+    await asyncio.sleep(0)
+    release.set()
+
+    assert await asyncio.gather(*waiting) == [b"[]"] * 5
+    assert loads == 1
+    assert flights.stats()["shared"] == 4
+    # done means gone, the next call loads again
+    assert await flights.do("k", load) == b"[]" and loads == 2
+
+
+async def test_errors_reach_every_waiter():
+    flights = SingleFlight()
+
+    async def load():
+        await asyncio.sleep(0)
+        raise LookupError("nope")
+
+    results = await asyncio.gather(
+        flights.do("k", load), flights.do("k", load), return_exceptions=True
+    )
+
+    assert [type(r) for r in results] == [LookupError, LookupError]
+
+
+async def test_one_waiter_leaving_doesnt_cancel_the_rest():
+    flights = SingleFlight()
+    release = asyncio.Event()
+
+    async def load():
+        await release.wait()
+        return 1
+
+    leaving = asyncio.create_task(flights.do("k", load))
+    staying = asyncio.create_task(flights.do("k", load))
+    await asyncio.sleep(0)
+    leaving.cancel()
+    release.set()
+
+    assert await staying == 1
+    with pytest.raises(asyncio.CancelledError):
+        await leaving
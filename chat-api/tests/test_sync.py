@@ -0,0 +1,116 @@
+from datetime import UTC, datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+from blueprints.api import sync as sync_bp
+from modules import acl, jsoncodec
+from modules.db import Channel, ChannelMember, Message, User
+
+T0 = datetime(2026, 1, 1, tzinfo=UTC)
+SINCE_MS = int((T0 - timedelta(seconds=1)).timestamp() * 1000)
+
+
+@pytest.fixture
+async def channel(mongo, redis_client, monkeypatch):
+    channel = Channel(id="c1", name="chan", topic="", author_id="u1")
+    await channel.insert()
+
+    async def get_user_channels(user_id, project=None):
+        return [channel]
+
+    monkeypatch.setattr(acl, "get_user_channels", get_user_channels)
+    return channel
+
+
+async def _sync(cursor: str, limit: int) -> dict:
+    request = SimpleNamespace(
+        args={"cursor": cursor, "limit": str(limit)},
+        ctx=SimpleNamespace(user=SimpleNamespace(id="u1")),
+    )
+    return jsoncodec.loads((await sync_bp.sync.__wrapped__(request)).body)
+
+
+async def _sync_all(limit: int) -> list[dict]:
+    pages = [await _sync(str(SINCE_MS), limit)]
+    while pages[-1]["has_more"]:
+        assert len(pages) < 50, "the cursor isn't moving"
+        pages.append(await _sync(pages[-1]["cursor"], limit))
+    return pages
+
+
+async def test_pages_through_changes_in_the_same_ms(channel):
+    # more changes in one ms than fit on a page, a ms cursor would loop or skip
+    for i in range(7):
+        await Message(
+            id=f"m{i}", author_id="u1", channel_id="c1", content="hi", created_at=T0
+        ).insert()
+    await Message(
+        id="gone",
+        author_id="u1",
+        channel_id="c1",
+        content="bye",
+        created_at=T0,
+        deleted_at=T0,
+    ).insert()
+
+    pages = await _sync_all(limit=3)
+
+    seen = [m["id"] for page in pages for m in page["messages"].get("c1", [])]
+    deleted = [i for page in pages for i in page["deleted_messages"].get("c1", [])]
+    assert sorted(seen) == [f"m{i}" for i in range(7)]
+    assert deleted == ["gone"]
+    assert all(len(page["messages"].get("c1", [])) <= 3 for page in pages)
+    assert ":" not in pages[-1]["cursor"]
+
+
+async def _user(i: int):
+    await User(
+        id=f"u{i}",
+        username=f"user{i}",
+        password="x",
+        token=f"t{i}",
+        email=f"u{i}@x.y",
+        updated_at=T0,
+    ).insert()
+
+
+async def test_authors_and_members_are_scoped_and_paged(channel):
+    for i in range(4):
+        await _user(i)
+    for i in range(3):
+        await ChannelMember(channel_id="c1", user_id=f"u{i}", created_at=T0).insert()
+    # u3 shares no channel with u1
+    await ChannelMember(channel_id="c2", user_id="u3", created_at=T0).insert()
+
+    pages = await _sync_all(limit=2)
+
+    authors = [a["id"] for page in pages for a in page["authors"]]
+    members = [u for page in pages for u in page["members"].get("c1", [])]
+    assert sorted(authors) == ["u0", "u1", "u2"]
+    assert sorted(members) == ["u0", "u1", "u2"]
+    assert "c2" not in {c for page in pages for c in page["members"]}
+
+
+async def test_posters_in_public_channels_come_with_their_messages(
+    channel, monkeypatch
+):
+    # u1 can read c3 but never joined it
+    public = Channel(id="c3", name="public", topic="", author_id="u9")
+    await public.insert()
+
+    async def get_user_channels(user_id, project=None):
+        return [channel, public]
+
+    monkeypatch.setattr(acl, "get_user_channels", get_user_channels)
+    for i in (4, 5):
+        await _user(i)
+    await ChannelMember(channel_id="c3", user_id="u5", created_at=T0).insert()
+    await Message(
+        id="m1", author_id="u4", channel_id="c3", content="hi", created_at=T0
+    ).insert()
+
+    pages = await _sync_all(limit=10)
+
+    # u5 is only a member of a channel u1 didn't join, so isn't sent
+    assert [a["id"] for page in pages for a in page["authors"]] == ["u4"]
@@ -18,6 +18,7 @@ import {
 import type { Event } from "@schemas/events/event";
 import { EventType } from "@schemas/events/eventtype";
 import { MessageType } from "@schemas/index";
+import { fetchChannels } from "./api";
 
 const GATEWAY_URL = import.meta.env.VITE_GATEWAY_URL;
 
@@ -244,6 +245,12 @@ function handleEvent(event: Event) {
       return startTyping(event.d.channel_id, event.d.user_id);
     case EventType.CHANNEL_DELETED:
       return removeChannel(event.d.channel_id);
+    case EventType.RESYNC_REQUIRED:
+      // we were gone longer than the gateway remembers, so refetch channels.
+      // fresh last_message_at values let the message lists notice their own gaps
+      return void fetchChannels().catch((err) =>
+        logFancy("error", "[gateway]", "resync failed", err)
+      );
     default: {
       if ((event as unknown as { t: string }).t === EventType.HEARTBEAT) {
         return;
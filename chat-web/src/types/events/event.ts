@@ -5,6 +5,7 @@ import type { ChannelUpdated } from "./channelupdated";
 import type { MessageCreated } from "./messagecreated";
 import type { MessageDeleted } from "./messagedeleted";
 import type { MessageUpdated } from "./messageupdated";
+import type { ResyncRequired } from "./resyncrequired";
 import type { TypingStarted } from "./typingstarted";
 
 export type Event =
@@ -15,5 +16,6 @@ export type Event =
   | { t: "MESSAGE_CREATED"; d: MessageCreated }
   | { t: "MESSAGE_DELETED"; d: MessageDeleted }
   | { t: "MESSAGE_UPDATED"; d: MessageUpdated }
+  | { t: "RESYNC_REQUIRED"; d: ResyncRequired }
   | { t: "TYPING_STARTED"; d: TypingStarted }
 ;
@@ -7,4 +7,5 @@ from .event_type import EventType
 from .message_created import MessageCreated
 from .message_deleted import MessageDeleted
 from .message_updated import MessageUpdated
+from .resync_required import ResyncRequired
 from .typing_started import TypingStarted
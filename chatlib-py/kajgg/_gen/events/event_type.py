@@ -11,3 +11,4 @@ class EventType(Enum):
     MESSAGE_DELETED = "MESSAGE_DELETED"
     TYPING_STARTED = "TYPING_STARTED"
     CHANNEL_DELETED = "CHANNEL_DELETED"
+    RESYNC_REQUIRED = "RESYNC_REQUIRED"
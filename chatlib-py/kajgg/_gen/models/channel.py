@@ -17,6 +17,8 @@ class Channel:
     updated_at: datetime | None = None
     # When the channel had its last message
     last_message_at: datetime | None = None
+    # Sequence number of the newest message in the channel
+    last_seq: int | None = None
     # ID of the user who created the channel
     author_id: str | None = None
     # Whether the channel is private
@@ -25,10 +25,14 @@ class Message:
     created_at: datetime | None = None
     # When the message was last updated
     updated_at: datetime | None = None
+    # When the message was deleted, only since_seq pages return deleted messages
+    deleted_at: datetime | None = None
     # ID of the user who sent the message
     author_id: str | None = None
     # ID of the channel this message belongs to
     channel_id: str | None = None
+    # Per-channel sequence number, increases by one per message
+    seq: int | None = None
     # Nonce for the message
     nonce: str | None = None
     author: Author | None = None
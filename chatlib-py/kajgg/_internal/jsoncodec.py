@@ -0,0 +1,85 @@
+"""
+one json codec for api responses, the event stream, the gateway and the clients.
+
+uses orjson when it's installed, then ujson (sanic already pulls it in), then the
+stdlib. every backend writes datetimes as iso strings ending in "Z" (naive ones are
+utc), enums as their values and dataclasses / pydantic models as objects, so nothing
+needs a conversion pass before it's dumped.
+
+kept identical in chat-api/modules, media-proxy and chatlib-py/kajgg/_internal.
+"""
+
+import json as _json
+from dataclasses import fields, is_dataclass
+from datetime import datetime
+from enum import Enum
+from typing import Any
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+def iso(value: datetime) -> str:
+    if value.tzinfo is None:
+        return value.isoformat() + "Z"
+    return value.isoformat().replace("+00:00", "Z")
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return iso(value)
+    if isinstance(value, Enum):
+        return value.value
+    if is_dataclass(value) and not isinstance(value, type):
+        return {f.name: getattr(value, f.name) for f in fields(value)}
+    if hasattr(value, "model_dump"):
+        return value.model_dump()
+    if isinstance(value, (set, frozenset, tuple)):
+        return list(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+if orjson is not None:
+    BACKEND = "orjson"
+    _OPTIONS = orjson.OPT_NAIVE_UTC | orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+
+    def dumpb(obj: Any) -> bytes:
+        return orjson.dumps(obj, default=_default, option=_OPTIONS)
+
+    def dumps(obj: Any) -> str:
+        return dumpb(obj).decode("utf-8")
+
+    loads = orjson.loads
+
+elif ujson is not None:
+    BACKEND = "ujson"
+
+    def dumps(obj: Any) -> str:
+        return ujson.dumps(
+            obj, default=_default, ensure_ascii=False, escape_forward_slashes=False
+        )
+
+    def dumpb(obj: Any) -> bytes:
+        return dumps(obj).encode("utf-8")
+
+    loads = ujson.loads
+
+else:
+    BACKEND = "json"
+
+    def dumps(obj: Any) -> str:
+        return _json.dumps(
+            obj, default=_default, separators=(",", ":"), ensure_ascii=False
+        )
+
+    def dumpb(obj: Any) -> bytes:
+        return dumps(obj).encode("utf-8")
+
+    loads = _json.loads
@@ -1,9 +1,14 @@
 from __future__ import annotations
 
+import asyncio
+from collections import OrderedDict
+from collections.abc import AsyncIterator
 from typing import Any
+from urllib.parse import urlencode
 
 import aiohttp
 
+from ._internal import jsoncodec
 from ._internal.convert import dataclass_from_dict
 from .models import Message, User
 
@@ -15,6 +20,10 @@ class ApiError(RuntimeError):
         self.message = message
 
 
+# the server's BATCH_MAX_REQUESTS
+BATCH_MAX_REQUESTS = 50
+
+
 class KajggClient:
     def __init__(
         self,
@@ -23,16 +32,38 @@ class KajggClient:
         gateway_url: str | None = None,
         token: str | None = None,
         timeout_s: float = 30.0,
+        etag_cache_size: int = 256,
+        batch_window_s: float | None = None,
     ):
         self.base_url = base_url.rstrip("/")
         self.gateway_url = (gateway_url or base_url).rstrip("/")
         self.token = token
+        # last body + etag of GETs, so refetching something unchanged is a bodyless
+        # 304. 0 turns it off
+        self.etag_cache_size = etag_cache_size
+        self._etags: OrderedDict[tuple, tuple[str, bytes]] = OrderedDict()
+        # authed GETs made within this long of each other go out together as one
+        # POST /v1/batch (think startup, channels + members + history of each). writes
+        # are never batched, they'd lose their order. None turns it off
+        self.batch_window_s = batch_window_s
+        self._batched: list[tuple[dict[str, Any], asyncio.Future]] = []
+        self._batch_flush: asyncio.Task | None = None
         timeout = aiohttp.ClientTimeout(total=timeout_s)
         self._session = aiohttp.ClientSession(
-            timeout=timeout, headers={"User-Agent": "kajgg-client/0.1.0"}
+            timeout=timeout,
+            headers={"User-Agent": "kajgg-client/0.1.0"},
+            json_serialize=jsoncodec.dumps,
         )
 
     async def aclose(self) -> None:
+        # GETs still waiting on the batch window won't go out, don't leave them hanging
+        if self._batch_flush is not None:
+            self._batch_flush.cancel()
+            self._batch_flush = None
+        batched, self._batched = self._batched, []
+        for _, result in batched:
+            if not result.done():
+                result.set_exception(RuntimeError("client closed"))
         await self._session.close()
 
     def _api_url(self, path: str, *, version: str = "v1") -> str:
@@ -52,6 +83,25 @@ class KajggClient:
         if auth and self.token:
             headers["Authorization"] = self.token
 
+        cache_key = cached = None
+        if method.upper() == "GET" and self.etag_cache_size > 0:
+            # responses are per user, so the token is part of what was asked for
+            cache_key = (
+                path,
+                tuple(sorted((params or {}).items())),
+                headers.get("Authorization"),
+            )
+            if (cached := self._etags.get(cache_key)) is not None:
+                headers["If-None-Match"] = cached[0]
+
+        if (
+            self.batch_window_s is not None
+            and method.upper() == "GET"
+            and "Authorization" in headers
+        ):
+            status, etag, body = await self._batch(path, params, headers)
+            return self._result(status, etag, body, cache_key, cached)
+
         async with self._session.request(
             method,
             self._api_url(path),
@@ -59,21 +109,130 @@ class KajggClient:
             params=params,
             headers=headers,
         ) as resp:
+            return self._result(
+                resp.status,
+                resp.headers.get("ETag"),
+                await resp.read(),
+                cache_key,
+                cached,
+            )
+
+    def _result(
+        self,
+        status: int,
+        etag: str | None,
+        body: bytes,
+        cache_key: tuple | None,
+        cached: tuple[str, bytes] | None,
+    ) -> Any:
+        if status == 304 and cached is not None:
+            self._etags.move_to_end(cache_key)
+            # decoded fresh every time, callers get their own copy
+            return jsoncodec.loads(cached[1])
+
+        try:
+            data = jsoncodec.loads(body) if body else None
+        except Exception:
+            data = None
+
+        if status < 200 or status >= 300:
+            msg = (data or {}).get("message") if isinstance(data, dict) else None
+            if not msg:
+                msg = body.decode("utf-8", "replace") or "request failed"
+            raise ApiError(status, str(msg))
+
+        if cache_key is not None and etag:
+            self._etags[cache_key] = (etag, body)
+            self._etags.move_to_end(cache_key)
+            while len(self._etags) > self.etag_cache_size:
+                self._etags.popitem(last=False)
+
+        return data
+
+    async def _batch(
+        self, path: str, params: dict[str, Any] | None, headers: dict[str, str]
+    ) -> tuple[int, str | None, bytes]:
+        call: dict[str, Any] = {"method": "GET", "path": f"/v1/{path.lstrip('/')}"}
+        if params:
+            call["path"] += "?" + urlencode(params, doseq=True)
+        if "If-None-Match" in headers:
+            call["headers"] = {"If-None-Match": headers["If-None-Match"]}
+
+        result = asyncio.get_running_loop().create_future()
+        self._batched.append((call, result))
+        if self._batch_flush is None:
+            self._batch_flush = asyncio.create_task(self._flush_batch())
+        return await result
+
+    async def _flush_batch(self) -> None:
+        await asyncio.sleep(self.batch_window_s)
+        batched, self._batched, self._batch_flush = self._batched, [], None
+
+        for start in range(0, len(batched), BATCH_MAX_REQUESTS):
+            chunk = batched[start : start + BATCH_MAX_REQUESTS]
             try:
-                data = await resp.json(content_type=None)
-            except Exception:
-                data = None
-
-            if resp.status < 200 or resp.status >= 300:
-                msg = (data or {}).get("message") if isinstance(data, dict) else None
-                if not msg:
-                    try:
-                        msg = await resp.text()
-                    except Exception:
-                        msg = "request failed"
-                raise ApiError(resp.status, str(msg))
-
-            return data
+                data = await self.request_json(
+                    "POST", "batch", json={"requests": [call for call, _ in chunk]}
+                )
+                responses = data["responses"]
+            except Exception as e:
+                for _, result in chunk:
+                    if not result.done():
+                        result.set_exception(e)
+                continue
+
+            for (_, result), response in zip(chunk, responses):
+                if result.done():
+                    continue
+                body = response.get("body")
+                result.set_result(
+                    (
+                        response["status"],
+                        (response.get("headers") or {}).get("etag"),
+                        b"" if body is None else jsoncodec.dumpb(body),
+                    )
+                )
+            # a short answer (a server that doesn't match this client) mustn't leave
+            # the rest waiting forever
+            for _, result in chunk[len(responses) :]:
+                if not result.done():
+                    result.set_exception(
+                        RuntimeError("batch response is missing this request")
+                    )
+
+    async def export_channel(
+        self,
+        channel_id: str,
+        *,
+        since: str | None = None,
+        until: str | None = None,
+        gzip: bool = False,
+        chunk_size: int = 64 * 1024,
+    ) -> AsyncIterator[bytes]:
+        """
+        a channel's messages as ndjson (gzipped with `gzip`), oldest first, yielded
+        as it arrives. `since` / `until` take iso dates or message ids
+        """
+        params = {"gzip": "true"} if gzip else {}
+        if since:
+            params["since"] = since
+        if until:
+            params["until"] = until
+        headers = {"Authorization": self.token} if self.token else {}
+
+        async with self._session.get(
+            self._api_url(f"channels/{channel_id}/export"),
+            params=params,
+            headers=headers,
+            # big channels take a while, only give up when it stops sending
+            timeout=aiohttp.ClientTimeout(
+                total=None, sock_read=self._session.timeout.total
+            ),
+        ) as resp:
+            if resp.status != 200:
+                self._result(resp.status, None, await resp.read(), None, None)
+            async for chunk in resp.content.iter_chunked(chunk_size):
+                yield chunk
 
     async def login(self, username: str, password: str) -> User:
         data = await self.request_json(
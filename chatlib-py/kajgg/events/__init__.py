@@ -14,6 +14,7 @@ from .._gen.events.channel_updated import ChannelUpdated as _ChannelUpdated
 from .._gen.events.message_created import MessageCreated as _MessageCreated
 from .._gen.events.message_deleted import MessageDeleted as _MessageDeleted
 from .._gen.events.message_updated import MessageUpdated as _MessageUpdated
+from .._gen.events.resync_required import ResyncRequired as _ResyncRequired
 from .._gen.events.typing_started import TypingStarted as _TypingStarted
 
 
@@ -67,6 +68,10 @@ class TypingStarted(_TypingStarted, _ContextMixin):
     pass
 
 
+class ResyncRequired(_ResyncRequired, _ContextMixin):
+    pass
+
+
 _EVENT_CLASS_BY_TYPE: dict[EventType, type] = {
     EventType.MESSAGE_CREATED: MessageCreated,
     EventType.MESSAGE_UPDATED: MessageUpdated,
@@ -76,6 +81,7 @@ _EVENT_CLASS_BY_TYPE: dict[EventType, type] = {
     EventType.CHANNEL_DELETED: ChannelDeleted,
     EventType.AUTHOR_UPDATED: AuthorUpdated,
     EventType.TYPING_STARTED: TypingStarted,
+    EventType.RESYNC_REQUIRED: ResyncRequired,
 }
 
 
@@ -95,6 +101,7 @@ __all__ = [
     "MessageCreated",
     "MessageDeleted",
     "MessageUpdated",
+    "ResyncRequired",
     "TypingStarted",
     "parse_event_data",
 ]
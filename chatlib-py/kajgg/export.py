@@ -0,0 +1,75 @@
+"""
+dump a channel's history to a file (or stdout) as ndjson, one message per line.
+
+    python -m kajgg.export <channel_id> [--since DATE|ID] [--until DATE|ID] [--gzip]
+        [-o FILE] [--base-url URL]
+
+the token comes from KAJGG_TOKEN.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import sys
+
+from .bot import BASE_URL
+from .client import KajggClient
+
+
+async def export(
+    client: KajggClient,
+    channel_id: str,
+    out,
+    *,
+    since: str | None = None,
+    until: str | None = None,
+    gzip: bool = False,
+) -> int:
+    written = 0
+    async for chunk in client.export_channel(
+        channel_id, since=since, until=until, gzip=gzip
+    ):
+        out.write(chunk)
+        written += len(chunk)
+    out.flush()
+    return written
+
+
+async def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m kajgg.export", description="export a channel as ndjson"
+    )
+    parser.add_argument("channel_id")
+    parser.add_argument("--since", help="iso date or message id, inclusive")
+    parser.add_argument("--until", help="iso date or message id, exclusive")
+    parser.add_argument("--gzip", action="store_true", help="write .ndjson.gz")
+    parser.add_argument("-o", "--output", help="file to write, stdout otherwise")
+    parser.add_argument("--base-url", default=os.getenv("KAJGG_BASE_URL", BASE_URL))
+    args = parser.parse_args(argv)
+
+    if not (token := os.getenv("KAJGG_TOKEN")):
+        parser.error("KAJGG_TOKEN isn't set")
+
+    client = KajggClient(base_url=args.base_url, token=token)
+    out = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        written = await export(
+            client,
+            args.channel_id,
+            out,
+            since=args.since,
+            until=args.until,
+            gzip=args.gzip,
+        )
+        # stdout might be the export itself
+        print(f"exported {args.channel_id} ({written} bytes)", file=sys.stderr)
+    finally:
+        if args.output:
+            out.close()
+        await client.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
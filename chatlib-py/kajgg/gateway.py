@@ -1,12 +1,12 @@
 from __future__ import annotations
 
 import asyncio
-import json
 import logging
 from typing import Any
 
 from yarl import URL
 
+from ._internal import jsoncodec
 from .client import KajggClient
 from .context import Context
 from .dispatcher import dispatch
@@ -87,7 +87,7 @@ class Gateway:
 
     async def _handle_frame(self, data_str: str) -> None:
         try:
-            payload = json.loads(data_str)
+            payload = jsoncodec.loads(data_str)
         except Exception as e:
             logging.warning("malformed sse frame: %s", e)
             return
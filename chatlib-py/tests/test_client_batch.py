@@ -0,0 +1,109 @@
+import asyncio
+
+import pytest
+from aiohttp import web
+
+from kajgg.client import ApiError, KajggClient
+
+
+@pytest.mark.asyncio
+async def test_gets_close_together_go_out_as_one_batch(run_server):
+    batches: list[list[dict]] = []
+
+    async def batch(request: web.Request):
+        assert request.headers["Authorization"] == "tok"
+        calls = (await request.json())["requests"]
+        batches.append(calls)
+
+        responses = []
+        for call in calls:
+            if call["path"] == "/v1/channels/missing":
+                body = {"status": 404, "message": "Channel not found"}
+                responses.append({"status": 404, "headers": {}, "body": body})
+            elif call.get("headers", {}).get("If-None-Match") == '"v1"':
+                responses.append({"status": 304, "headers": {"etag": '"v1"'}})
+            else:
+                body = {"path": call["path"]}
+                responses.append(
+                    {"status": 200, "headers": {"etag": '"v1"'}, "body": body}
+                )
+        return web.json_response({"responses": responses})
+
+    app = web.Application()
+    app.router.add_post("/api/v1/batch", batch)
+
+    base = await run_server(app)
+    client = KajggClient(
+        base_url=base, gateway_url=base, token="tok", batch_window_s=0.01
+    )
+    try:
+        channels, members, missing = await asyncio.gather(
+            client.request_json("GET", "channels"),
+            client.request_json("GET", "channels/c1/members", params={"limit": 5}),
+            client.request_json("GET", "channels/missing"),
+            return_exceptions=True,
+        )
+
+        assert len(batches) == 1
+        assert channels == {"path": "/v1/channels"}
+        assert members == {"path": "/v1/channels/c1/members?limit=5"}
+        assert isinstance(missing, ApiError) and missing.status == 404
+
+        # etags still apply to batched calls
+        assert await client.request_json("GET", "channels") == {"path": "/v1/channels"}
+        assert batches[1] == [
+            {
+                "method": "GET",
+                "path": "/v1/channels",
+                "headers": {"If-None-Match": '"v1"'},
+            }
+        ]
+    finally:
+        await client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_calls_missing_from_a_short_batch_response_fail(run_server):
+    async def batch(request: web.Request):
+        calls = (await request.json())["requests"]
+        # answers only the first one
+        body = {"path": calls[0]["path"]}
+        return web.json_response(
+            {"responses": [{"status": 200, "headers": {}, "body": body}]}
+        )
+
+    app = web.Application()
+    app.router.add_post("/api/v1/batch", batch)
+
+    base = await run_server(app)
+    client = KajggClient(
+        base_url=base, gateway_url=base, token="tok", batch_window_s=0.01
+    )
+    try:
+        first, second = await asyncio.wait_for(
+            asyncio.gather(
+                client.request_json("GET", "channels"),
+                client.request_json("GET", "emojis"),
+                return_exceptions=True,
+            ),
+            timeout=5,
+        )
+
+        assert first == {"path": "/v1/channels"}
+        assert isinstance(second, RuntimeError)
+    finally:
+        await client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_closing_fails_calls_waiting_on_the_window():
+    client = KajggClient(base_url="http://127.0.0.1:9", token="tok", batch_window_s=60)
+    waiting = asyncio.create_task(client.request_json("GET", "channels"))
+    await asyncio.sleep(0)
+    flush = client._batch_flush
+
+    await client.aclose()
+
+    with pytest.raises(RuntimeError, match="client closed"):
+        await asyncio.wait_for(waiting, timeout=5)
+    assert flush.cancelled()
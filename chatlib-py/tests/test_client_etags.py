@@ -0,0 +1,30 @@
+import pytest
+from aiohttp import web
+
+from kajgg.client import KajggClient
+
+
+@pytest.mark.asyncio
+async def test_unchanged_gets_are_revalidated_not_refetched(run_server):
+    seen: list[str | None] = []
+
+    async def channels(request: web.Request):
+        seen.append(request.headers.get("If-None-Match"))
+        if request.headers.get("If-None-Match") == '"v1"':
+            return web.Response(status=304, headers={"ETag": '"v1"'})
+        return web.json_response([{"id": "c1"}], headers={"ETag": '"v1"'})
+
+    app = web.Application()
+    app.router.add_get("/api/v1/channels", channels)
+
+    base = await run_server(app)
+    client = KajggClient(base_url=base, gateway_url=base, token="tok")
+    try:
+        first = await client.request_json("GET", "channels")
+        first.append({"id": "mutated"})
+        second = await client.request_json("GET", "channels")
+
+        assert seen == [None, '"v1"']
+        assert second == [{"id": "c1"}]
+    finally:
+        await client.aclose()
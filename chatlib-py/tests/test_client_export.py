@@ -0,0 +1,52 @@
+import gzip
+import io
+
+import pytest
+from aiohttp import web
+
+from kajgg.client import ApiError, KajggClient
+from kajgg.export import export
+
+
+@pytest.mark.asyncio
+async def test_export_streams_the_channel_to_a_file(run_server):
+    seen: list[dict] = []
+
+    async def channel_export(request: web.Request):
+        if request.match_info["channel_id"] == "private":
+            return web.json_response(
+                {"status": 403, "message": "You are not a member of this channel"},
+                status=403,
+            )
+
+        seen.append(dict(request.query))
+        resp = web.StreamResponse(headers={"Content-Type": "application/gzip"})
+        await resp.prepare(request)
+        for i in range(3):
+            await resp.write(gzip.compress(b'{"id":"%d"}\n' % i))
+        await resp.write_eof()
+        return resp
+
+    app = web.Application()
+    app.router.add_get("/api/v1/channels/{channel_id}/export", channel_export)
+
+    base = await run_server(app)
+    client = KajggClient(base_url=base, gateway_url=base, token="tok")
+    try:
+        out = io.BytesIO()
+        written = await export(client, "c1", out, since="2025-01-01", gzip=True)
+
+        assert seen == [{"gzip": "true", "since": "2025-01-01"}]
+        # concatenated gzip members are still one valid .gz
+        assert gzip.decompress(out.getvalue()).splitlines() == [
+            b'{"id":"0"}',
+            b'{"id":"1"}',
+            b'{"id":"2"}',
+        ]
+        assert written == len(out.getvalue())
+
+        with pytest.raises(ApiError) as denied:
+            await export(client, "private", io.BytesIO())
+        assert denied.value.status == 403
+    finally:
+        await client.aclose()
@@ -8,6 +8,7 @@ export const EventType = {
   MESSAGE_DELETED: "MESSAGE_DELETED",
   TYPING_STARTED: "TYPING_STARTED",
   CHANNEL_DELETED: "CHANNEL_DELETED",
+  RESYNC_REQUIRED: "RESYNC_REQUIRED",
 } as const;
 
 export type EventType = (typeof EventType)[keyof typeof EventType];
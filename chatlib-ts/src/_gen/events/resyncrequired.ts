@@ -0,0 +1,4 @@
+export type ResyncRequired = {
+    /** Timestamp of the oldest event the gateway can still replay */
+    oldest_event_ts: string;
+}
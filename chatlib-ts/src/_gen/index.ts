@@ -15,6 +15,7 @@ export type { Message } from "./models/message";
 export type { MessageCreated } from "./events/messagecreated";
 export type { MessageDeleted } from "./events/messagedeleted";
 export type { MessageUpdated } from "./events/messageupdated";
+export type { ResyncRequired } from "./events/resyncrequired";
 export type { TypingStarted } from "./events/typingstarted";
 export type { User } from "./models/user";
 export type { Webhook } from "./models/webhook";
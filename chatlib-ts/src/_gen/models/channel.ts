@@ -13,6 +13,8 @@ export type Channel = {
     updated_at: Date;
     /** When the channel had its last message */
     last_message_at?: Date;
+    /** Sequence number of the newest message in the channel */
+    last_seq?: number;
     /** ID of the user who created the channel */
     author_id: string;
     /** Whether the channel is private */
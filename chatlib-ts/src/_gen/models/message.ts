@@ -21,10 +21,14 @@ export type Message = {
     created_at: Date;
     /** When the message was last updated */
     updated_at?: Date;
+    /** When the message was deleted, only since_seq pages return deleted messages */
+    deleted_at?: Date;
     /** ID of the user who sent the message */
     author_id: string;
     /** ID of the channel this message belongs to */
     channel_id: string;
+    /** Per-channel sequence number, increases by one per message */
+    seq?: number;
     /** Nonce for the message */
     nonce?: string;
     author?: Author;
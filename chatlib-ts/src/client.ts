@@ -13,6 +13,7 @@ import type {
   ChannelDeleted,
   AuthorUpdated,
   TypingStarted,
+  ResyncRequired,
 } from "./types";
 
 type ReadyEvents = {
@@ -28,6 +29,7 @@ type KajEvents = ReadyEvents & {
   [EventType.CHANNEL_DELETED]: [ChannelDeleted];
   [EventType.AUTHOR_UPDATED]: [AuthorUpdated];
   [EventType.TYPING_STARTED]: [TypingStarted];
+  [EventType.RESYNC_REQUIRED]: [ResyncRequired];
 };
 
 export type ClientOptions = {
@@ -177,6 +179,7 @@ export class Client<
       case EventType.CHANNEL_DELETED:
       case EventType.AUTHOR_UPDATED:
       case EventType.TYPING_STARTED:
+      case EventType.RESYNC_REQUIRED:
         this.emit(evt.t as any, evt.d as any);
         return;
       default:
@@ -11,6 +11,7 @@ export const Events = {
 
   AuthorUpdated: "AUTHOR_UPDATED",
   TypingStarted: "TYPING_STARTED",
+  ResyncRequired: "RESYNC_REQUIRED",
 } as const;
 
 export type Events = (typeof Events)[keyof typeof Events];
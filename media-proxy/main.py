@@ -13,6 +13,8 @@ from sanic import Sanic
 from sanic.exceptions import BadRequest, Forbidden, ServiceUnavailable
 from sanic.response import ResponseStream, empty, json
 
+import jsoncodec
+
 load_dotenv()
 
 logging.basicConfig(level=logging.INFO, format="%(name)s - %(levelname)s - %(message)s")
@@ -121,7 +123,7 @@ def _filtered_response_headers(
     return out
 
 
-app = Sanic("media-proxy")
+app = Sanic("media-proxy", dumps=jsoncodec.dumps, loads=jsoncodec.loads)
 app.config.CORS_ORIGINS = "*"
 app.config.FALLBACK_ERROR_FORMAT = "json"
 